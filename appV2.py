@@ -1,9 +1,8 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-import random
+import session_memory
+from planning_core import capacity, simulation
+from planning_core.lazy import pd, px, go
 
 # Set the layout to wide
 st.set_page_config(layout="wide")
@@ -19,20 +18,17 @@ You can either upload a CSV file or manually input the data. The app will calcul
 in cases and minutes, and display the top 10 procedures in terms of demand.
 """)
 
-# Initialize session state for procedures if not already present
-if "procedures" not in st.session_state:
-    st.session_state.procedures = [
-        {"Procedure": "Procedure A", "Annual Demand (Cases)": 100, "Average Duration (Hours)": 2.0},
-    ]
+# Initialize session state for procedures if not already present, as a compact columnar table
+session_memory.procedure_table(default_records=[
+    {"Procedure": "Procedure A", "Annual Demand (Cases)": 100, "Average Duration (Hours)": 2.0},
+])
 
 # Function to add new procedure to the list
 def add_procedure():
     st.session_state.procedures.append(
-        {
-            "Procedure": st.session_state.procedure_name,
-            "Annual Demand (Cases)": st.session_state.procedure_demand,
-            "Average Duration (Hours)": st.session_state.procedure_duration,
-        }
+        st.session_state.procedure_name,
+        st.session_state.procedure_demand,
+        st.session_state.procedure_duration,
     )
 
 # Data Upload or Manual Entry
@@ -47,7 +43,7 @@ else:
     
     # Table-based data entry
     st.write("## Current Procedures")
-    procedure_df = pd.DataFrame(st.session_state.procedures)
+    procedure_df = st.session_state.procedures.to_frame()
     st.dataframe(procedure_df)
 
     # Form to add a new procedure
@@ -59,7 +55,7 @@ else:
         submitted = st.form_submit_button("Add Procedure", on_click=add_procedure)
 
     # Convert session state into DataFrame for calculations
-    df = pd.DataFrame(st.session_state.procedures)
+    df = st.session_state.procedures.to_frame()
 
 # Calculate total demand
 df['Total Demand (Minutes)'] = df['Annual Demand (Cases)'] * df['Average Duration (Hours)'] * 60
@@ -117,7 +113,7 @@ session_duration_hours = st.number_input("Session Duration (Hours)", min_value=0
 
 # Calculate total sessions and session minutes last year
 total_sessions_last_year = weeks_last_year * sessions_per_week_last_year
-session_minutes_last_year = total_sessions_last_year * session_duration_hours * 60 * utilisation_last_year
+session_minutes_last_year = capacity.session_minutes(weeks_last_year, sessions_per_week_last_year, session_duration_hours, utilisation_last_year)
 
 st.write(f"**Total Sessions Last Year:** {total_sessions_last_year}")
 st.write(f"**Total Session Minutes Last Year (after Utilisation):** {session_minutes_last_year:.2f}")
@@ -166,31 +162,20 @@ else:
 
 # Calculate total sessions and session minutes next year
 total_sessions_next_year = weeks_next_year * sessions_per_week_next_year
-session_minutes_next_year = total_sessions_next_year * session_duration_hours * 60 * utilisation_next_year
+session_minutes_next_year = capacity.session_minutes(weeks_next_year, sessions_per_week_next_year, session_duration_hours, utilisation_next_year)
 
 st.write(f"**Total Sessions Next Year:** {total_sessions_next_year}")
 st.write(f"**Total Session Minutes Next Year (after Utilisation):** {session_minutes_next_year:.2f}")
 
-# Function to simulate cases treated based on capacity
+# Function to simulate cases treated based on capacity, in a fresh random order each rerun
 def simulate_cases_treated(demand_df, total_capacity_minutes):
-    # Create a list of procedures proportional to their demand
-    case_list = []
-    for idx, row in demand_df.iterrows():
-        case_list.extend([row['Procedure']] * int(row['Next Year Demand (Cases)']))
-    # Shuffle the list
-    random.shuffle(case_list)
-    # Now accumulate durations until capacity is reached
-    cases_treated = []
-    total_minutes = 0
-    for procedure in case_list:
-        duration_minutes = demand_df.loc[demand_df['Procedure'] == procedure, 'Average Duration (Hours)'].values[0] * 60
-        if total_minutes + duration_minutes <= total_capacity_minutes:
-            total_minutes += duration_minutes
-            cases_treated.append({'Procedure': procedure, 'Duration (Minutes)': duration_minutes})
-        else:
-            break
-    # Convert to DataFrame
-    cases_treated_df = pd.DataFrame(cases_treated)
+    case_rows, durations_minutes, total_minutes = simulation.simulate_cases(
+        demand_df['Next Year Demand (Cases)'], demand_df['Average Duration (Hours)'], total_capacity_minutes
+    )
+    cases_treated_df = pd.DataFrame({
+        'Procedure': demand_df['Procedure'].to_numpy()[case_rows],
+        'Duration (Minutes)': durations_minutes,
+    })
     return cases_treated_df, total_minutes
 
 # Simulate cases treated last year
@@ -223,8 +208,9 @@ st.plotly_chart(fig_cases_comparison, use_container_width=True)
 # Given weeks next year and utilisation %, how many sessions required to get enough minutes for next year’s demand?
 required_capacity_minutes_next_year = next_year_total_demand_minutes
 
-required_total_sessions_next_year = required_capacity_minutes_next_year / (session_duration_hours * 60 * utilisation_next_year)
-required_sessions_per_week_next_year = required_total_sessions_next_year / weeks_next_year
+required_sessions_per_week_next_year = capacity.required_sessions_per_week(
+    required_capacity_minutes_next_year, weeks_next_year, session_duration_hours, utilisation_next_year
+)
 
 st.write(f"**Required Sessions per Week to Meet Next Year's Demand:** {required_sessions_per_week_next_year:.2f}")
 
@@ -259,10 +245,6 @@ waiting_list_target_weeks = st.number_input('Waiting List Target (Weeks Wait)',
 waiting_list_breaching_percentage = st.slider('% of Waiting List Breaching Target', min_value=0.0, max_value=1.0, value=0.20, step=0.01)
 waiting_list_addition = st.number_input('Number Added to Waiting List During the Year', min_value=0, value=300)
 
-# Calculate breaches
-breaches_start = waiting_list_start * waiting_list_breaching_percentage
-non_breaches_start = waiting_list_start - breaches_start + waiting_list_addition
-
 # Choose capacity for waiting list analysis
 st.write("## Select Capacity to Use")
 
@@ -292,20 +274,18 @@ breach_cases_percentage = st.slider('% of Cases Used to Treat Breaches', min_val
 # Average duration in minutes
 average_duration_minutes = (demand_df['Average Duration (Hours)'] * 60).mean()
 
-# Capacity minutes allocated
-capacity_minutes_for_breaches = total_capacity_minutes * breach_cases_percentage
-capacity_minutes_for_non_breaches = total_capacity_minutes * (1 - breach_cases_percentage)
-
-# Expected breaches treated
-expected_breaches_treated = min(breaches_start, capacity_minutes_for_breaches / average_duration_minutes)
-breaches_end = breaches_start - expected_breaches_treated
-
-# Expected non-breaches treated
-expected_non_breaches_treated = min(non_breaches_start, capacity_minutes_for_non_breaches / average_duration_minutes)
-non_breaches_end = non_breaches_start - expected_non_breaches_treated
-
-# Total waiting list at the end of the year
-waiting_list_end = breaches_end + non_breaches_end
+# Breaches and non-breaches (including additions) treated from their shares of capacity
+waiting_list_result = capacity.waiting_list_year(
+    waiting_list_start, waiting_list_breaching_percentage, waiting_list_addition,
+    total_capacity_minutes, breach_cases_percentage, average_duration_minutes
+)
+breaches_start = waiting_list_result['Breaches Start']
+expected_breaches_treated = waiting_list_result['Breaches Treated']
+breaches_end = waiting_list_result['Breaches End']
+non_breaches_start = waiting_list_result['Non-Breaches Start']
+expected_non_breaches_treated = waiting_list_result['Non-Breaches Treated']
+non_breaches_end = waiting_list_result['Non-Breaches End']
+waiting_list_end = waiting_list_result['Waiting List End']
 
 st.write(f"**Breaches at Start of Year:** {breaches_start}")
 st.write(f"**Expected Breaches Treated:** {expected_breaches_treated}")
@@ -1,9 +1,11 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
-import random
+import uuid
+import profiling
+import scenario_store
+import session_memory
+from planning_core import capacity, compact, forecast, groups, matching, packing, priority, projection, readers, replication, simulation, validation
+from planning_core.lazy import pd, px, go
 
 # Set the layout to wide
 st.set_page_config(
@@ -28,9 +30,30 @@ st.markdown("""
 # Sidebar option to show or hide data labels
 st.sidebar.header('Chart Options')
 show_data_labels = st.sidebar.checkbox('Show Data Labels', value=True)
+# A continuous colour scale built in the Colormap Explorer and exported as a NumPy LUT
+chart_lut_file = st.sidebar.file_uploader('Colour Scale (NumPy LUT from the Colormap Explorer)', type='npy')
+chart_colorscale = None
+if chart_lut_file is not None:
+    import colormap_builder
+
+    try:
+        chart_lut = np.load(chart_lut_file, allow_pickle=False)
+        if chart_lut.ndim != 2 or chart_lut.shape[1] < 3 or len(chart_lut) < 2:
+            raise ValueError(f"Expected an (n, 3) or (n, 4) LUT, got shape {chart_lut.shape}")
+        chart_colorscale = colormap_builder.lut_to_plotly_colorscale(chart_lut[:, :3])
+    except (ValueError, OSError, EOFError) as error:
+        st.sidebar.error(f"Could not read {chart_lut_file.name}: {error}")
+
+# Sidebar option to profile where rerun time is spent
+st.sidebar.header('Diagnostics')
+profile_enabled = st.sidebar.checkbox('Enable Profiling', value=profiling.default_enabled())
+trace_memory = st.sidebar.checkbox('Track Memory Deltas (slower)', value=False, disabled=not profile_enabled)
+profiler = profiling.start_run(profile_enabled, trace_memory)
 
 # ------------------------------ Section 1 – Procedure Demand ------------------------------
 
+profiler.checkpoint('Section 1 – Procedure Demand')
+
 st.title("Admitted Demand and Capacity")
 st.header("Section 1: Procedure Demand")
 
@@ -43,35 +66,190 @@ st.write("""
 The app will calculate the total demand in cases and minutes, and display the top 10 procedures in terms of demand.
 """)
 
-# Initialize session state for procedures if not already present
-if "procedures" not in st.session_state:
-    st.session_state.procedures = [
-        {"Procedure": "Procedure A", "Annual Demand (Cases)": 100, "Average Duration (Hours)": 2.0},
-    ]
+# Initialize session state for procedures if not already present, as a compact columnar table
+session_memory.procedure_table(default_records=[
+    {"Procedure": "Procedure A", "Annual Demand (Cases)": 100, "Average Duration (Hours)": 2.0},
+])
 
 # Function to add new procedure to the list
 def add_procedure():
     st.session_state.procedures.append(
-        {
-            "Procedure": st.session_state.procedure_name,
-            "Annual Demand (Cases)": st.session_state.procedure_demand,
-            "Average Duration (Hours)": st.session_state.procedure_duration,
-        }
+        st.session_state.procedure_name,
+        st.session_state.procedure_demand,
+        st.session_state.procedure_duration,
     )
 
+# Parse, validate and clean uploaded CSVs once per file content. In compact mode the compact table
+# is built here, so the float64 table is never cached or returned.
+@profiling.cached(max_entries=16)
+def load_procedure_file(content, compact_table=False):
+    df, issues, summary = validation.read_and_validate_procedures(content)
+    return (compact.compact_procedures(df) if compact_table else df), issues, summary
+
+# Names differ between sites and years ("Hip Replacement", "THR - hip", OPCS codes), so several
+# uploads, or one upload and a canonical list, are matched onto one set of names and merged
+@st.cache_resource(max_entries=4)
+def procedure_matcher(canonical_bytes, min_score):
+    return matching.ProcedureMatcher(matching.read_canonical_list(canonical_bytes), min_score=min_score)
+
+
+def combine_procedure_frames(frames, files, canonical_bytes, min_score, confirmed):
+    # files: (name, content) pairs. Without a canonical list the first file's names are canonical.
+    # confirmed: uploaded names whose Suggested match the planner has accepted.
+    matcher = procedure_matcher(canonical_bytes, min_score) if canonical_bytes else matching.ProcedureMatcher(frames[0]['Procedure'], min_score=min_score)
+    return matching.merge_uploads(frames, matcher, [name for name, _ in files], confirmed)
+
+
+@profiling.cached(max_entries=16)
+def merge_procedure_files(files, canonical_bytes, min_score, confirmed, compact_table=False):
+    frames = [load_procedure_file(content, compact_table)[0] for _, content in files]
+    df, name_mapping, summary = combine_procedure_frames(frames, files, canonical_bytes, min_score, confirmed)
+    return (compact.compact_procedures(df) if compact_table else df), name_mapping, summary
+
+
+def next_year_multipliers(procedures, multiplier, multiplier_table):
+    # One multiplier for every procedure, or per procedure from a forecast table (Procedure, Multiplier)
+    if multiplier_table is None:
+        return multiplier
+    return procedures.map(multiplier_table.set_index('Procedure')['Multiplier']).astype(float).fillna(multiplier)
+
+
+@profiling.cached(max_entries=4)
+def upload_precision_report(files, canonical_bytes, min_score, confirmed, multiplier, multiplier_table):
+    # Compact mode against full precision, on request: the uploads are read again at full precision
+    # here rather than a float64 copy being kept alongside the compact table
+    frames = [validation.read_and_validate_procedures(content)[0] for _, content in files]
+    if len(files) > 1 or canonical_bytes:
+        full_df = combine_procedure_frames(frames, files, canonical_bytes, min_score, confirmed)[0]
+    else:
+        full_df = frames[0]
+    return compact.precision_report(full_df, next_year_multipliers(full_df['Procedure'], multiplier, multiplier_table))
+
+
+def confirm_matches(names):
+    # Apply ticks in the suggested-match table (rows in the order of `names`) to the confirmed names
+    confirmed = set(st.session_state.get('confirmed_matches', ()))
+    for row, change in st.session_state.suggested_match_editor['edited_rows'].items():
+        if 'Merge' in change:
+            (confirmed.add if change['Merge'] else confirmed.discard)(names[int(row)])
+    st.session_state.confirmed_matches = tuple(sorted(confirmed))
+
+
 # Data Upload or Manual Entry
-uploaded_file = st.file_uploader("Upload Procedure Data", type='csv')
+uploaded_files = st.file_uploader("Upload Procedure Data", type='csv', accept_multiple_files=True)
+
+# Opt-in compact table for very large uploads: categorical names, int32 counts and float32 durations,
+# with the derived demand columns computed where they are used instead of stored
+compact_mode = st.checkbox(
+    "Compact Mode for Large Tables",
+    value=False,
+    help="Roughly halves memory or better for very large procedure files and speeds up totals. Durations are kept to about 7 significant digits."
+)
 
-if uploaded_file:
-    df = pd.read_csv(uploaded_file)
+if uploaded_files:
+    with st.expander("Procedure Name Matching", expanded=len(uploaded_files) > 1):
+        st.write(
+            "Several files are merged by matching their procedure names onto a canonical list: by OPCS code, "
+            "by name (ignoring case, punctuation and word order) or, failing those, by the most similar name. "
+            "The list is a CSV with a `Procedure` column and optional `Code` and `Aliases` (separated by `;`) columns. "
+            "Without one, the first file's names are used."
+        )
+        canonical_file = st.file_uploader("Canonical Procedure List (Optional)", type='csv')
+        min_match_score = st.slider("Minimum Name Similarity", min_value=0.3, max_value=1.0, value=0.6, step=0.05)
+
+    # The parsed upload is kept in session state, keyed by the files and matching settings, so a
+    # rerun reuses it (or loads it back from disk if the session went over its memory budget)
+    confirmed_matches = st.session_state.get('confirmed_matches', ())
+    upload_token = (tuple(file.file_id for file in uploaded_files), canonical_file.file_id if canonical_file else None,
+                    min_match_score, confirmed_matches, compact_mode)
+    df = session_memory.get_frame('uploaded_procedures', upload_token)
+    if df is not None:
+        upload_issues = session_memory.get_frame('upload_issues', upload_token)
+        name_mapping = session_memory.get_frame('procedure_name_mapping', upload_token)
+        upload_summary, match_summary = st.session_state.upload_summaries
+    else:
+        upload_issues, file_summaries = [], []
+        name_mapping = match_summary = None
+        try:
+            with profiler.stage('Parse and validate CSV'):
+                for file in uploaded_files:
+                    df, file_issues, upload_summary = load_procedure_file(file.getvalue(), compact_mode)
+                    upload_issues.append(file_issues.assign(File=file.name) if len(uploaded_files) > 1 else file_issues)
+                    file_summaries.append(upload_summary)
+            upload_issues = pd.concat(upload_issues, ignore_index=True)
+            if len(uploaded_files) > 1 or canonical_file:
+                with profiler.stage('Match and merge procedure names'):
+                    df, name_mapping, match_summary = merge_procedure_files(
+                        tuple((file.name, file.getvalue()) for file in uploaded_files),
+                        canonical_file.getvalue() if canonical_file else None, min_match_score, confirmed_matches, compact_mode,
+                    )
+                rows_read = sum(summary['Rows Read'] for summary in file_summaries)
+                rows_dropped = sum(summary['Rows Dropped'] for summary in file_summaries)
+                upload_summary = {'Rows Read': rows_read, 'Rows Dropped': rows_dropped,
+                                  'Duplicate Rows Merged': rows_read - rows_dropped - len(df), 'Procedures': len(df)}
+        except ValueError as error:
+            st.error(f"Could not read the procedure file: {error}")
+            st.stop()
+        session_memory.put_frame('upload_issues', upload_issues, upload_token)
+        session_memory.put_frame('procedure_name_mapping', name_mapping, upload_token)
+        st.session_state.upload_summaries = (upload_summary, match_summary)
+        session_memory.put_frame('uploaded_procedures', df, upload_token)
+    if df.empty:
+        st.error("The procedure file has no valid rows. Fix the rows listed below and upload it again.")
+        st.dataframe(upload_issues.head(1000), hide_index=True)
+        st.stop()
+
+    st.write(
+        f"Read {upload_summary['Rows Read']} rows: {upload_summary['Procedures']} procedures, "
+        f"{upload_summary['Duplicate Rows Merged']} duplicate rows merged, {upload_summary['Rows Dropped']} rows dropped."
+    )
+    if name_mapping is not None:
+        unmatched, suggested = match_summary['Unmatched'], match_summary['Suggested']
+        st.write(
+            f"Matched {len(name_mapping) - unmatched - suggested} of {len(name_mapping)} procedure names "
+            f"({', '.join(str(match_summary['Matched by ' + method]) + ' by ' + method.lower() for method in matching.MERGED_METHODS)}); "
+            f"{unmatched} kept as they are."
+        )
+        # Loose fuzzy matches are only suggestions: their demand stays separate until ticked here
+        candidates = name_mapping[name_mapping['Match'].isin(['Suggested', 'Confirmed'])].drop_duplicates('Procedure')
+        if len(candidates):
+            if suggested:
+                st.warning(
+                    f"Names only loosely similar (under {matching.CONFIRM_SCORE:.0%}) to a canonical procedure are kept as separate "
+                    f"procedures ({suggested} of them). Tick the ones that are the same procedure to merge them."
+                )
+            candidate_names = candidates['Procedure'].tolist()
+            with st.expander("Suggested name matches", expanded=bool(suggested)):
+                st.data_editor(
+                    pd.DataFrame({
+                        'Procedure': candidate_names,
+                        'Suggested Procedure': candidates['Canonical Procedure'].to_numpy(),
+                        'Score': candidates['Score'].to_numpy(),
+                        'Merge': (candidates['Match'] == 'Confirmed').to_numpy(),
+                    }),
+                    key='suggested_match_editor', on_change=confirm_matches, args=(candidate_names,),
+                    disabled=['Procedure', 'Suggested Procedure', 'Score'], hide_index=True,
+                    column_config={'Score': st.column_config.ProgressColumn('Score', min_value=0.0, max_value=1.0, format='%.2f')},
+                )
+        with st.expander("Name matches (suggested, unmatched and fuzzy first)"):
+            order = name_mapping['Match'].map({'Suggested': 0, 'Unmatched': 1, 'Fuzzy': 2, 'Cached': 2}).fillna(3)
+            st.dataframe(name_mapping.assign(_order=order).sort_values(['_order', 'Score'], kind='stable').drop(columns='_order').head(5000),
+                         hide_index=True, column_config={'Score': st.column_config.ProgressColumn('Score', min_value=0.0, max_value=1.0, format='%.2f')})
+            st.download_button("Download Name Matches", name_mapping.to_csv(index=False), file_name='procedure-name-matches.csv', mime='text/csv')
+    if len(upload_issues):
+        st.warning(f"{len(upload_issues)} problems found; rows with problems were left out.")
+        with st.expander("Row-level problems (first 1,000)"):
+            st.dataframe(upload_issues.head(1000), hide_index=True)
     st.write("Uploaded data preview:")
     st.dataframe(df)
 else:
+    for key in ('uploaded_procedures', 'upload_issues', 'procedure_name_mapping'):
+        session_memory.drop_frame(key)
     st.write("Or manually enter procedure data:")
     
     # Table-based data entry
     st.write("## Procedures Added to the Admitted Waiting List (Yearly):")
-    procedure_df = pd.DataFrame(st.session_state.procedures)
+    procedure_df = st.session_state.procedures.to_frame()
     st.dataframe(procedure_df)
     
     # Form to add a new procedure
@@ -83,59 +261,118 @@ else:
         submitted = st.form_submit_button("Add Procedure", on_click=add_procedure)
 
     # Convert session state into DataFrame for calculations
-    df = pd.DataFrame(st.session_state.procedures)
-
-# Calculate total demand
-df['Annual Demand (Minutes)'] = df['Annual Demand (Cases)'] * df['Average Duration (Hours)'] * 60
-total_demand_cases = df['Annual Demand (Cases)'].sum()
-total_demand_minutes = df['Annual Demand (Minutes)'].sum()
+    df = st.session_state.procedures.to_frame()
+    if compact_mode:
+        df = compact.compact_procedures(df)
+
+# Calculate total demand. The derived columns go on a shallow copy (no data is copied), so a
+# stored upload is left as it was read.
+if not compact_mode:
+    df = df.copy(deep=False)
+    df['Annual Demand (Minutes)'] = df['Annual Demand (Cases)'] * df['Average Duration (Hours)'] * 60
+annual_demand_minutes = compact.derived_column(df, 'Annual Demand (Minutes)')
+total_demand_cases = compact.column_total(df['Annual Demand (Cases)'])
+total_demand_minutes = compact.column_total(annual_demand_minutes)
 
 st.write(f"**Total Demand (Cases):** {total_demand_cases:.0f}")
 st.write(f"**Total Demand (Minutes):** {total_demand_minutes:.0f}")
 
 # Sort and select top 10 procedures by demand in cases
-top10_cases = df.sort_values(by='Annual Demand (Cases)', ascending=False).head(10)
+top10_cases = df.sort_values(by='Annual Demand (Cases)', ascending=False).head(10).astype({'Procedure': str})
 
 # Chart - Top 10 procedure demand in cases
-fig_top10_cases = px.bar(
-    top10_cases,
-    x='Procedure',
-    y='Annual Demand (Cases)',
-    title='Top 10 Procedures by Demand in Cases',
-    text='Annual Demand (Cases)' if show_data_labels else None
-)
-st.plotly_chart(fig_top10_cases, use_container_width=True)
+with profiler.stage('Figure: fig_top10_cases'):
+    fig_top10_cases = px.bar(
+        top10_cases,
+        x='Procedure',
+        y='Annual Demand (Cases)',
+        title='Top 10 Procedures by Demand in Cases',
+        text='Annual Demand (Cases)' if show_data_labels else None
+    )
+with profiler.stage('Render: fig_top10_cases'):
+    st.plotly_chart(fig_top10_cases, use_container_width=True)
 
 # Sort and select top 10 procedures by demand in minutes
-top10_minutes = df.sort_values(by='Annual Demand (Minutes)', ascending=False).head(10)
+top10_minutes = df.loc[annual_demand_minutes.sort_values(ascending=False).index[:10]].astype({'Procedure': str})
+top10_minutes['Annual Demand (Minutes)'] = annual_demand_minutes
 
 # Chart - Top 10 procedure demand in session minutes
-fig_top10_minutes = px.bar(
-    top10_minutes,
-    x='Procedure',
-    y='Annual Demand (Minutes)',
-    title='Top 10 Procedures by Demand in Session Minutes',
-    text='Annual Demand (Minutes)' if show_data_labels else None
-)
-st.plotly_chart(fig_top10_minutes, use_container_width=True)
+with profiler.stage('Figure: fig_top10_minutes'):
+    fig_top10_minutes = px.bar(
+        top10_minutes,
+        x='Procedure',
+        y='Annual Demand (Minutes)',
+        title='Top 10 Procedures by Demand in Session Minutes',
+        text='Annual Demand (Minutes)' if show_data_labels else None
+    )
+with profiler.stage('Render: fig_top10_minutes'):
+    st.plotly_chart(fig_top10_minutes, use_container_width=True)
 
 # Add multiplier variable for next year's demand
 st.write("## Next Year's Demand Adjustment")
 st.write("If demand is expected to increase for next year add a multiplier here:")
 multiplier = st.number_input("Multiplier for Next Year's Demand", min_value=0.0, value=1.0, step=0.1)
 
+# Per-procedure multipliers forecast from monthly activity history
+forecast_multipliers = profiling.cached(max_entries=16)(forecast.forecast_multipliers)
+
+st.write("Or upload monthly activity history (columns `Procedure`, `Month`, `Cases`) to forecast a multiplier for each procedure.")
+st.write(f"Procedures with less than a year of history have their recent months annualised; those with fewer than {forecast.MIN_HISTORY_MONTHS} months, or none, use the multiplier above.")
+history_file = st.file_uploader("Upload Monthly Activity History (Optional)", type='csv')
+multiplier_table = None
+
+if history_file:
+    forecast_method = st.radio("Forecasting Method", list(forecast.FORECAST_METHODS), horizontal=True)
+    try:
+        with profiler.stage('Forecast multipliers'):
+            forecast_df = forecast_multipliers(history_file.getvalue(), forecast_method)
+    except ValueError as error:
+        st.error(f"Could not read the activity history: {error}")
+    else:
+        st.dataframe(forecast_df.round(2), hide_index=True)
+        multiplier_table = forecast_df
+procedure_multipliers = next_year_multipliers(df['Procedure'], multiplier, multiplier_table)
+
 # Calculate next year's demand
-df['Next Year Demand (Cases)'] = df['Annual Demand (Cases)'] * multiplier
-df['Next Year Demand (Minutes)'] = df['Next Year Demand (Cases)'] * df['Average Duration (Hours)'] * 60
+if not compact_mode:
+    df['Next Year Demand (Cases)'] = df['Annual Demand (Cases)'] * procedure_multipliers
+    df['Next Year Demand (Minutes)'] = df['Next Year Demand (Cases)'] * df['Average Duration (Hours)'] * 60
+
+def demand_column(name):
+    # A derived demand column: stored in the default mode, computed on use in compact mode
+    return compact.derived_column(df, name, procedure_multipliers)
 
-next_year_total_demand_cases = df['Next Year Demand (Cases)'].sum()
-next_year_total_demand_minutes = df['Next Year Demand (Minutes)'].sum()
+next_year_total_demand_cases = compact.column_total(demand_column('Next Year Demand (Cases)'))
+next_year_total_demand_minutes = compact.column_total(demand_column('Next Year Demand (Minutes)'))
 
 st.write(f"**Next Year's Total Demand (Cases):** {next_year_total_demand_cases:.0f}")
 st.write(f"**Next Year's Total Demand (Minutes):** {next_year_total_demand_minutes:.0f}")
 
+# Compact mode against full float64 precision; on request, since it builds both tables
+if compact_mode and st.checkbox("Compare Compact Mode with Full Precision", value=False):
+    with profiler.stage('Compact precision report'):
+        if uploaded_files:
+            compact_accuracy, compact_memory = upload_precision_report(
+                tuple((file.name, file.getvalue()) for file in uploaded_files),
+                canonical_file.getvalue() if canonical_file else None, min_match_score, confirmed_matches, multiplier, multiplier_table,
+            )
+        else:
+            manual_df = st.session_state.procedures.to_frame()
+            compact_accuracy, compact_memory = compact.precision_report(
+                manual_df, next_year_multipliers(manual_df['Procedure'], multiplier, multiplier_table)
+            )
+    st.write(
+        f"**Memory:** {compact_memory['Compact (MB)']:.1f} MB compact vs {compact_memory['float64 (MB)']:.1f} MB "
+        f"at full precision with derived columns stored ({compact_memory['Saving (%)']:.0f}% less)."
+    )
+    st.dataframe(compact_accuracy, hide_index=True, column_config={
+        column: st.column_config.NumberColumn(format='%.2e') for column in ['Total Relative Difference', 'Largest Row Relative Difference']
+    })
+
 # ------------------------------ Section 2 – Sessions Last Year ------------------------------
 
+profiler.checkpoint('Section 2 – Sessions Last Year')
+
 st.header("Section 2: Sessions Last Year")
 
 st.write("""
@@ -154,7 +391,7 @@ session_duration_hours = st.number_input("Session Duration (Hours)", min_value=0
 
 # Calculate total sessions and session minutes last year
 total_sessions_last_year = weeks_last_year * sessions_per_week_last_year
-session_minutes_last_year = total_sessions_last_year * session_duration_hours * 60 * utilisation_last_year
+session_minutes_last_year = capacity.session_minutes(weeks_last_year, sessions_per_week_last_year, session_duration_hours, utilisation_last_year)
 
 st.write(f"**Total Sessions Last Year:** {total_sessions_last_year:.2f}")
 st.write(f"**Total Session Minutes Last Year (after Utilisation):** {session_minutes_last_year:.0f}")
@@ -165,17 +402,21 @@ demand_vs_capacity_last_year = pd.DataFrame({
     'Minutes': [total_demand_minutes, session_minutes_last_year]
 })
 
-fig_demand_vs_capacity_last_year = px.bar(
-    demand_vs_capacity_last_year,
-    x='Category',
-    y='Minutes',
-    title='Total Demand Minutes vs Total Session Minutes Last Year',
-    text='Minutes' if show_data_labels else None
-)
-st.plotly_chart(fig_demand_vs_capacity_last_year, use_container_width=True)
+with profiler.stage('Figure: fig_demand_vs_capacity_last_year'):
+    fig_demand_vs_capacity_last_year = px.bar(
+        demand_vs_capacity_last_year,
+        x='Category',
+        y='Minutes',
+        title='Total Demand Minutes vs Total Session Minutes Last Year',
+        text='Minutes' if show_data_labels else None
+    )
+with profiler.stage('Render: fig_demand_vs_capacity_last_year'):
+    st.plotly_chart(fig_demand_vs_capacity_last_year, use_container_width=True)
 
 # ------------------------------ Section 3 – Demand vs Capacity ------------------------------
 
+profiler.checkpoint('Section 3 – Demand vs Capacity')
+
 st.header("Section 3: Demand vs Capacity")
 
 st.write("""
@@ -214,50 +455,146 @@ else:
 
 # Calculate total sessions and session minutes next year
 total_sessions_next_year = weeks_next_year * sessions_per_week_next_year
-session_minutes_next_year = total_sessions_next_year * session_duration_hours * 60 * utilisation_next_year
+session_minutes_next_year = capacity.session_minutes(weeks_next_year, sessions_per_week_next_year, session_duration_hours, utilisation_next_year)
 
 st.write(f"**Total Sessions Next Year:** {total_sessions_next_year:.2f}")
 st.write(f"**Total Session Minutes Next Year (after Utilisation):** {session_minutes_next_year:.0f}")
 
-# Function to simulate cases treated based on capacity
-def simulate_cases_treated(demand_df, total_capacity_minutes):
-    # Create a list of procedures proportional to their demand
-    case_list = []
-    for idx, row in demand_df.iterrows():
-        num_cases = int(row['Next Year Demand (Cases)'])
-        case_list.extend([row['Procedure']] * num_cases)
-    # Shuffle the list
-    random.shuffle(case_list)
-    # Now accumulate durations until capacity is reached
-    cases_treated = []
-    total_minutes = 0
-    for procedure in case_list:
-        duration_minutes = demand_df.loc[demand_df['Procedure'] == procedure, 'Average Duration (Hours)'].values[0] * 60
-        if total_minutes + duration_minutes <= total_capacity_minutes:
-            total_minutes += duration_minutes
-            cases_treated.append({'Procedure': procedure, 'Duration (Minutes)': duration_minutes})
-        else:
-            break
-    # Convert to DataFrame
-    cases_treated_df = pd.DataFrame(cases_treated)
+# Random order for the simulated case mix; fixing it lets the simulation be cached and reused
+simulation_seed = st.number_input("Simulation Random Seed", min_value=0, value=0)
+
+# Function to simulate cases treated based on capacity, cached on the demand, capacity and seed
+@profiling.cached(max_entries=32)
+def simulate_cases_treated(demand_df, total_capacity_minutes, seed=0):
+    case_rows, durations_minutes, total_minutes = simulation.simulate_cases(
+        demand_df['Next Year Demand (Cases)'], demand_df['Average Duration (Hours)'], total_capacity_minutes, seed
+    )
+    cases_treated_df = pd.DataFrame({
+        'Procedure': demand_df['Procedure'].to_numpy()[case_rows],
+        'Duration (Minutes)': durations_minutes,
+    })
     return cases_treated_df, total_minutes
 
+SIMULATION_COLUMNS = ['Procedure', 'Average Duration (Hours)', 'Next Year Demand (Cases)']
+
 # Simulate cases treated last year
-cases_treated_last_year_df, total_minutes_treated_last_year = simulate_cases_treated(
-    df.assign(**{'Next Year Demand (Cases)': df['Annual Demand (Cases)']}), session_minutes_last_year
-)
+with profiler.stage('simulate_cases_treated: last year'):
+    cases_treated_last_year_df, total_minutes_treated_last_year = simulate_cases_treated(
+        df.assign(**{'Next Year Demand (Cases)': df['Annual Demand (Cases)']})[SIMULATION_COLUMNS], session_minutes_last_year, simulation_seed
+    )
 
 expected_cases_treated_last_year = len(cases_treated_last_year_df)
 st.write(f"**Expected Cases Treated Last Year (Simulated):** {expected_cases_treated_last_year:.0f}")
 st.write(f"**Total Minutes Treated Last Year (Simulated):** {total_minutes_treated_last_year:.0f}")
 
 # Simulate cases treated next year
-cases_treated_next_year_df, total_minutes_treated_next_year = simulate_cases_treated(df, session_minutes_next_year)
+with profiler.stage('simulate_cases_treated: next year'):
+    cases_treated_next_year_df, total_minutes_treated_next_year = simulate_cases_treated(
+        compact.with_derived(df, SIMULATION_COLUMNS, procedure_multipliers), session_minutes_next_year, simulation_seed
+    )
 
 expected_cases_treated_next_year = len(cases_treated_next_year_df)
 st.write(f"**Expected Cases Treated Next Year (Simulated):** {expected_cases_treated_next_year:.0f}")
 st.write(f"**Total Minutes Treated Next Year (Simulated):** {total_minutes_treated_next_year:.0f}")
 
+# Worker processes for replicated simulations, shared by every session on this server
+@st.cache_resource
+def simulation_pool():
+    return replication.default_executor()
+
+# Replications are written by the workers straight into shared memory; the cached result is read
+# in place on every rerun instead of being pickled back and copied per session. Only the
+# per-replication summaries are kept, so each cached entry is a few KB of /dev/shm.
+@st.cache_resource(max_entries=4)
+def simulate_replications(cases, duration_hours, total_capacity_minutes, replications, seed):
+    return replication.simulate_replications(
+        cases, duration_hours, total_capacity_minutes, replications, seed, executor=simulation_pool()
+    )
+
+simulation_replications = st.number_input(
+    "Simulation Replications",
+    min_value=1,
+    max_value=1000,
+    value=1,
+    help="Repeat next year's simulation with different random orders to see the spread of cases treated."
+)
+
+if simulation_replications > 1:
+    with profiler.stage('Replicated simulations'):
+        replicated = simulate_replications(
+            demand_column('Next Year Demand (Cases)').to_numpy(dtype=float),
+            df['Average Duration (Hours)'].to_numpy(dtype=float),
+            session_minutes_next_year,
+            simulation_replications,
+            simulation_seed
+        )
+    low_cases, median_cases, high_cases = np.percentile(replicated.cases_treated, [5, 50, 95])
+    st.write(f"**Expected Cases Treated Next Year over {simulation_replications} Replications:** {median_cases:.0f} (90% range {low_cases:.0f}–{high_cases:.0f})")
+
+    with profiler.stage('Figure: fig_replications'):
+        fig_replications = px.histogram(
+            x=replicated.cases_treated,
+            labels={'x': 'Cases Treated Next Year'},
+            title='Cases Treated Next Year across Replications'
+        )
+    with profiler.stage('Render: fig_replications'):
+        st.plotly_chart(fig_replications, use_container_width=True)
+
+# Session-level packing of next year's demand, cached on the demand, sessions, objective and seed
+compare_session_packing = profiling.cached(max_entries=16)(packing.compare_packing)
+
+st.write("## Session Packing")
+st.write("""
+The simulation treats cases in random order from one pool of minutes. Booking them into individual sessions shows
+what better list scheduling could deliver: in random order each session closes at the first case that doesn't fit,
+while optimised lists pack the same demand to treat the most cases or use the most session minutes.
+Optimising for cases favours the shortest procedures, so it shows the most cases better lists could treat rather than a
+fair case mix. The upper bound is what the total session minutes could hold if cases could be split across sessions.
+""")
+
+if st.checkbox("Optimise Session Lists", value=False):
+    packing_objective = st.radio("Optimise For", packing.PACKING_OBJECTIVES, horizontal=True, format_func=lambda objective: f"Most {objective}")
+    sessions_next_year = int(np.floor(total_sessions_next_year))
+    usable_session_minutes = session_duration_hours * 60 * utilisation_next_year
+    with profiler.stage('Session packing'):
+        packed = compare_session_packing(
+            demand_column('Next Year Demand (Cases)').to_numpy(dtype=float),
+            df['Average Duration (Hours)'].to_numpy(dtype=float),
+            sessions_next_year,
+            usable_session_minutes,
+            packing_objective,
+            simulation_seed
+        )
+
+    packing_df = pd.DataFrame({
+        'Schedule': ['Random Order', 'Optimised', 'Upper Bound'],
+        'Cases Treated': [packed['Random Order']['Cases Treated'], packed['Optimised']['Cases Treated'], packed['Cases Bound']],
+        'Minutes Treated': [packed['Random Order']['Minutes Treated'], packed['Optimised']['Minutes Treated'], packed['Minutes Bound']],
+        'Sessions Used': [packed['Random Order']['Sessions Used'], packed['Optimised']['Sessions Used'], sessions_next_year],
+    })
+    packing_df['Session Minutes Used (%)'] = 100 * packing_df['Minutes Treated'] / max(sessions_next_year * usable_session_minutes, 1)
+    st.dataframe(packing_df.round(1), hide_index=True)
+
+    random_cases = packed['Random Order']['Cases Treated']
+    st.write(
+        f"**Optimised Lists vs Random Order:** {packed['Cases Gap']:+,} cases "
+        f"({100 * packed['Cases Gap'] / max(random_cases, 1):+.1f}%) and {packed['Minutes Gap']:+,.0f} minutes "
+        f"across {sessions_next_year:,} sessions of {usable_session_minutes:.0f} usable minutes."
+    )
+    if packed['Cases Too Long for a Session']:
+        st.warning(f"{packed['Cases Too Long for a Session']:,} cases are longer than a session's usable minutes and can't be booked.")
+
+    with profiler.stage('Figure: fig_session_packing'):
+        fig_session_packing = px.bar(
+            packing_df,
+            x='Schedule',
+            y='Cases Treated',
+            title='Cases Treated Next Year by Session Schedule',
+            text='Cases Treated' if show_data_labels else None
+        )
+    with profiler.stage('Render: fig_session_packing'):
+        st.plotly_chart(fig_session_packing, use_container_width=True)
+
 # Chart - Expected cases last year vs actual cases last year (if input) vs expected cases next year
 cases_comparison_df = pd.DataFrame({
     'Category': ['Expected Cases Last Year (Simulated)', 'Actual Cases Last Year', 'Expected Cases Next Year (Simulated)'],
@@ -268,20 +605,23 @@ cases_comparison_df = pd.DataFrame({
 if actual_cases_treated_last_year == 0:
     cases_comparison_df = cases_comparison_df[cases_comparison_df['Category'] != 'Actual Cases Last Year']
 
-fig_cases_comparison = px.bar(
-    cases_comparison_df,
-    x='Category',
-    y='Cases',
-    title='Expected vs Actual Cases Treated',
-    text='Cases' if show_data_labels else None
-)
-st.plotly_chart(fig_cases_comparison, use_container_width=True)
+with profiler.stage('Figure: fig_cases_comparison'):
+    fig_cases_comparison = px.bar(
+        cases_comparison_df,
+        x='Category',
+        y='Cases',
+        title='Expected vs Actual Cases Treated',
+        text='Cases' if show_data_labels else None
+    )
+with profiler.stage('Render: fig_cases_comparison'):
+    st.plotly_chart(fig_cases_comparison, use_container_width=True)
 
 # Given weeks next year and utilisation %, how many sessions required to get enough minutes for next year’s demand?
 required_capacity_minutes_next_year = next_year_total_demand_minutes
 
-required_total_sessions_next_year = required_capacity_minutes_next_year / (session_duration_hours * 60 * utilisation_next_year)
-required_sessions_per_week_next_year = required_total_sessions_next_year / weeks_next_year
+required_sessions_per_week_next_year = capacity.required_sessions_per_week(
+    required_capacity_minutes_next_year, weeks_next_year, session_duration_hours, utilisation_next_year
+)
 
 st.write(f"**Required Sessions per Week to Meet Next Year's Demand:** {required_sessions_per_week_next_year:.2f}")
 
@@ -291,14 +631,16 @@ sessions_comparison_df = pd.DataFrame({
     'Sessions per Week': [sessions_per_week_next_year, required_sessions_per_week_next_year]
 })
 
-fig_sessions_comparison = px.bar(
-    sessions_comparison_df,
-    x='Category',
-    y='Sessions per Week',
-    title='Expected vs Required Sessions per Week Next Year',
-    text='Sessions per Week' if show_data_labels else None
-)
-st.plotly_chart(fig_sessions_comparison, use_container_width=True)
+with profiler.stage('Figure: fig_sessions_comparison'):
+    fig_sessions_comparison = px.bar(
+        sessions_comparison_df,
+        x='Category',
+        y='Sessions per Week',
+        title='Expected vs Required Sessions per Week Next Year',
+        text='Sessions per Week' if show_data_labels else None
+    )
+with profiler.stage('Render: fig_sessions_comparison'):
+    st.plotly_chart(fig_sessions_comparison, use_container_width=True)
 
 # Calculate percentage difference in sessions per week
 sessions_difference_percentage = ((sessions_per_week_next_year - required_sessions_per_week_next_year) / required_sessions_per_week_next_year) * 100
@@ -323,6 +665,8 @@ st.write(f"**Percentage Difference in Cases:** {cases_difference_percentage}%")
 
 # ------------------------------ Section 4 – Waiting List ------------------------------
 
+profiler.checkpoint('Section 4 – Waiting List')
+
 st.header("Section 4: Waiting List")
 
 st.write("""
@@ -338,9 +682,59 @@ year_selection = st.radio(
 # Input waiting list variables
 st.write("## Input Waiting List Variables")
 
-waiting_list_start = st.number_input('Waiting List at the Start of the Year', min_value=0, value=500)
+# Patient-level extracts are summarised in chunks and cached per file, census date and date format
+summarise_waiting_list = profiling.cached(max_entries=8)(readers.summarise_waiting_list)
+
+st.write("Upload a patient-level waiting list extract (columns `Referral Date`, `Procedure` and optionally `Priority`) to derive the waiting list and breaches, or enter them below.")
+waiting_list_file = st.file_uploader("Upload Patient-Level Waiting List (Optional)", type='csv')
+
 waiting_list_target_weeks = st.number_input('Waiting List Target (Weeks Wait)', min_value=0, value=18)
-waiting_list_breaching_percentage = st.slider('% of Waiting List Breaching Target', min_value=0.0, max_value=1.0, value=0.20, step=0.01)
+
+waiting_list_counts = None
+if waiting_list_file:
+    census_date = st.date_input('Waiting List Census Date', value=pd.Timestamp.today().date())
+    referral_date_format = st.selectbox('Referral Date Format', list(readers.REFERRAL_DATE_FORMATS))
+    try:
+        with profiler.stage('Summarise waiting list extract'):
+            waiting_list_counts, waiting_list_rows_skipped = summarise_waiting_list(
+                waiting_list_file.getvalue(), census_date, readers.REFERRAL_DATE_FORMATS[referral_date_format]
+            )
+    except ValueError as error:
+        st.error(f"Could not read the waiting list extract: {error}")
+
+if waiting_list_counts is not None:
+    breaching = waiting_list_counts['Weeks Waited'] >= waiting_list_target_weeks
+    waiting_list_start = int(waiting_list_counts['Patients'].sum())
+    waiting_list_breaching_percentage = waiting_list_counts.loc[breaching, 'Patients'].sum() / max(waiting_list_start, 1)
+
+    st.write(f"**Waiting List at the Start of the Year (from extract):** {waiting_list_start:.0f}")
+    st.write(f"**% of Waiting List Breaching Target (from extract):** {waiting_list_breaching_percentage:.1%}")
+    if waiting_list_rows_skipped:
+        st.warning(f"{waiting_list_rows_skipped} rows with a missing or unreadable referral date were skipped.")
+
+    procedure_backlog = waiting_list_counts.assign(
+        **{'Breaching Target': waiting_list_counts['Patients'].where(breaching, 0),
+           'Patient Weeks': waiting_list_counts['Patients'] * waiting_list_counts['Weeks Waited']}
+    ).groupby('Procedure')[['Patients', 'Breaching Target', 'Patient Weeks']].sum()
+    procedure_backlog['Mean Weeks Waited'] = procedure_backlog.pop('Patient Weeks') / procedure_backlog['Patients']
+    st.dataframe(procedure_backlog.sort_values('Patients', ascending=False).round(1))
+
+    with profiler.stage('Figure: fig_weeks_waited'):
+        weeks_waited_distribution = waiting_list_counts.groupby('Weeks Waited')['Patients'].sum().reset_index()
+        fig_weeks_waited = px.bar(
+            weeks_waited_distribution,
+            x='Weeks Waited',
+            y='Patients',
+            color='Weeks Waited' if chart_colorscale else None,
+            color_continuous_scale=chart_colorscale,
+            title=f'Weeks Waited Distribution (final bar is {readers.MAX_WEEKS_WAITED}+ weeks)'
+        )
+        fig_weeks_waited.add_vline(x=waiting_list_target_weeks - 0.5, line_dash='dash', annotation_text='Target')
+    with profiler.stage('Render: fig_weeks_waited'):
+        st.plotly_chart(fig_weeks_waited, use_container_width=True)
+else:
+    waiting_list_start = st.number_input('Waiting List at the Start of the Year', min_value=0, value=500)
+    waiting_list_breaching_percentage = st.slider('% of Waiting List Breaching Target', min_value=0.0, max_value=1.0, value=0.20, step=0.01)
 
 # Set default waiting list addition based on the selected year
 if year_selection == 'Next Year':
@@ -354,10 +748,6 @@ waiting_list_addition = st.number_input(
     value=int(default_waiting_list_addition)
 )
 
-# Calculate breaches
-breaches_start = waiting_list_start * waiting_list_breaching_percentage
-non_breaches_start = waiting_list_start - breaches_start + waiting_list_addition
-
 # Choose capacity for waiting list analysis
 st.write("## Select Capacity to Use")
 
@@ -376,7 +766,7 @@ else:
 # Demand for the selected year
 if year_selection == 'Next Year':
     demand_cases = next_year_total_demand_cases
-    demand_df = df.copy()
+    demand_df = df.assign(**{'Next Year Demand (Cases)': demand_column('Next Year Demand (Cases)')})
 else:
     demand_cases = total_demand_cases
     demand_df = df.assign(**{'Next Year Demand (Cases)': df['Annual Demand (Cases)']})
@@ -387,20 +777,18 @@ breach_cases_percentage = st.slider('% of Cases Used to Treat Breaches', min_val
 # Average duration in minutes
 average_duration_minutes = (demand_df['Average Duration (Hours)'] * 60).mean()
 
-# Capacity minutes allocated
-capacity_minutes_for_breaches = total_capacity_minutes * breach_cases_percentage
-capacity_minutes_for_non_breaches = total_capacity_minutes * (1 - breach_cases_percentage)
-
-# Expected breaches treated
-expected_breaches_treated = min(breaches_start, capacity_minutes_for_breaches / average_duration_minutes)
-breaches_end = breaches_start - expected_breaches_treated
-
-# Expected non-breaches treated
-expected_non_breaches_treated = min(non_breaches_start, capacity_minutes_for_non_breaches / average_duration_minutes)
-non_breaches_end = non_breaches_start - expected_non_breaches_treated
-
-# Total waiting list at the end of the year
-waiting_list_end = breaches_end + non_breaches_end
+# Breaches and non-breaches (including additions) treated from their shares of capacity
+waiting_list_result = capacity.waiting_list_year(
+    waiting_list_start, waiting_list_breaching_percentage, waiting_list_addition,
+    total_capacity_minutes, breach_cases_percentage, average_duration_minutes
+)
+breaches_start = waiting_list_result['Breaches Start']
+expected_breaches_treated = waiting_list_result['Breaches Treated']
+breaches_end = waiting_list_result['Breaches End']
+non_breaches_start = waiting_list_result['Non-Breaches Start']
+expected_non_breaches_treated = waiting_list_result['Non-Breaches Treated']
+non_breaches_end = waiting_list_result['Non-Breaches End']
+waiting_list_end = waiting_list_result['Waiting List End']
 
 st.write(f"**Breaches at Start of Year:** {breaches_start:.0f}")
 st.write(f"**Expected Breaches Treated:** {expected_breaches_treated:.0f}")
@@ -422,29 +810,110 @@ y = [waiting_list_start, waiting_list_addition, -expected_breaches_treated, -exp
 
 text = [f"{val:.0f}" for val in y] if show_data_labels else None
 
-waterfall_fig = go.Figure(go.Waterfall(
-    name = "Waiting List",
-    orientation = "v",
-    measure = measure,
-    x = x,
-    y = y,
-    textposition = "outside",
-    text = text,
-    connector = {"line":{"color":"rgb(63, 63, 63)"}},
-    decreasing={"marker":{"color":"green"}},
-    increasing={"marker":{"color":"red"}},
-    totals={"marker":{"color":"blue"}}
-))
+with profiler.stage('Figure: waterfall_fig'):
+    waterfall_fig = go.Figure(go.Waterfall(
+        name = "Waiting List",
+        orientation = "v",
+        measure = measure,
+        x = x,
+        y = y,
+        textposition = "outside",
+        text = text,
+        connector = {"line":{"color":"rgb(63, 63, 63)"}},
+        decreasing={"marker":{"color":"green"}},
+        increasing={"marker":{"color":"red"}},
+        totals={"marker":{"color":"blue"}}
+    ))
 
 waterfall_fig.update_layout(
     title = "Waiting List Dynamics Over the Year",
     showlegend = False
 )
 
-st.plotly_chart(waterfall_fig, use_container_width=True)
+with profiler.stage('Render: waterfall_fig'):
+    st.plotly_chart(waterfall_fig, use_container_width=True)
+
+# Clinical priority classes: a weekly queue model over classes × procedures × weeks waited
+st.write("## Clinical Priority Classes")
+
+PRIORITY_CLASSES = pd.DataFrame(priority.PRIORITY_CLASSES)
+simulate_priority_queue = profiling.cached(max_entries=32)(priority.simulate_priority_queue)
+
+model_priorities = st.checkbox("Model Clinical Priority Classes (P1–P4)")
+
+if model_priorities:
+    st.write("""
+    Each class has its own share of additions, waiting time target and share of capacity. Capacity is allocated
+    between classes by the chosen rule, and within each class the longest waiters are treated first.
+    """)
+    priority_classes = st.data_editor(PRIORITY_CLASSES, disabled=['Priority'], hide_index=True, key='priority_classes')
+    allocation_rule = st.radio("Capacity Allocation Rule", priority.ALLOCATION_RULES, horizontal=True)
+    priority_weeks = st.number_input("Weeks to Simulate", min_value=1, max_value=520, value=52)
+
+    class_shares = priority_classes['Share of Additions'].to_numpy(dtype=float)
+    class_shares = class_shares / class_shares.sum() if class_shares.sum() > 0 else np.full(len(class_shares), 1 / len(class_shares))
+    class_targets = priority_classes['Target (Weeks)'].to_numpy(dtype=int).clip(0)
+    class_capacity_shares = priority_classes['Capacity Share'].to_numpy(dtype=float)
+    n_age_bins = max(int(class_targets.max()) + 2, 3)
+
+    procedure_cases = demand_df['Next Year Demand (Cases)'].to_numpy(dtype=float)
+    procedure_shares = procedure_cases / procedure_cases.sum() if procedure_cases.sum() > 0 else np.full(len(procedure_cases), 1 / len(procedure_cases))
+    weekly_arrivals = class_shares[:, None] * procedure_shares[None, :] * waiting_list_addition / 52
+    if waiting_list_counts is not None:
+        initial_waiting = priority.waiting_list_tensor(waiting_list_counts, priority_classes['Priority'], demand_df['Procedure'], n_age_bins)
+        unmatched_patients = waiting_list_start - initial_waiting.sum()
+        if unmatched_patients > 0.5:
+            st.warning(f"{unmatched_patients:.0f} patients in the extract have a priority or procedure not in the model and are left out.")
+    else:
+        initial_waiting = priority.initial_priority_waiting_list(
+            waiting_list_start, waiting_list_breaching_percentage, class_shares, procedure_shares, class_targets, n_age_bins
+        )
+
+    with profiler.stage('Priority queue simulation'):
+        priority_waiting, priority_breaches, priority_treated, _ = simulate_priority_queue(
+            initial_waiting,
+            weekly_arrivals,
+            demand_df['Average Duration (Hours)'].to_numpy(dtype=float) * 60,
+            total_capacity_minutes / 52,
+            tuple(class_targets),
+            tuple(class_capacity_shares),
+            allocation_rule,
+            priority_weeks
+        )
+
+    priority_summary = pd.DataFrame({
+        'Priority': priority_classes['Priority'],
+        'Waiting List at Start': priority_waiting[0],
+        'Cases Treated': priority_treated,
+        'Waiting List at End': priority_waiting[-1],
+        'Breaching Target at End': priority_breaches[-1],
+    })
+    priority_summary['% Breaching at End'] = np.divide(
+        priority_summary['Breaching Target at End'], priority_summary['Waiting List at End'],
+        out=np.zeros(len(priority_summary)), where=priority_summary['Waiting List at End'] > 0
+    ) * 100
+    st.dataframe(priority_summary.round(1), hide_index=True)
+
+    with profiler.stage('Figure: fig_priority_waiting'):
+        priority_weekly = pd.concat([
+            pd.DataFrame({'Week': np.arange(priority_weeks + 1), 'Priority': priority_class, 'Waiting List': priority_waiting[:, i], 'Breaching Target': priority_breaches[:, i]})
+            for i, priority_class in enumerate(priority_classes['Priority'])
+        ])
+        fig_priority_waiting = px.line(
+            priority_weekly.melt(id_vars=['Week', 'Priority'], var_name='Measure', value_name='Cases'),
+            x='Week',
+            y='Cases',
+            color='Priority',
+            line_dash='Measure',
+            title='Waiting List and Breaches by Priority Class'
+        )
+    with profiler.stage('Render: fig_priority_waiting'):
+        st.plotly_chart(fig_priority_waiting, use_container_width=True)
 
 # ------------------------------ Section 5 – Results ------------------------------
 
+profiler.checkpoint('Section 5 – Results')
+
 st.header("Section 5: Results")
 
 st.write("""
@@ -470,3 +939,312 @@ st.write(f"**Sessions Required per Week to Meet Next Year's Demand Completely:**
 # Difference between sessions required, sessions last year and sessions planned for next year
 difference_sessions = required_sessions_per_week_next_year - sessions_per_week_next_year
 st.write(f"**Difference between Required and Planned Sessions per Week Next Year:** {difference_sessions:.2f}")
+
+# ------------------------------ Section 6 – Sites and Specialties ------------------------------
+
+profiler.checkpoint('Section 6 – Sites and Specialties')
+
+st.header("Section 6: Sites and Specialties")
+
+st.write("""
+If your procedure data includes `Site` and/or `Specialty` columns, this section calculates demand, capacity
+and the waiting list for every site and specialty in one pass, each with its own capacity inputs.
+Totals per site, per specialty and overall are rolled up from the same results.
+""")
+
+GROUP_COLUMNS = groups.GROUP_COLUMNS
+GROUP_SUM_COLUMNS = groups.GROUP_SUM_COLUMNS
+
+# One groupby pass over all procedures, cached on the procedures and the edited group inputs
+compute_group_aggregates = profiling.cached(max_entries=16)(groups.compute_group_aggregates)
+
+if not any(column in df.columns for column in GROUP_COLUMNS):
+    st.write("Upload procedure data with `Site` and/or `Specialty` columns to see the breakdown.")
+else:
+    grouped_df = compact.with_derived(df, ['Procedure', 'Annual Demand (Cases)', 'Next Year Demand (Cases)', 'Next Year Demand (Minutes)'], procedure_multipliers).assign(**{
+        column: (df[column] if isinstance(df[column].dtype, pd.CategoricalDtype) else df[column].astype(str)) if column in df.columns else 'All'
+        for column in GROUP_COLUMNS
+    })
+
+    # Default capacity per group: next year's inputs, with sessions and waiting list split by share of demand
+    group_demand = grouped_df.groupby(GROUP_COLUMNS, sort=True)[['Next Year Demand (Cases)', 'Next Year Demand (Minutes)']].sum()
+    minutes_share = group_demand['Next Year Demand (Minutes)'] / group_demand['Next Year Demand (Minutes)'].sum()
+    cases_share = group_demand['Next Year Demand (Cases)'] / group_demand['Next Year Demand (Cases)'].sum()
+    default_group_params = pd.DataFrame({
+        'Weeks per Year': weeks_next_year,
+        'Sessions per Week': (sessions_per_week_next_year * minutes_share.fillna(0)).round(1),
+        'Utilisation': utilisation_next_year,
+        'Waiting List Start': (waiting_list_start * cases_share.fillna(0)).round(),
+    }, index=group_demand.index).reset_index()
+
+    st.write("## Capacity by Site and Specialty")
+    st.write("Defaults split next year's sessions and the starting waiting list by each group's share of demand. Edit any row to override it.")
+    group_params = st.data_editor(default_group_params, disabled=GROUP_COLUMNS, hide_index=True, key='group_params')
+
+    group_results = compute_group_aggregates(grouped_df, group_params, session_duration_hours).astype({column: str for column in GROUP_COLUMNS})
+    group_levels = {
+        'Site × Specialty': group_results[GROUP_COLUMNS + GROUP_SUM_COLUMNS],
+        'Site': groups.roll_up_groups(group_results, ['Site']),
+        'Specialty': groups.roll_up_groups(group_results, ['Specialty']),
+        'Total': groups.roll_up_groups(group_results, []),
+    }
+
+    st.write("## Drill Down")
+    breakdown_level = st.radio("Breakdown Level", list(group_levels), horizontal=True)
+    level_df = group_levels[breakdown_level]
+
+    if breakdown_level == 'Site × Specialty':
+        site_filter = st.selectbox("Site", ['All Sites'] + sorted(level_df['Site'].unique()))
+        if site_filter != 'All Sites':
+            level_df = level_df[level_df['Site'] == site_filter]
+        level_labels = level_df['Site'] + ' / ' + level_df['Specialty']
+    elif breakdown_level == 'Total':
+        level_labels = pd.Series(['Total'], index=level_df.index)
+    else:
+        level_labels = level_df[breakdown_level]
+
+    st.dataframe(level_df, hide_index=True)
+
+    with profiler.stage('Figure: fig_group_demand_vs_capacity'):
+        fig_group_demand_vs_capacity = px.bar(
+            level_df.assign(Group=level_labels),
+            x='Group',
+            y=['Next Year Demand (Minutes)', 'Capacity (Minutes)'],
+            barmode='group',
+            title=f'Next Year Demand vs Capacity by {breakdown_level}',
+            text_auto='.0f' if show_data_labels else False
+        )
+    with profiler.stage('Render: fig_group_demand_vs_capacity'):
+        st.plotly_chart(fig_group_demand_vs_capacity, use_container_width=True)
+
+# ------------------------------ Section 7 – Multi-Year Projection ------------------------------
+
+profiler.checkpoint('Section 7 – Multi-Year Projection')
+
+st.header("Section 7: Multi-Year Projection")
+
+st.write("""
+In this section, you can project the waiting list over several years. Year 1 is next year as set up above;
+each later year compounds its demand growth and capacity change, and starts with the previous year's
+end-of-year waiting list. Capacity is shared across procedures in proportion to their waiting minutes.
+""")
+
+# One year of the projection. Each year's result is cached on the inputs up to and including that year,
+# so extending the horizon only computes the new years and editing year N leaves years before N cached.
+@profiling.cached(max_entries=512)
+def project_year(base_cases, case_minutes, waiting_list_start_cases, demand_factors, capacity_minutes):
+    if len(capacity_minutes) == 1:
+        start = waiting_list_start_cases
+    else:
+        start = project_year(base_cases, case_minutes, waiting_list_start_cases, demand_factors[:-1], capacity_minutes[:-1])['Waiting List End']
+    return projection.project_year_step(start, base_cases * demand_factors[-1], case_minutes, capacity_minutes[-1])
+
+projection_years = st.number_input("Projection Horizon (Years)", min_value=1, max_value=30, value=5)
+default_demand_growth = st.number_input("Annual Demand Growth (%)", value=3.0, step=0.5)
+default_capacity_change = st.number_input("Annual Capacity Change (%)", value=0.0, step=0.5)
+
+st.write("Adjust growth and capacity change for individual years below. Year 1 uses next year's demand and capacity.")
+projection_inputs = st.data_editor(
+    pd.DataFrame({
+        'Year': np.arange(1, projection_years + 1),
+        'Demand Growth (%)': np.r_[0.0, np.full(projection_years - 1, default_demand_growth)],
+        'Capacity Change (%)': np.r_[0.0, np.full(projection_years - 1, default_capacity_change)],
+    }),
+    disabled=['Year'],
+    hide_index=True,
+    key='projection_inputs'
+)
+
+# Compounding factors for every year in one vectorized pass; year 1 is fixed at next year's values
+growth_rates = projection_inputs['Demand Growth (%)'].to_numpy(dtype=float) / 100
+capacity_rates = projection_inputs['Capacity Change (%)'].to_numpy(dtype=float) / 100
+growth_rates[0] = capacity_rates[0] = 0.0
+demand_factors = np.cumprod(1 + growth_rates)
+capacity_by_year = session_minutes_next_year * np.cumprod(1 + capacity_rates)
+
+base_cases = demand_column('Next Year Demand (Cases)').to_numpy(dtype=float)
+case_minutes = df['Average Duration (Hours)'].to_numpy(dtype=float) * 60
+demand_share = df['Annual Demand (Cases)'].to_numpy(dtype=float) / max(total_demand_cases, 1)
+waiting_list_start_cases = waiting_list_start * demand_share
+if waiting_list_counts is not None:
+    # Use each procedure's actual backlog; patients on procedures not in the demand table are spread by demand share
+    extract_backlog = waiting_list_counts.groupby('Procedure')['Patients'].sum()
+    first_rows = ~df['Procedure'].duplicated().to_numpy()
+    waiting_list_start_cases = np.where(first_rows, df['Procedure'].map(extract_backlog).astype(float).fillna(0).to_numpy(dtype=float), 0.0)
+    waiting_list_start_cases += (waiting_list_start - waiting_list_start_cases.sum()) * demand_share
+
+with profiler.stage('Multi-year projection'):
+    projection_rows = []
+    for year in range(1, projection_years + 1):
+        year_result = project_year(
+            base_cases, case_minutes, waiting_list_start_cases,
+            tuple(demand_factors[:year]), tuple(capacity_by_year[:year])
+        )
+        projection_rows.append({
+            'Year': year,
+            'Demand (Cases)': year_result['Additions'].sum(),
+            'Demand (Minutes)': (year_result['Additions'] * case_minutes).sum(),
+            'Capacity (Minutes)': capacity_by_year[year - 1],
+            'Waiting List Start': year_result['Waiting List Start'].sum(),
+            'Expected Cases Treated': year_result['Treated'].sum(),
+            'Waiting List End': year_result['Waiting List End'].sum(),
+        })
+    projection_df = pd.DataFrame(projection_rows)
+
+st.dataframe(projection_df.round(0), hide_index=True)
+
+with profiler.stage('Figure: fig_projection'):
+    fig_projection = go.Figure()
+    fig_projection.add_trace(go.Bar(x=projection_df['Year'], y=projection_df['Demand (Minutes)'], name='Demand (Minutes)'))
+    fig_projection.add_trace(go.Bar(x=projection_df['Year'], y=projection_df['Capacity (Minutes)'], name='Capacity (Minutes)'))
+    fig_projection.add_trace(go.Scatter(
+        x=projection_df['Year'],
+        y=projection_df['Waiting List End'],
+        name='Waiting List at End of Year',
+        yaxis='y2',
+        mode='lines+markers+text' if show_data_labels else 'lines+markers',
+        text=[f"{val:.0f}" for val in projection_df['Waiting List End']],
+        textposition='top center'
+    ))
+    fig_projection.update_layout(
+        title='Demand, Capacity and Waiting List by Year',
+        barmode='group',
+        xaxis={'title': 'Year', 'dtick': 1},
+        yaxis={'title': 'Minutes'},
+        yaxis2={'title': 'Waiting List (Cases)', 'overlaying': 'y', 'side': 'right', 'rangemode': 'tozero'}
+    )
+with profiler.stage('Render: fig_projection'):
+    st.plotly_chart(fig_projection, use_container_width=True)
+
+# ------------------------------ Section 8 – Scenarios ------------------------------
+
+profiler.checkpoint('Section 8 – Scenarios')
+
+st.header("Section 8: Scenarios")
+
+st.write("""
+Save the current inputs and results as a named scenario, then compare any number of saved scenarios
+side by side. Comparisons use the stored results, so nothing is recalculated; calculation stages that
+a new scenario shares with earlier ones (simulation, projection, priority model) are reused from cache.
+""")
+
+CURRENT_SCENARIO = 'Current (unsaved)'
+
+scenario_parameters = {
+    'Multiplier for Next Year': multiplier,
+    'Activity History': history_file.name if history_file else None,
+    'Weeks per Year (Last Year)': weeks_last_year,
+    'Sessions per Week (Last Year)': sessions_per_week_last_year,
+    'Utilisation (Last Year)': utilisation_last_year,
+    'Session Duration (Hours)': session_duration_hours,
+    'Capacity Model': capacity_model,
+    'Weeks per Year (Next Year)': weeks_next_year,
+    'Sessions per Week (Next Year)': sessions_per_week_next_year,
+    'Utilisation (Next Year)': utilisation_next_year,
+    'Simulation Random Seed': simulation_seed,
+    'Waiting List Year': year_selection,
+    'Waiting List at Start': waiting_list_start,
+    'Waiting List Target (Weeks)': waiting_list_target_weeks,
+    '% Breaching Target': waiting_list_breaching_percentage,
+    'Additions to Waiting List': waiting_list_addition,
+    'Capacity for Waiting List': capacity_option,
+    '% of Cases Used to Treat Breaches': breach_cases_percentage,
+    'Projection Horizon (Years)': projection_years,
+    'Demand Growth by Year (%)': projection_inputs['Demand Growth (%)'].tolist(),
+    'Capacity Change by Year (%)': projection_inputs['Capacity Change (%)'].tolist(),
+    'Priority Classes Modelled': model_priorities,
+}
+scenario_results = {
+    'Next Year Demand (Cases)': next_year_total_demand_cases,
+    'Next Year Demand (Minutes)': next_year_total_demand_minutes,
+    'Expected Cases Treated Last Year': expected_cases_treated_last_year,
+    'Expected Cases Treated Next Year': expected_cases_treated_next_year,
+    'Expected Minutes Treated Next Year': total_minutes_treated_next_year,
+    'Required Sessions per Week': required_sessions_per_week_next_year,
+    'Planned Sessions per Week': sessions_per_week_next_year,
+    'Waiting List at End of Year': waiting_list_end,
+    'Breaches at End of Year': breaches_end,
+    'Waiting List at End of Projection': projection_df['Waiting List End'].iloc[-1],
+}
+if model_priorities:
+    scenario_parameters['Priority Allocation Rule'] = allocation_rule
+    scenario_parameters['Priority Model (Weeks)'] = priority_weeks
+    scenario_parameters['Priority Classes'] = priority_classes.to_dict('list')
+    for priority_class, breaching_end in zip(priority_classes['Priority'], priority_breaches[-1]):
+        scenario_results[f'{priority_class} Breaching at End of Priority Model'] = breaching_end
+
+# Saved scenarios live in a workspace. The default is private to this session; entering your own or
+# your team's name keeps them across sessions and shares them with whoever uses the same workspace.
+if 'scenario_session_workspace' not in st.session_state:
+    st.session_state.scenario_session_workspace = f"session-{uuid.uuid4().hex[:12]}"
+    st.session_state.scenario_workspace = st.session_state.scenario_session_workspace
+scenario_workspace = st.text_input("Scenario Workspace", key='scenario_workspace',
+                                   help="Scenarios are saved under this name. Use your name or your team's to find them again later.")
+scenario_directory = scenario_store.workspace_directory(scenario_workspace.strip() or st.session_state.scenario_session_workspace)
+if st.session_state.get('scenarios_loaded_from') != scenario_directory:
+    st.session_state.scenarios = scenario_store.load_scenarios(scenario_directory)
+    st.session_state.scenarios_loaded_from = scenario_directory
+
+current_fingerprint = scenario_store.data_fingerprint(df[['Procedure', 'Annual Demand (Cases)', 'Average Duration (Hours)']])
+current_scenario = scenario_store.make_scenario(CURRENT_SCENARIO, scenario_parameters, scenario_results, current_fingerprint)
+
+st.write("## Save Scenario")
+scenario_name = st.text_input("Scenario Name")
+replace_scenario = scenario_name in st.session_state.scenarios and st.checkbox(f"Replace the saved scenario '{scenario_name}'")
+if st.button("Save Scenario", disabled=not scenario_name or scenario_name == CURRENT_SCENARIO):
+    saved_scenario = {**current_scenario, 'name': scenario_name}
+    try:
+        scenario_store.save_scenario(saved_scenario, scenario_directory, overwrite=replace_scenario)
+    except ValueError as error:
+        # Saved from another session since this workspace was loaded; reload so it can be replaced
+        st.session_state.scenarios = scenario_store.load_scenarios(scenario_directory)
+        st.error(f"{error}. Choose another name, or tick the box to replace it.")
+    else:
+        st.session_state.scenarios[scenario_name] = saved_scenario
+        st.success(f"Saved scenario '{scenario_name}'.")
+
+st.write("## Compare Scenarios")
+compare_names = st.multiselect(
+    "Scenarios to Compare (the first is the baseline)",
+    [CURRENT_SCENARIO] + sorted(st.session_state.scenarios),
+    default=[CURRENT_SCENARIO]
+)
+if compare_names:
+    compared = [current_scenario if name == CURRENT_SCENARIO else st.session_state.scenarios[name] for name in compare_names]
+    if len({scenario['data'] for scenario in compared}) > 1:
+        st.warning("These scenarios were computed from different procedure data.")
+    comparison_df = scenario_store.compare_results(compared)
+    st.dataframe(comparison_df.round(2))
+
+    parameter_differences = scenario_store.compare_parameters(compared)
+    if len(compared) > 1:
+        st.write("**Inputs that differ:**")
+        st.dataframe(parameter_differences.astype(str))
+
+    comparison_metric = st.selectbox("Metric to Chart", list(comparison_df.index))
+    with profiler.stage('Figure: fig_scenario_comparison'):
+        fig_scenario_comparison = px.bar(
+            x=compare_names,
+            y=comparison_df.loc[comparison_metric, compare_names].to_numpy(),
+            labels={'x': 'Scenario', 'y': comparison_metric},
+            title=f'{comparison_metric} by Scenario',
+            text_auto='.1f' if show_data_labels else False
+        )
+    with profiler.stage('Render: fig_scenario_comparison'):
+        st.plotly_chart(fig_scenario_comparison, use_container_width=True)
+
+if st.session_state.scenarios:
+    st.write("## Delete Scenario")
+    scenario_to_delete = st.selectbox("Saved Scenario", sorted(st.session_state.scenarios))
+    if st.button("Delete Scenario"):
+        st.session_state.scenarios.pop(scenario_to_delete, None)
+        scenario_store.delete_scenario(scenario_to_delete, scenario_directory)
+        st.rerun()
+
+# Profiling panel goes last so it covers the whole rerun
+profiling.render_panel(profiler)
+
+# Keep this session within its memory budget, spilling the largest stored frames to disk if needed
+session_memory.enforce_budget()
+if profile_enabled:
+    session_memory.render_panel()
@@ -0,0 +1,241 @@
+import colorsys
+import io
+import os
+
+import numpy as np
+import matplotlib.colors as mcolors
+
+MAX_LUT_SIZE = 65536
+INTERPOLATION_SPACES = ['OKLab', 'CIELAB', 'sRGB']
+
+# OKLab matrices (Björn Ottosson): linear sRGB -> LMS, and cube-rooted LMS -> Lab
+_OKLAB_M1 = np.array([
+    [0.4122214708, 0.5363325363, 0.0514459929],
+    [0.2119034982, 0.6806995451, 0.1073969566],
+    [0.0883024619, 0.2817188376, 0.6299787005],
+])
+_OKLAB_M2 = np.array([
+    [0.2104542553, 0.7936177850, -0.0040720468],
+    [1.9779984951, -2.4285922050, 0.4505937099],
+    [0.0259040371, 0.7827717662, -0.8086757660],
+])
+_OKLAB_M1_INV = np.linalg.inv(_OKLAB_M1)
+_OKLAB_M2_INV = np.linalg.inv(_OKLAB_M2)
+
+# CIE XYZ with the D65 white point
+_XYZ_M = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_XYZ_M_INV = np.linalg.inv(_XYZ_M)
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+_LAB_DELTA = 6 / 29
+
+
+# All conversions take and return (..., 3) float arrays with sRGB in [0, 1]
+def srgb_to_linear(rgb):
+    rgb = np.asarray(rgb, dtype=np.float64)
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def linear_to_srgb(linear):
+    linear = np.clip(linear, 0.0, 1.0)
+    return np.where(linear <= 0.0031308, 12.92 * linear, 1.055 * linear ** (1 / 2.4) - 0.055)
+
+
+def rgb_to_oklab(rgb):
+    lms = srgb_to_linear(rgb) @ _OKLAB_M1.T
+    return np.cbrt(lms) @ _OKLAB_M2.T
+
+
+def oklab_to_rgb(lab):
+    lms = (np.asarray(lab) @ _OKLAB_M2_INV.T) ** 3
+    return linear_to_srgb(lms @ _OKLAB_M1_INV.T)
+
+
+def rgb_to_lab(rgb):
+    xyz = (srgb_to_linear(rgb) @ _XYZ_M.T) / _D65_WHITE
+    f = np.where(xyz > _LAB_DELTA ** 3, np.cbrt(xyz), xyz / (3 * _LAB_DELTA ** 2) + 4 / 29)
+    return np.stack([
+        116 * f[..., 1] - 16,
+        500 * (f[..., 0] - f[..., 1]),
+        200 * (f[..., 1] - f[..., 2]),
+    ], axis=-1)
+
+
+def lab_to_rgb(lab):
+    lab = np.asarray(lab, dtype=np.float64)
+    fy = (lab[..., 0] + 16) / 116
+    f = np.stack([fy + lab[..., 1] / 500, fy, fy - lab[..., 2] / 200], axis=-1)
+    xyz = np.where(f > _LAB_DELTA, f ** 3, 3 * _LAB_DELTA ** 2 * (f - 4 / 29)) * _D65_WHITE
+    return linear_to_srgb(xyz @ _XYZ_M_INV.T)
+
+
+_TO_SPACE = {'OKLab': rgb_to_oklab, 'CIELAB': rgb_to_lab, 'sRGB': lambda rgb: np.asarray(rgb, dtype=np.float64)}
+_FROM_SPACE = {'OKLab': oklab_to_rgb, 'CIELAB': lab_to_rgb, 'sRGB': lambda rgb: np.clip(rgb, 0.0, 1.0)}
+
+
+def build_lut(stop_colors, n=256, space='OKLab', positions=None):
+    # Interpolate any number of colour stops into an (n, 3) float32 sRGB LUT
+    if space not in _TO_SPACE:
+        raise ValueError(f"Unknown interpolation space: {space}")
+    if len(stop_colors) < 2:
+        raise ValueError("A continuous colormap needs at least two colour stops")
+    n = int(min(max(n, 2), MAX_LUT_SIZE))
+    if positions is None:
+        positions = np.linspace(0.0, 1.0, len(stop_colors))
+    stops = _TO_SPACE[space](mcolors.to_rgba_array(list(stop_colors))[:, :3])
+    x = np.linspace(0.0, 1.0, n)
+    interpolated = np.stack([np.interp(x, positions, stops[:, channel]) for channel in range(3)], axis=-1)
+    return _FROM_SPACE[space](interpolated).astype(np.float32)
+
+
+def downsample_lut(lut, n):
+    # Evenly spaced samples including both ends, for previews and small palettes
+    n = int(min(max(n, 1), len(lut)))
+    indices = np.linspace(0, len(lut) - 1, n).round().astype(np.intp)
+    return lut[indices]
+
+
+def lut_to_hex(lut):
+    rgb = np.round(np.clip(lut[:, :3], 0.0, 1.0) * 255).astype(np.uint8)
+    return [f"#{r:02x}{g:02x}{b:02x}" for r, g, b in rgb.tolist()]
+
+
+def make_colormap(name, lut):
+    # A ListedColormap over the full LUT, passed to plots as cmap=... directly. It is not registered
+    # with matplotlib: the registry is shared by every session in the process.
+    if not name:
+        raise ValueError("The colormap needs a name")
+    return mcolors.ListedColormap(np.asarray(lut)[:, :3], name=name)
+
+
+def lut_to_plotly_colorscale(lut, n=256):
+    # Plotly charts (as used by the planning apps) take a list of [position, colour] pairs
+    samples = downsample_lut(np.asarray(lut), n)
+    positions = np.linspace(0.0, 1.0, len(samples)) if len(samples) > 1 else np.zeros(1)
+    return [[float(pos), color] for pos, color in zip(positions, lut_to_hex(samples))]
+
+
+def adjust_lut(lut, brightness=0.0, saturation=0.0):
+    # The palette's brightness and saturation adjustment (HLS lightness and saturation offsets) on
+    # every entry of a LUT, so an exported LUT matches the adjusted swatches
+    lut = np.asarray(lut)
+    if not brightness and not saturation:
+        return lut
+    hls = np.array([colorsys.rgb_to_hls(*rgb) for rgb in lut[:, :3].tolist()])
+    hls[:, 1] = np.clip(hls[:, 1] + brightness, 0.0, 1.0)
+    hls[:, 2] = np.clip(hls[:, 2] + saturation, 0.0, 1.0)
+    return np.array([colorsys.hls_to_rgb(*entry) for entry in hls.tolist()], dtype=lut.dtype)
+
+
+# Recolouring data through a palette: the data is quantised once to uint8 indices, and each
+# palette or colour-blindness variant is a 256-entry LUT, so recolouring is a single table lookup
+# per pixel however the palette changes.
+CVD_SIMULATIONS = ['Protanopia', 'Deuteranopia', 'Tritanopia', 'Achromatopsia']
+DATA_FILE_TYPES = ['csv', 'npy', 'png', 'jpg', 'jpeg', 'tif', 'tiff']
+_LOOKUP_BLOCK_ROWS = 32  # keeps the intp index temporary in cache rather than one full-size copy
+
+
+def simulate_cvd(rgb, kind):
+    # The app's colour-blindness approximations on an (..., 3) sRGB array
+    rgb = np.array(rgb, dtype=np.float64)
+    if kind in ('Protanopia', 'Deuteranopia'):
+        rgb[..., :2] *= 0.5
+    elif kind == 'Tritanopia':
+        rgb[..., 2] *= 0.5
+    elif kind == 'Achromatopsia':
+        lightness = (rgb.max(axis=-1) + rgb.min(axis=-1)) / 2
+        rgb = np.repeat(lightness[..., None], 3, axis=-1)
+    return rgb
+
+
+def palette_lut8(colors, interpolate=False, space='OKLab'):
+    # (256, 4) uint8 RGBA lookup table. Discrete palettes split the range into equal bins like a
+    # ListedColormap; interpolated ones blend neighbouring colours in `space`.
+    if interpolate and len(colors) > 1:
+        rgb = build_lut(colors, 256, space)
+    else:
+        rgb = mcolors.to_rgba_array(list(colors))[:, :3][np.arange(256) * len(colors) // 256]
+    lut = np.full((256, 4), 255, dtype=np.uint8)
+    lut[:, :3] = np.round(np.clip(rgb, 0.0, 1.0) * 255)
+    return lut
+
+
+def read_data_array(file_bytes, file_name):
+    # A 2-D array from a headerless numeric CSV, a .npy file or an image (converted to grayscale)
+    extension = os.path.splitext(file_name)[1].lower().lstrip('.')
+    if extension == 'csv':
+        import pandas as pd
+
+        data = pd.read_csv(io.BytesIO(file_bytes), header=None, dtype=np.float64).to_numpy()
+    elif extension == 'npy':
+        data = np.load(io.BytesIO(file_bytes), allow_pickle=False)
+    elif extension in DATA_FILE_TYPES:
+        from PIL import Image
+
+        with Image.open(io.BytesIO(file_bytes)) as image:
+            data = np.asarray(image if image.mode in ('L', 'I', 'I;16', 'F') else image.convert('L'))
+    else:
+        raise ValueError(f"Unsupported file type: .{extension}")
+    if data.ndim != 2 or not data.size:
+        raise ValueError(f"Expected a non-empty 2-D array, got shape {data.shape}")
+    if not (np.issubdtype(data.dtype, np.number) or data.dtype == bool) or np.iscomplexobj(data):
+        raise ValueError(f"Expected real numbers, got {data.dtype}")
+    return data
+
+
+def quantize_uint8(data):
+    # uint8 indices scaled linearly from the data's finite min to max; uint8 data (8-bit images) is
+    # used as is. Returns (indices, missing mask or None, (low, high)).
+    if data.dtype == np.uint8:
+        return data, None, (0, 255)
+    data = np.asarray(data)
+    finite = np.isfinite(data) if np.issubdtype(data.dtype, np.floating) else None
+    missing = ~finite if finite is not None and not finite.all() else None
+    values = data[finite] if missing is not None else data
+    if not values.size:
+        return np.zeros(data.shape, dtype=np.uint8), missing, (0.0, 0.0)
+    low, high = float(values.min()), float(values.max())
+    scale = 255.999 / (high - low) if high > low else 0.0
+    indices = np.empty(data.shape, dtype=np.uint8)
+    scaled = np.empty((_LOOKUP_BLOCK_ROWS * 8,) + data.shape[1:], dtype=np.float32)
+    with np.errstate(invalid='ignore'):  # NaNs cast to garbage here and are masked afterwards
+        for start in range(0, data.shape[0], len(scaled)):
+            block = data[start:start + len(scaled)]
+            out = scaled[:len(block)]
+            np.subtract(block, low, out=out, casting='unsafe')
+            out *= scale
+            np.clip(out, 0, 255, out=out)
+            indices[start:start + len(block)] = out
+    if missing is not None:
+        indices[missing] = 0
+    return indices, missing, (low, high)
+
+
+def apply_lut8(indices, lut, missing=None, missing_color=(128, 128, 128, 0)):
+    # (H, W, 4) uint8 RGBA image of `indices` through a (256, 4) uint8 LUT. The LUT is viewed as
+    # packed uint32 so each pixel is one 4-byte lookup, done in row blocks.
+    packed = np.ascontiguousarray(lut, dtype=np.uint8).view(np.uint32).ravel()
+    out = np.empty(indices.shape, dtype=np.uint32)
+    for start in range(0, indices.shape[0], _LOOKUP_BLOCK_ROWS):
+        np.take(packed, indices[start:start + _LOOKUP_BLOCK_ROWS], out=out[start:start + _LOOKUP_BLOCK_ROWS])
+    if missing is not None:
+        out[missing] = np.array(missing_color, dtype=np.uint8).view(np.uint32)[0]
+    return out.view(np.uint8).reshape(indices.shape + (4,))
+
+
+def preview_indices(indices, missing=None, max_side=1024):
+    # Every step-th row and column, so the preview's longest side is at most max_side pixels.
+    # Returns (indices, missing, step).
+    step = max(1, -(-max(indices.shape) // max_side))
+    return indices[::step, ::step], (missing[::step, ::step] if missing is not None else None), step
+
+
+def image_to_png(rgba):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.fromarray(rgba, 'RGBA').save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
@@ -0,0 +1,194 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import matplotlib
+import matplotlib.colors as mcolors
+
+import colormap_builder
+
+# Perceptual properties of every registered matplotlib colormap, computed once and kept in a small
+# .npz file so the explorer can filter and rank all of them at startup without sampling any:
+#
+#   Lightness Monotonicity  |L*(end) - L*(start)| / total |ΔL*| along the map; 1 for sequential maps
+#   Uniformity              1 - coefficient of variation of the CIELAB ΔE across 32 equal segments
+#   CVD Safety              worst ratio, over protan-, deuter- and tritanopia, of the map's perceptual
+#                           length (summed ΔE) when simulated to its length in normal vision
+#   Hue Range (°)           span of the unwrapped OKLab hue over the map's chromatic samples
+#
+# The file name includes the matplotlib version and INDEX_VERSION, so an upgrade or a change to the
+# scores builds a fresh index rather than reading a stale one.
+#
+#   python colormap_index.py            print the index, building it if needed
+#   python colormap_index.py --rebuild  rebuild it, e.g. when deploying
+
+INDEX_VERSION = 1
+INDEX_DIR_ENV_VAR = 'COLORMAP_INDEX_DIR'
+DEFAULT_INDEX_DIR = '.colormap-index'
+SAMPLES = 256
+UNIFORMITY_SEGMENTS = 32  # coarser than SAMPLES, so rounding in listed maps doesn't read as unevenness
+THUMBNAIL_SAMPLES = 64
+METRICS = ['Lightness Monotonicity', 'Uniformity', 'CVD Safety', 'Hue Range (°)',
+           'Lightness Start', 'Lightness End', 'Perceptual Length']
+KINDS = ['Sequential', 'Diverging', 'Cyclic', 'Qualitative', 'Other']
+
+# Machado, Oliveira & Fernandes (2009) simulation matrices at full severity, on linear sRGB. More
+# faithful than the explorer's display approximation (colormap_builder.simulate_cvd), which only
+# scales channels and so would rate almost every map as safe.
+_CVD_MATRICES = {
+    'Protanopia': np.array([[0.152286, 1.052583, -0.204868], [0.114503, 0.786281, 0.099216], [-0.003882, -0.048116, 1.051998]]),
+    'Deuteranopia': np.array([[0.367322, 0.860646, -0.227968], [0.280085, 0.672501, 0.047413], [-0.011820, 0.042940, 0.968881]]),
+    'Tritanopia': np.array([[1.255528, -0.076749, -0.178779], [-0.078411, 0.930809, 0.147602], [0.004733, 0.691367, 0.303900]]),
+}
+_CHROMATIC = 0.03  # OKLab chroma below which a sample counts as grey and has no meaningful hue
+
+
+def index_directory():
+    return os.environ.get(INDEX_DIR_ENV_VAR, DEFAULT_INDEX_DIR)
+
+
+def index_path():
+    return os.path.join(index_directory(), f"colormaps-v{INDEX_VERSION}-mpl{matplotlib.__version__}.npz")
+
+
+def _samples(cmap):
+    # Listed maps with few colours are sampled at their own colours, so steps between them are real
+    n = cmap.N if isinstance(cmap, mcolors.ListedColormap) and cmap.N < SAMPLES else SAMPLES
+    return cmap(np.linspace(0.0, 1.0, n))[:, :3]
+
+
+def _path_length(lab):
+    return float(np.linalg.norm(np.diff(lab, axis=0), axis=1).sum())
+
+
+def colormap_metrics(cmap):
+    # (kind, metrics in METRICS order) for one colormap
+    rgb = _samples(cmap)
+    lab = colormap_builder.rgb_to_lab(rgb)
+    lightness = lab[:, 0]
+    steps = np.linalg.norm(np.diff(lab, axis=0), axis=1)
+    total_lightness_change = np.abs(np.diff(lightness)).sum()
+    monotonicity = abs(lightness[-1] - lightness[0]) / total_lightness_change if total_lightness_change > 1e-6 else 0.0
+    segments = np.add.reduceat(steps, np.linspace(0, len(steps), min(UNIFORMITY_SEGMENTS, len(steps)), endpoint=False).astype(int))
+    uniformity = max(0.0, 1.0 - segments.std() / segments.mean()) if segments.mean() > 1e-6 else 0.0
+
+    length = steps.sum()
+    linear = colormap_builder.srgb_to_linear(rgb)
+    cvd_ratios = [
+        _path_length(colormap_builder.rgb_to_lab(colormap_builder.linear_to_srgb(linear @ matrix.T))) / length
+        for matrix in _CVD_MATRICES.values()
+    ] if length > 1e-6 else [0.0]
+    cvd_safety = min(1.0, min(cvd_ratios))
+
+    oklab = colormap_builder.rgb_to_oklab(rgb)
+    chroma = np.hypot(oklab[:, 1], oklab[:, 2])
+    chromatic = chroma > _CHROMATIC
+    hues = np.unwrap(np.arctan2(oklab[chromatic, 2], oklab[chromatic, 1]))
+    hue_range = min(360.0, float(np.degrees(np.ptp(hues)))) if chromatic.sum() > 1 else 0.0
+
+    # Kind, from the shape of the lightness curve. A diverging map peaks (or dips) in lightness
+    # midway at a near-neutral colour; rainbow maps also peak midway but at a saturated one.
+    turn = int(np.argmax(lightness)) if abs(lightness.max() - lightness[[0, -1]].max()) > abs(lightness.min() - lightness[[0, -1]].min()) else int(np.argmin(lightness))
+    if isinstance(cmap, mcolors.ListedColormap) and cmap.N <= 20:
+        kind = 'Qualitative'
+    elif np.linalg.norm(lab[0] - lab[-1]) < 5 and length > 50:
+        kind = 'Cyclic'
+    elif monotonicity >= 0.9:
+        kind = 'Sequential'
+    elif 0.25 * len(lab) < turn < 0.75 * len(lab) and chroma[turn] < 0.1 and min(
+        abs(lightness[turn] - lightness[0]) / max(np.abs(np.diff(lightness[:turn + 1])).sum(), 1e-6),
+        abs(lightness[-1] - lightness[turn]) / max(np.abs(np.diff(lightness[turn:])).sum(), 1e-6),
+    ) >= 0.9:
+        kind = 'Diverging'
+    else:
+        kind = 'Other'
+    return kind, [monotonicity, uniformity, cvd_safety, hue_range, lightness[0], lightness[-1], length]
+
+
+def build_index(names=None):
+    names = sorted(names if names is not None else matplotlib.colormaps, key=str.lower)
+    kinds, metrics, thumbnails = [], [], []
+    for name in names:
+        cmap = matplotlib.colormaps[name]
+        kind, values = colormap_metrics(cmap)
+        kinds.append(kind)
+        metrics.append(values)
+        thumbnails.append(np.round(cmap(np.linspace(0.0, 1.0, THUMBNAIL_SAMPLES))[:, :3] * 255))
+    return {
+        'names': np.array(names),
+        'kinds': np.array(kinds),
+        'metric_names': np.array(METRICS),
+        'metrics': np.array(metrics, dtype=np.float32).reshape(len(names), len(METRICS)),
+        'thumbnails': np.array(thumbnails, dtype=np.uint8).reshape(len(names), THUMBNAIL_SAMPLES, 3),
+    }
+
+
+def load_index(rebuild=False):
+    # The on-disk index for this matplotlib version, built (and written atomically) if missing
+    path = index_path()
+    if not rebuild and os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as stored:
+                index = {key: stored[key] for key in stored.files}
+            if list(index['metric_names']) == METRICS:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass  # unreadable or from another layout; rebuild below
+    index = build_index()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part = f"{path}.{os.getpid()}.part"
+    with open(part, 'wb') as fh:
+        np.savez_compressed(fh, **index)
+    os.replace(part, path)
+    return index
+
+
+def filter_index(index, kinds=None, min_scores=None, hue_range=None, include_reversed=True):
+    # Boolean mask over the index. min_scores maps metric names to lower bounds; hue_range is an
+    # inclusive (low, high) band in degrees.
+    metrics = index['metrics']
+    mask = np.ones(len(index['names']), dtype=bool)
+    if kinds:
+        mask &= np.isin(index['kinds'], list(kinds))
+    for metric, minimum in (min_scores or {}).items():
+        mask &= metrics[:, METRICS.index(metric)] >= minimum
+    if hue_range is not None:
+        hues = metrics[:, METRICS.index('Hue Range (°)')]
+        mask &= (hues >= hue_range[0]) & (hues <= hue_range[1])
+    if not include_reversed:
+        mask &= ~np.char.endswith(index['names'], '_r')
+    return mask
+
+
+def rank_index(index, mask, sort_by, descending=True):
+    # Indices of the masked colormaps, best first by one metric (ties broken by name)
+    selected = np.flatnonzero(mask)
+    values = index['metrics'][selected, METRICS.index(sort_by)]
+    order = np.lexsort((index['names'][selected], -values if descending else values))
+    return selected[order]
+
+
+def describe(index, i):
+    metrics = dict(zip(METRICS, index['metrics'][i]))
+    return (f"{index['kinds'][i]}; lightness {metrics['Lightness Start']:.0f} → {metrics['Lightness End']:.0f}, "
+            f"monotonicity {metrics['Lightness Monotonicity']:.2f}, uniformity {metrics['Uniformity']:.2f}, "
+            f"CVD safety {metrics['CVD Safety']:.2f}, hue range {metrics['Hue Range (°)']:.0f}°.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and print the perceptual index of matplotlib colormaps.')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild even if an index exists')
+    parser.add_argument('--sort-by', choices=METRICS, default='Uniformity')
+    args = parser.parse_args(argv)
+
+    index = load_index(args.rebuild)
+    print(f"{len(index['names'])} colormaps in {index_path()} ({os.path.getsize(index_path()) / 1024:.0f} KB)")
+    print(f"{'Name':<20} {'Kind':<12}" + ''.join(f"{name.split(' (')[0][:12]:>13}" for name in METRICS[:4]))
+    for i in rank_index(index, np.ones(len(index['names']), dtype=bool), args.sort_by):
+        print(f"{index['names'][i]:<20} {index['kinds'][i]:<12}" + ''.join(f"{value:>13.2f}" for value in index['metrics'][i, :4]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,7 +3,13 @@ import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import numpy as np
 from colorsys import rgb_to_hls, hls_to_rgb
-import json
+import base64
+import hashlib
+import os
+import tempfile
+import palette_export
+import colormap_builder
+import colormap_index
 
 st.set_page_config(layout="wide")
 
@@ -14,6 +20,12 @@ if 'colors' not in st.session_state:
     st.session_state.colors = []
 if 'original_colors' not in st.session_state:
     st.session_state.original_colors = []
+if 'lut' not in st.session_state:
+    st.session_state.lut = None
+# Gradients built this session, by name. They stay out of matplotlib's registry, which every session shares.
+if 'custom_colormaps' not in st.session_state:
+    st.session_state.custom_colormaps = {}
+MAX_CUSTOM_COLORMAPS = 8
 
 # Colormap descriptions
 colormap_descriptions = {
@@ -51,29 +63,69 @@ if dark_mode:
     </style>
     """, unsafe_allow_html=True)
 
-# Colormap selection
-colormaps = ['viridis', 'plasma', 'inferno', 'magma', 'cividis', 'Blues', 'BuGn', 'BuPu', 'GnBu', 'OrRd', 'Spectral', 'cool', 'spring', 'summer', 'autumn', 'winter']
-colormap = st.sidebar.selectbox('Select Colormap:', [''] + colormaps)
+# Colormap selection: every registered colormap, filtered and ranked by the perceptual scores in
+# the on-disk index (built once per matplotlib version, then only loaded)
+@st.cache_resource
+def load_colormap_index():
+    index = colormap_index.load_index()
+    index['positions'] = {name: i for i, name in enumerate(index['names'].tolist())}
+    return index
+
+@st.cache_resource
+def colormap_thumbnails():
+    # A gradient image per colormap for the index table
+    index = load_colormap_index()
+    thumbnails = []
+    for thumbnail in index['thumbnails']:
+        stops = ''.join(f"<stop offset='{i / (len(thumbnail) - 1):.4f}' stop-color='#{r:02x}{g:02x}{b:02x}'/>"
+                        for i, (r, g, b) in enumerate(thumbnail.tolist()))
+        svg = (f"<svg xmlns='http://www.w3.org/2000/svg' width='160' height='16'><defs><linearGradient id='g'>{stops}"
+               f"</linearGradient></defs><rect width='160' height='16' fill='url(#g)'/></svg>")
+        thumbnails.append(f"data:image/svg+xml;base64,{base64.b64encode(svg.encode()).decode()}")
+    return thumbnails
+
+cmap_index = load_colormap_index()
+all_colormaps = cmap_index['names'].tolist()
+with st.sidebar.expander('Find a Colormap'):
+    index_kinds = st.multiselect('Kind:', colormap_index.KINDS)
+    min_monotonicity = st.slider('Min. Lightness Monotonicity:', 0.0, 1.0, 0.0, step=0.05)
+    min_uniformity = st.slider('Min. Uniformity:', 0.0, 1.0, 0.0, step=0.05)
+    min_cvd_safety = st.slider('Min. CVD Safety:', 0.0, 1.0, 0.0, step=0.05)
+    hue_band = st.slider('Hue Range (°):', 0, 360, (0, 360))
+    include_reversed = st.checkbox('Include reversed (_r) colormaps')
+    rank_by = st.selectbox('Rank By:', ['Name'] + colormap_index.METRICS[:4])
+index_mask = colormap_index.filter_index(
+    cmap_index, index_kinds,
+    {'Lightness Monotonicity': min_monotonicity, 'Uniformity': min_uniformity, 'CVD Safety': min_cvd_safety},
+    hue_band, include_reversed,
+)
+if rank_by == 'Name':
+    index_order = np.flatnonzero(index_mask)
+else:
+    index_order = colormap_index.rank_index(cmap_index, index_mask, rank_by, descending=rank_by != 'Hue Range (°)')
+colormaps = cmap_index['names'][index_order].tolist()
+colormap = st.sidebar.selectbox('Select Colormap:', [''] + list(st.session_state.custom_colormaps) + colormaps)
+
+def get_colormap(name):
+    # This session's gradients first, then matplotlib's colormaps
+    return st.session_state.custom_colormaps.get(name) or plt.get_cmap(name)
 
 # Show colormap description
-if colormap:
-    st.sidebar.write('**Colormap Description:**', colormap_descriptions.get(colormap, 'No description available.'))
+if colormap in cmap_index['positions']:
+    st.sidebar.write('**Colormap Description:**', colormap_descriptions.get(colormap, ''),
+                     colormap_index.describe(cmap_index, cmap_index['positions'][colormap]))
 
 # Number of colors
 num_colors = st.sidebar.number_input('Number of Colors:', min_value=1, max_value=256, value=5)
 
 # Generate colors
 if colormap:
-    cmap = plt.get_cmap(colormap, num_colors)
+    cmap_full = get_colormap(colormap)
+    cmap = cmap_full.resampled(num_colors)
     colors = [mcolors.rgb2hex(cmap(i)) for i in range(cmap.N)]
     st.session_state.colors = colors
     st.session_state.original_colors = colors
-
-# Download Palette
-if st.sidebar.button('Download Palette'):
-    palette_data = [{'hex': color} for color in st.session_state.colors]
-    json_str = json.dumps(palette_data, indent=2)
-    st.download_button('Download Palette as JSON', data=json_str, file_name='color-palette.json', mime='application/json')
+    st.session_state.lut = cmap_full(np.linspace(0, 1, cmap_full.N))[:, :3]
 
 # Custom Colorpicker
 st.sidebar.subheader('Add a Custom Color')
@@ -81,16 +133,42 @@ custom_color = st.sidebar.color_picker('Pick a color')
 if st.sidebar.button('Add Custom Color'):
     st.session_state.colors.append(custom_color)
     st.session_state.original_colors.append(custom_color)
+    # The palette no longer matches the colormap or gradient the LUT came from
+    st.session_state.lut = None
+
+# Gradient Creation Tool: multi-stop continuous colormaps interpolated in a perceptual space
+@st.cache_data(max_entries=16)
+def build_gradient_lut(stop_colors, lut_size, space):
+    return colormap_builder.build_lut(list(stop_colors), lut_size, space)
 
-# Gradient Creation Tool
 st.sidebar.subheader('Generate Gradient')
-gradient_color1 = st.sidebar.color_picker('Color 1', '#ff0000')
-gradient_color2 = st.sidebar.color_picker('Color 2', '#0000ff')
+default_stop_colors = ['#ff0000', '#0000ff', '#00ff00', '#ffff00', '#ff00ff', '#00ffff', '#000000', '#ffffff']
+num_stops = st.sidebar.number_input('Number of Color Stops:', min_value=2, max_value=len(default_stop_colors), value=2)
+gradient_stops = [st.sidebar.color_picker(f'Color {i + 1}', default_stop_colors[i]) for i in range(num_stops)]
+interpolation_space = st.sidebar.selectbox('Interpolation Space:', colormap_builder.INTERPOLATION_SPACES)
+lut_size = st.sidebar.number_input('LUT Size:', min_value=2, max_value=colormap_builder.MAX_LUT_SIZE, value=256)
+gradient_name = st.sidebar.text_input('Colormap Name:', 'custom_gradient')
 if st.sidebar.button('Generate Gradient'):
-    cmap_custom = mcolors.LinearSegmentedColormap.from_list('custom_gradient', [gradient_color1, gradient_color2])
-    gradient_colors = [mcolors.rgb2hex(cmap_custom(i)) for i in np.linspace(0, 1, num_colors)]
+    lut = build_gradient_lut(tuple(gradient_stops), lut_size, interpolation_space)
+    # The palette is a downsampled preview; the full LUT is kept for export and as this session's colormap
+    gradient_colors = colormap_builder.lut_to_hex(colormap_builder.downsample_lut(lut, num_colors))
     st.session_state.colors = gradient_colors
     st.session_state.original_colors = gradient_colors
+    st.session_state.lut = lut
+    try:
+        if gradient_name in cmap_index['positions']:
+            raise ValueError(f"'{gradient_name}' is a built-in matplotlib colormap; choose another name")
+        gradient_cmap = colormap_builder.make_colormap(gradient_name, lut)
+    except ValueError as error:
+        st.sidebar.error(f"Not saved as a colormap: {error}")
+    else:
+        custom_colormaps = st.session_state.custom_colormaps
+        custom_colormaps.pop(gradient_name, None)
+        custom_colormaps[gradient_name] = gradient_cmap
+        while len(custom_colormaps) > MAX_CUSTOM_COLORMAPS:
+            custom_colormaps.pop(next(iter(custom_colormaps)))
+        st.sidebar.write(f"Saved `{gradient_name}` for this session ({len(lut)} entries). "
+                         "Export it as a NumPy LUT to colour the planning app's charts.")
 
 # Adjustments
 st.sidebar.subheader('Adjustments')
@@ -134,31 +212,16 @@ elif sort_option == 'Original Order':
 
 # Colorblind Simulation
 st.sidebar.subheader('Simulate Colorblindness')
-simulate_option = st.sidebar.selectbox('Simulate Colorblindness:', ['None', 'Protanopia', 'Deuteranopia', 'Tritanopia', 'Achromatopsia'])
+simulate_option = st.sidebar.selectbox('Simulate Colorblindness:', ['None'] + colormap_builder.CVD_SIMULATIONS)
 
 def simulate_colorblindness(color, type):
-    # Simple simulation by adjusting colors (placeholder)
-    if type == 'Protanopia' or type == 'Deuteranopia':
-        # Reduce red/green components
-        r, g, b = mcolors.to_rgb(color)
-        r *= 0.5
-        g *= 0.5
-        return mcolors.to_hex((r, g, b))
-    elif type == 'Tritanopia':
-        # Reduce blue component
-        r, g, b = mcolors.to_rgb(color)
-        b *= 0.5
-        return mcolors.to_hex((r, g, b))
-    elif type == 'Achromatopsia':
-        # Desaturate color completely
-        r, g, b = mcolors.to_rgb(color)
-        h, l, s = rgb_to_hls(r, g, b)
-        s = 0
-        r_new, g_new, b_new = hls_to_rgb(h, l, s)
-        return mcolors.to_hex((r_new, g_new, b_new))
-    else:
+    # Simple simulation by adjusting colors (placeholder); shared with the data preview's LUTs
+    if type not in colormap_builder.CVD_SIMULATIONS:
         return color
+    return colormap_builder.lut_to_hex(colormap_builder.simulate_cvd([mcolors.to_rgb(color)], type))[0]
 
+# The data preview shows every simulation side by side, so it takes the palette before this one
+preview_palette = list(colors_adjusted)
 if simulate_option != 'None':
     colors_adjusted = [simulate_colorblindness(color, simulate_option) for color in colors_adjusted]
 
@@ -169,21 +232,182 @@ if st.sidebar.button('Reset Colors'):
     brightness = 0.0
     saturation = 0.0
 
-# Display Colormap Preview
-st.subheader('Colormap Preview')
-st.write('Colormap Preview (Gradient):')
-st.markdown(f"<div style='height: 30px; background: linear-gradient(to right, {', '.join(colors_adjusted)});'></div>", unsafe_allow_html=True)
+# Render the gradient preview, swatches and labels as a single SVG image.
+# Cached on the palette itself, so redrawing an unchanged palette is free and
+# the page holds one element however many colors there are.
+@st.cache_data(max_entries=64)
+def render_palette_svg(colors, text_color):
+    width = 1600
+    per_row = min(len(colors), 16)
+    swatch_width = width / per_row
+    gradient_height, gap, swatch_height, label_height = 30, 20, 60, 44
+    row_height = swatch_height + label_height
+    rows = -(-len(colors) // per_row)
+    height = gradient_height + gap + rows * row_height
+    font_size = min(16.0, swatch_width / 12)
+
+    if len(colors) == 1:
+        offsets = [0.0]
+    else:
+        offsets = [i / (len(colors) - 1) for i in range(len(colors))]
+    stops = ''.join(f"<stop offset='{offset:.6f}' stop-color='{color}'/>" for offset, color in zip(offsets, colors))
+
+    parts = [
+        f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {width} {height}' width='100%'>",
+        f"<defs><linearGradient id='preview'>{stops}</linearGradient></defs>",
+        f"<rect x='0' y='0' width='{width}' height='{gradient_height}' fill='url(#preview)'/>",
+        f"<g font-family='sans-serif' font-size='{font_size:.1f}' fill='{text_color}' text-anchor='middle'>",
+    ]
+    for i, color in enumerate(colors):
+        x = (i % per_row) * swatch_width
+        y = gradient_height + gap + (i // per_row) * row_height
+        r, g, b = [int(255 * c) for c in mcolors.to_rgb(color)]
+        center = x + swatch_width / 2
+        parts.append(f"<rect x='{x:.2f}' y='{y}' width='{swatch_width:.2f}' height='{swatch_height}' fill='{color}'/>")
+        parts.append(f"<text x='{center:.2f}' y='{y + swatch_height + font_size * 1.4:.1f}'>{color}</text>")
+        parts.append(f"<text x='{center:.2f}' y='{y + swatch_height + font_size * 2.8:.1f}'>rgb({r}, {g}, {b})</text>")
+    parts.append("</g></svg>")
+
+    svg = ''.join(parts)
+    return f"<img src='data:image/svg+xml;base64,{base64.b64encode(svg.encode()).decode()}' style='width: 100%;'>"
 
-# Display Adjusted Colors
+# Export: every format is built once per palette and reused across reruns
+@st.cache_data(max_entries=64)
+def build_palette_exports(colors):
+    return palette_export.build_exports(list(colors))
+
+# Batch export streams each colormap into a zip on local disk rather than holding the archive in memory
+@st.cache_resource
+def export_directory():
+    return tempfile.TemporaryDirectory(prefix='palette-export-')
+
+@st.cache_data(max_entries=16)
+def build_colormap_zip(names, n_colors, formats):
+    key = hashlib.sha1(repr((names, n_colors, formats)).encode()).hexdigest()[:16]
+    path = os.path.join(export_directory().name, f"colormaps-{key}.zip")
+    if not os.path.exists(path):
+        palettes = ((name, [mcolors.rgb2hex(c) for c in plt.get_cmap(name, n_colors)(range(n_colors))]) for name in names)
+        def full_lut(name):
+            cmap_full = plt.get_cmap(name)
+            return cmap_full(np.linspace(0, 1, cmap_full.N))
+        with open(path + '.part', 'wb') as fh:
+            palette_export.write_zip(fh, palettes, formats, lut_source=full_lut)
+        os.replace(path + '.part', path)
+    return path
+
+@st.cache_data(max_entries=16)
+def build_lut_export(lut, brightness_adj, saturation_adj, simulation):
+    # The same brightness, saturation and colorblindness adjustments as the palette swatches
+    lut = colormap_builder.adjust_lut(lut, brightness_adj, saturation_adj)
+    if simulation in colormap_builder.CVD_SIMULATIONS:
+        lut = np.clip(colormap_builder.simulate_cvd(lut, simulation), 0.0, 1.0).astype(lut.dtype)
+    return palette_export.palette_to_npy(lut)
+
+palette_exports = build_palette_exports(tuple(colors_adjusted))
+if st.session_state.lut is not None:
+    # Export the full-resolution LUT rather than the downsampled palette
+    palette_exports = {**palette_exports, 'NumPy LUT': build_lut_export(st.session_state.lut, brightness, saturation, simulate_option)}
+
+st.sidebar.subheader('Export Palette')
+export_format = st.sidebar.selectbox('Export Format:', list(palette_export.EXPORT_FORMATS))
+suffix, mime = palette_export.EXPORT_FORMATS[export_format]
+st.sidebar.download_button(
+    f'Download Palette ({export_format})',
+    data=palette_exports[export_format],
+    file_name=f'color-palette{suffix}',
+    mime=mime,
+    disabled=not colors_adjusted,
+)
+
+with st.sidebar.expander('Batch Export Colormaps'):
+    batch_colormaps = st.multiselect('Colormaps:', all_colormaps)
+    batch_formats = st.multiselect('Formats:', list(palette_export.EXPORT_FORMATS), default=['JSON'])
+    if batch_colormaps and batch_formats:
+        zip_path = build_colormap_zip(tuple(batch_colormaps), num_colors, tuple(batch_formats))
+        with open(zip_path, 'rb') as zip_file:
+            st.download_button('Download Zip', data=zip_file, file_name='colormaps.zip', mime='application/zip')
+
+# Colormap Index: the filtered colormaps in rank order with their scores
+with st.expander(f'Colormap Index ({len(colormaps)} of {len(all_colormaps)} colormaps match)'):
+    thumbnails = colormap_thumbnails()
+    st.dataframe(
+        {
+            'Preview': [thumbnails[i] for i in index_order],
+            'Name': colormaps,
+            'Kind': cmap_index['kinds'][index_order].tolist(),
+            **{metric: np.round(cmap_index['metrics'][index_order, j], 2).tolist() for j, metric in enumerate(colormap_index.METRICS[:4])},
+        },
+        column_config={'Preview': st.column_config.ImageColumn('Preview', width='medium')},
+        hide_index=True,
+    )
+
+# Display Colormap Preview and Adjusted Colors
 st.subheader('Color Palette')
-cols = st.columns(len(colors_adjusted))
-for col, color in zip(cols, colors_adjusted):
-    r, g, b = [int(255 * c) for c in mcolors.to_rgb(color)]
-    rgb_text = f"rgb({r}, {g}, {b})"
-    col.markdown(f"<div style='background-color:{color}; height:60px;'></div>", unsafe_allow_html=True)
-    col.markdown(f"<p style='text-align: center;'>{color}<br>{rgb_text}</p>", unsafe_allow_html=True)
+if colors_adjusted:
+    text_color = 'white' if dark_mode else '#31333F'
+    st.markdown(render_palette_svg(tuple(colors_adjusted), text_color), unsafe_allow_html=True)
+else:
+    st.write('Select a colormap, generate a gradient or add a custom color to preview a palette.')
+
+# Data Preview: an uploaded array or grayscale image through the palette and each simulation.
+# The upload is quantised to uint8 once per file (keyed by a hash of its bytes); every palette
+# change after that is a 256-entry LUT lookup, with the rendered tiles cached per (data, palette).
+@st.cache_resource(max_entries=4)
+def load_preview_data(data_hash, _file_bytes, _file_name):
+    data = colormap_builder.read_data_array(_file_bytes, _file_name)
+    indices, missing, value_range = colormap_builder.quantize_uint8(data)
+    # Five tiles share the page width, so 512 pixels is already sharper than they are drawn
+    preview, preview_missing, step = colormap_builder.preview_indices(indices, missing, max_side=512)
+    return {'indices': indices, 'missing': missing, 'range': value_range, 'dtype': str(data.dtype),
+            'preview': preview, 'preview_missing': preview_missing, 'step': step}
+
+# Keyed on the two hashes only; the underscored arguments are what they were computed from
+@st.cache_data(max_entries=64)
+def render_preview_tile(data_hash, palette_hash, simulation, _data, _palette, _interpolate):
+    lut = colormap_builder.palette_lut8(_palette, _interpolate)
+    if simulation != 'None':
+        lut[:, :3] = np.round(np.clip(colormap_builder.simulate_cvd(lut[:, :3] / 255, simulation), 0.0, 1.0) * 255)
+    return colormap_builder.image_to_png(colormap_builder.apply_lut8(_data['preview'], lut, _data['preview_missing']))
+
+st.subheader('Data Preview')
+data_file = st.file_uploader('Upload a 2-D array (CSV, NPY) or grayscale image:', type=colormap_builder.DATA_FILE_TYPES)
+if data_file is not None and preview_palette:
+    file_bytes = data_file.getvalue()
+    # Hashing a large upload takes a noticeable fraction of a second, so do it once per upload
+    if st.session_state.get('preview_upload', (None,))[0] != data_file.file_id:
+        st.session_state.preview_upload = (data_file.file_id, hashlib.blake2b(file_bytes, digest_size=16).hexdigest())
+    data_hash = st.session_state.preview_upload[1]
+    try:
+        preview_data = load_preview_data(data_hash, file_bytes, data_file.name)
+    except (ValueError, OSError) as error:
+        st.error(f"Could not read {data_file.name}: {error}")
+        preview_data = None
+    if preview_data is not None:
+        interpolate = st.checkbox('Interpolate between palette colors', value=len(preview_palette) > 16)
+        palette = tuple(preview_palette)
+        palette_hash = hashlib.blake2b(repr((palette, interpolate)).encode(), digest_size=16).hexdigest()
+        height, width = preview_data['indices'].shape
+        low, high = preview_data['range']
+        st.caption(f"{width}×{height} {preview_data['dtype']}, values {low:g} to {high:g}"
+                   + (' (missing values transparent)' if preview_data['missing'] is not None else '')
+                   + (f"; preview shows every {preview_data['step']}th pixel" if preview_data['step'] > 1 else ''))
+        variants = ['None'] + colormap_builder.CVD_SIMULATIONS
+        columns = st.columns(len(variants))
+        for column, simulation in zip(columns, variants):
+            column.image(render_preview_tile(data_hash, palette_hash, simulation, preview_data, palette, interpolate),
+                         caption='Adjusted palette' if simulation == 'None' else simulation, width='stretch')
+        # Rendered only when the button is clicked, and not cached: a full-size PNG can run to tens
+        # of MB, and only the small preview tiles are worth keeping between reruns
+        def full_resolution_png():
+            lut = colormap_builder.palette_lut8(palette, interpolate)
+            return colormap_builder.image_to_png(colormap_builder.apply_lut8(preview_data['indices'], lut, preview_data['missing']))
+
+        st.download_button('Download Full-Resolution PNG', data=full_resolution_png,
+                           file_name=f"{os.path.splitext(data_file.name)[0]}-recoloured.png", mime='image/png')
+elif data_file is not None:
+    st.write('Pick a palette to recolour the data.')
 
 # Python Script Output
 st.subheader('Python Script Output')
-python_code = f"# Python color palette:\n# Use this in your script:\ncolors = [\n" + ',\n'.join([f"    '{color}'" for color in colors_adjusted]) + "\n]"
+python_code = palette_exports['Python List'].decode()
 st.code(python_code, language='python')
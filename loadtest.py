@@ -0,0 +1,501 @@
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# Concurrent-user load test for the Streamlit apps.
+#
+# Drives N headless sessions (streamlit.testing AppTest, one per thread, all in this process the
+# way the Streamlit server runs them) through a scripted sequence of widget interactions, timing
+# every rerun. Reports p50/p95/p99 rerun latency, throughput and peak RSS, and saves the result
+# with the git commit so runs can be compared across commits.
+#
+#   python loadtest.py run appV3.py --sessions 8 --iterations 3
+#   python loadtest.py run colormaps.py --sessions 4
+#   python loadtest.py compare loadtest-results/appV3-a80229b.json loadtest-results/appV3-7490e66.json
+#   python loadtest.py api --concurrency 1 8 32 --duration 10 --target-p95-ms 100
+#
+# The api command benchmarks the HTTP model service (planning_core.api) instead: it starts a
+# server on a synthetic procedure file (or uses --url), holds each concurrency level for
+# --duration seconds with keep-alive clients, and reports requests/s and latency at each level.
+#
+# AppTest cannot drive st.file_uploader, so the "upload" step puts a synthetic procedure table
+# straight into session state, as a completed upload into the manual-entry table would.
+
+RESULTS_DIR = 'loadtest-results'
+PERCENTILES = [50, 95, 99]
+
+
+def _widget(at, kind, label):
+    for widget in getattr(at, kind):
+        if widget.label == label:
+            return widget
+    raise LookupError(f"No {kind} labelled {label!r}")
+
+
+def _synthetic_procedures(n_procedures, seed):
+    import session_memory
+
+    rng = np.random.default_rng(seed)
+    return session_memory.ProcedureTable.from_records([
+        {'Procedure': f'Procedure {i}', 'Annual Demand (Cases)': int(cases), 'Average Duration (Hours)': float(hours)}
+        for i, (cases, hours) in enumerate(zip(rng.integers(10, 400, n_procedures), rng.uniform(0.5, 4.0, n_procedures).round(1)))
+    ])
+
+
+# Each script is a list of (step name, action); an action sets widgets on the AppTest and returns
+# what to run. `session` is the session index, so concurrent sessions don't all make identical edits.
+def planning_app_script(n_procedures):
+    def upload(at, session, iteration):
+        at.session_state['procedures'] = _synthetic_procedures(n_procedures, seed=session * 1000 + iteration)
+        return at
+
+    def drag_slider(label, values):
+        def action(at, session, iteration):
+            return _widget(at, 'slider', label).set_value(values[(session + iteration) % len(values)])
+        return action
+
+    def switch(label, options):
+        def action(at, session, iteration):
+            return _widget(at, 'radio', label).set_value(options[(session + iteration) % len(options)])
+        return action
+
+    def name_scenario(at, session, iteration):
+        return _widget(at, 'text_input', 'Scenario Name').set_value(f'Load test {session}-{iteration}')
+
+    def save_scenario(at, session, iteration):
+        return _widget(at, 'button', 'Save Scenario').click()
+
+    return [
+        ('upload procedures', upload),
+        ('drag utilisation', drag_slider('Utilisation Percentage (Last Year)', [0.70, 0.75, 0.85, 0.90])),
+        ('drag breach share', drag_slider('% of Cases Used to Treat Breaches', [0.2, 0.4, 0.5])),
+        ('switch capacity model', switch('Choose Capacity Model for Next Year', ['New Capacity Model', 'Same as Last Year'])),
+        ('switch waiting list year', switch('Select Year for Waiting List Analysis', ['Next Year', 'Last Year'])),
+        ('switch waiting list capacity', switch('Choose Capacity for Waiting List Analysis', [
+            'Next Year Expected Capacity', 'Next Year Required Capacity', 'Last Year Capacity'])),
+        ('name scenario', name_scenario),
+        ('save scenario', save_scenario),
+    ]
+
+
+def colormap_app_script(n_procedures):
+    def select(label, options):
+        def action(at, session, iteration):
+            return _widget(at, 'selectbox', label).set_value(options[(session + iteration) % len(options)])
+        return action
+
+    def set_number(label, values):
+        def action(at, session, iteration):
+            return _widget(at, 'number_input', label).set_value(values[(session + iteration) % len(values)])
+        return action
+
+    def drag_slider(label, values):
+        def action(at, session, iteration):
+            return _widget(at, 'slider', label).set_value(values[(session + iteration) % len(values)])
+        return action
+
+    def generate_gradient(at, session, iteration):
+        return _widget(at, 'button', 'Generate Gradient').click()
+
+    return [
+        ('select colormap', select('Select Colormap:', ['viridis', 'plasma', 'Spectral', 'cividis'])),
+        ('set number of colors', set_number('Number of Colors:', [5, 12, 64])),
+        ('drag brightness', drag_slider('Brightness:', [-0.2, 0.0, 0.25])),
+        ('drag saturation', drag_slider('Saturation:', [-0.1, 0.15, 0.0])),
+        ('simulate colour blindness', select('Simulate Colorblindness:', ['Deuteranopia', 'Protanopia', 'None'])),
+        ('generate gradient', generate_gradient),
+    ]
+
+
+SCRIPTS = {
+    'appV3.py': planning_app_script,
+    'colormaps.py': colormap_app_script,
+}
+
+
+def run_session(app_path, script, session, iterations, timeout, start_barrier):
+    from streamlit.testing.v1 import AppTest
+
+    timings = []
+    errors = []
+    at = AppTest.from_file(app_path, default_timeout=timeout)
+    start_barrier.wait()
+
+    def timed(step, runnable):
+        start = time.perf_counter()
+        try:
+            result = runnable.run()
+        except Exception as error:  # a timed-out or crashed rerun still counts against the run
+            errors.append({'session': session, 'step': step, 'error': repr(error)})
+            result = None
+        timings.append((step, (time.perf_counter() - start) * 1000))
+        if result is not None and len(result.exception):
+            errors.append({'session': session, 'step': step, 'error': result.exception[0].value})
+        return result
+
+    at = timed('initial load', at) or at
+    for iteration in range(iterations):
+        for step, action in script:
+            try:
+                runnable = action(at, session, iteration)
+            except Exception as error:  # the widget is missing or can't be used in this state
+                errors.append({'session': session, 'step': step, 'error': repr(error)})
+                continue
+            at = timed(step, runnable) or at
+    return timings, errors
+
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=float)
+    if not len(values):
+        return {f'p{p}': None for p in PERCENTILES}
+    summary = {f'p{p}': float(np.percentile(values, p)) for p in PERCENTILES}
+    summary.update({'mean': float(values.mean()), 'max': float(values.max())})
+    return summary
+
+
+def _rss_mb(usage_kb):
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return usage_kb / 1024 ** 2 if sys.platform == 'darwin' else usage_kb / 1024
+
+
+def _git(*args):
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _share_script_cache():
+    # AppTest compiles the script again for every rerun, whereas the server compiles it once into a
+    # shared, locked ScriptCache. Sharing one here matches the server and also avoids concurrent
+    # ast.parse calls, which can fail spuriously under threads on some CPython 3.11 releases.
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+
+    shared_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: shared_cache
+
+
+def run_load_test(app, sessions=4, iterations=2, procedures=200, timeout=120):
+    # st.cache_data starts empty in a fresh process, so the first sessions to reach each
+    # cached function pay for it, as after a server restart
+    app_path = os.path.abspath(app)
+    script = SCRIPTS[os.path.basename(app)](procedures)
+    _share_script_cache()
+    baseline_rss_mb = _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    start_barrier = threading.Barrier(sessions + 1)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, app_path, script, session, iterations, timeout, start_barrier)
+            for session in range(sessions)
+        ]
+        start_barrier.wait()
+        start = time.perf_counter()
+        results = [future.result() for future in futures]
+        wall_seconds = time.perf_counter() - start
+
+    timings = [timing for session_timings, _ in results for timing in session_timings]
+    errors = [error for _, session_errors in results for error in session_errors]
+    steps = {}
+    for step, elapsed in timings:
+        steps.setdefault(step, []).append(elapsed)
+    return {
+        'app': os.path.basename(app),
+        'commit': _git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {'sessions': sessions, 'iterations': iterations, 'procedures': procedures},
+        'reruns': len(timings),
+        'wall_seconds': wall_seconds,
+        'throughput_reruns_per_second': len(timings) / wall_seconds if wall_seconds else None,
+        'latency_ms': _percentiles([elapsed for _, elapsed in timings]),
+        'steps_ms': {step: {**_percentiles(values), 'count': len(values)} for step, values in steps.items()},
+        'baseline_rss_mb': baseline_rss_mb,
+        'peak_rss_mb': _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+        'errors': len(errors),
+        'error_samples': errors[:20],
+    }
+
+
+def print_report(result):
+    latency = result['latency_ms']
+    print(f"{result['app']} @ {result['commit']}{' (dirty)' if result['dirty'] else ''}: "
+          f"{result['config']['sessions']} sessions × {result['config']['iterations']} iterations")
+    print(f"  reruns {result['reruns']} in {result['wall_seconds']:.1f} s = {result['throughput_reruns_per_second']:.2f} reruns/s")
+    print(f"  latency p50 {latency['p50']:.0f} ms  p95 {latency['p95']:.0f} ms  p99 {latency['p99']:.0f} ms  max {latency['max']:.0f} ms")
+    print(f"  peak RSS {result['peak_rss_mb']:.0f} MB (baseline {result['baseline_rss_mb']:.0f} MB)")
+    for step, stats in result['steps_ms'].items():
+        print(f"    {step:<32} p50 {stats['p50']:7.0f} ms  p95 {stats['p95']:7.0f} ms  (n={stats['count']})")
+    if result['errors']:
+        print(f"  {result['errors']} errors, e.g. {result['error_samples'][0]}")
+
+
+def _api_scenarios(distinct, seed=0):
+    # Request bodies cycled by the clients, and with distinct=0 a source of seeds no request shares,
+    # so every request is new to the result cache
+    rng = np.random.default_rng(seed)
+    count = distinct or 1
+    scenarios = [
+        {'Sessions per Week': float(sessions), 'Utilisation': float(utilisation), 'Demand Multiplier': float(multiplier)}
+        for sessions, utilisation, multiplier in zip(rng.integers(5, 80, count), rng.uniform(0.6, 0.95, count), rng.uniform(0.8, 1.3, count))
+    ]
+    return scenarios, itertools.count() if distinct == 0 else None
+
+
+async def _api_request(reader, writer, host, body):
+    writer.write(f"POST /v1/scenario HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _api_client(host, port, scenarios, seeds, client, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    sent = 0
+    try:
+        while time.perf_counter() < deadline:
+            scenario = scenarios[(client + sent) % len(scenarios)]
+            if seeds is not None:
+                scenario = {**scenario, 'Simulation Random Seed': next(seeds)}
+            start = time.perf_counter()
+            status, reply = await _api_request(reader, writer, host, json.dumps(scenario).encode())
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors.append({'client': client, 'status': status, 'error': reply[:200].decode(errors='replace')})
+            sent += 1
+    finally:
+        writer.close()
+
+
+async def _api_level(host, port, concurrency, duration, scenarios, seeds):
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _api_client(host, port, scenarios, seeds, client, start + duration, latencies, errors)
+        for client in range(concurrency)
+    ))
+    wall_seconds = time.perf_counter() - start
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'wall_seconds': wall_seconds,
+        'throughput_requests_per_second': len(latencies) / wall_seconds,
+        'latency_ms': _percentiles(latencies),
+        'errors': len(errors),
+        'error_samples': errors[:5],
+    }
+
+
+def _api_get(host, port, path):
+    import http.client
+
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        connection.request('GET', path)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def _start_api_server(procedures, workers):
+    # A server on a synthetic procedure file, ready once it prints its address
+    directory = tempfile.mkdtemp(prefix='loadtest-api-')
+    path = os.path.join(directory, 'procedures.csv')
+    rng = np.random.default_rng(0)
+    with open(path, 'w') as fh:
+        fh.write('Procedure,Annual Demand (Cases),Average Duration (Hours),Site,Specialty\n')
+        for i in range(procedures):
+            fh.write(f"Procedure {i},{rng.integers(10, 400)},{rng.uniform(0.5, 4.0):.1f},Site {i % 3},Specialty {i % 5}\n")
+    command = [sys.executable, '-m', 'planning_core.api', '--procedures', path, '--port', '0']
+    if workers:
+        command += ['--workers', str(workers)]
+    server = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    line = server.stderr.readline()
+    if not line.startswith('Serving on'):
+        server.kill()
+        raise RuntimeError(f"API server failed to start: {line}{server.stderr.read()}")
+    host, port = line.split('//', 1)[1].split()[0].rsplit(':', 1)
+    return server, host, int(port)
+
+
+def _peak_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            return next(int(line.split()[1]) / 1024 for line in fh if line.startswith('VmHWM'))
+    except (OSError, StopIteration):
+        return None
+
+
+def run_api_benchmark(concurrency=(1, 8, 32), duration=10.0, procedures=200, workers=None, distinct=0, url=None, warmup=2.0):
+    # One level after another against the same server; the warm-up starts the worker processes
+    scenarios, seeds = _api_scenarios(distinct)
+    server = None
+    if url:
+        host, port = url.split('//', 1)[-1].rstrip('/').rsplit(':', 1)
+        port = int(port)
+    else:
+        server, host, port = _start_api_server(procedures, workers)
+    try:
+        asyncio.run(_api_level(host, port, max(concurrency), warmup, scenarios, seeds))
+        levels = []
+        for level in concurrency:
+            stats_before = _api_get(host, port, '/v1/stats')
+            result = asyncio.run(_api_level(host, port, level, duration, scenarios, seeds))
+            stats_after = _api_get(host, port, '/v1/stats')
+            batches = stats_after.get('batches', 0) - stats_before.get('batches', 0)
+            batched = stats_after.get('batched_scenarios', 0) - stats_before.get('batched_scenarios', 0)
+            result['mean_batch_size'] = batched / batches if batches else None
+            result['cache_hit_rate'] = 1 - batched / result['requests'] if result['requests'] else None
+            levels.append(result)
+        peak_rss_mb = _peak_rss_mb(server.pid) if server else None
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    # The headline numbers are from the busiest level, so compare() lines up with app runs
+    busiest = max(levels, key=lambda result: result['concurrency'])
+    return {
+        'app': 'api',
+        'commit': _git('rev-parse', '--short', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {'concurrency': list(concurrency), 'duration': duration, 'procedures': procedures,
+                   'workers': workers, 'distinct': distinct, 'url': url},
+        'levels': levels,
+        'throughput_requests_per_second': busiest['throughput_requests_per_second'],
+        'latency_ms': busiest['latency_ms'],
+        'peak_rss_mb': peak_rss_mb,
+        'errors': sum(result['errors'] for result in levels),
+        'error_samples': [sample for result in levels for sample in result['error_samples']][:20],
+    }
+
+
+def print_api_report(result, target_p95_ms=None):
+    print(f"api @ {result['commit']}{' (dirty)' if result['dirty'] else ''}: {result['cpus']} CPUs, "
+          f"{'unique' if not result['config']['distinct'] else result['config']['distinct']} scenarios, "
+          f"{result['config']['duration']:.0f} s per level")
+    print(f"  {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch':>6} {'cached':>7} {'errors':>7}")
+    for level in result['levels']:
+        latency = level['latency_ms']
+        print(f"  {level['concurrency']:>7} {level['throughput_requests_per_second']:>9.1f} {latency['p50']:>8.1f} "
+              f"{latency['p95']:>8.1f} {latency['p99']:>8.1f} {level['mean_batch_size'] or 0:>6.1f} "
+              f"{level['cache_hit_rate'] or 0:>7.0%} {level['errors']:>7}")
+    if target_p95_ms is not None:
+        within = [level for level in result['levels'] if level['latency_ms']['p95'] <= target_p95_ms]
+        if within:
+            best = max(within, key=lambda level: level['throughput_requests_per_second'])
+            print(f"  best within p95 <= {target_p95_ms:g} ms: {best['throughput_requests_per_second']:.1f} req/s at {best['concurrency']} clients")
+        else:
+            print(f"  no level kept p95 within {target_p95_ms:g} ms")
+    if result['peak_rss_mb']:
+        print(f"  server peak RSS {result['peak_rss_mb']:.0f} MB (excluding model workers)")
+    if result['errors']:
+        print(f"  {result['errors']} errors, e.g. {result['error_samples'][0]}")
+
+
+COMPARE_METRICS = [
+    ('p50 latency (ms)', lambda result: result['latency_ms']['p50']),
+    ('p95 latency (ms)', lambda result: result['latency_ms']['p95']),
+    ('p99 latency (ms)', lambda result: result['latency_ms']['p99']),
+    ('throughput (/s)', lambda result: result.get('throughput_reruns_per_second', result.get('throughput_requests_per_second'))),
+    ('peak RSS (MB)', lambda result: result['peak_rss_mb']),
+    ('errors', lambda result: result['errors']),
+]
+
+
+def compare(paths):
+    # One column per run, with the change against the first run
+    runs = []
+    for path in paths:
+        with open(path) as fh:
+            runs.append(json.load(fh))
+    labels = [f"{run['commit']}{'+' if run['dirty'] else ''}" for run in runs]
+    if len({json.dumps(run['config'], sort_keys=True) for run in runs}) > 1:
+        print("warning: runs used different configurations")
+    print(f"{'':<24}" + ''.join(f"{label:>14}" for label in labels))
+    for name, metric in COMPARE_METRICS:
+        values = [metric(run) for run in runs]
+        cells = []
+        for i, value in enumerate(values):
+            cell = f"{value:.1f}" if value is not None else '-'
+            if i and values[0] and value is not None:
+                cell += f" ({(value - values[0]) / values[0]:+.0%})"
+            cells.append(f"{cell:>14}")
+        print(f"{name:<24}" + ''.join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test the Streamlit apps with concurrent headless sessions.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run a load test and save the results')
+    run_parser.add_argument('app', choices=list(SCRIPTS))
+    run_parser.add_argument('--sessions', type=int, default=4, help='concurrent sessions')
+    run_parser.add_argument('--iterations', type=int, default=2, help='passes through the interaction script per session')
+    run_parser.add_argument('--procedures', type=int, default=200, help='rows in each synthetic procedure upload')
+    run_parser.add_argument('--timeout', type=float, default=120, help='seconds before a rerun counts as failed')
+    run_parser.add_argument('--output', help=f'results file (default: {RESULTS_DIR}/<app>-<commit>.json)')
+    compare_parser = commands.add_parser('compare', help='compare saved results, e.g. across commits')
+    compare_parser.add_argument('results', nargs='+')
+    api_parser = commands.add_parser('api', help='benchmark the HTTP model service (planning_core.api)')
+    api_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='concurrent clients, one level per value')
+    api_parser.add_argument('--duration', type=float, default=10, help='seconds per level')
+    api_parser.add_argument('--procedures', type=int, default=200, help='rows in the synthetic procedure file')
+    api_parser.add_argument('--workers', type=int, help='server model workers (default: CPU count)')
+    api_parser.add_argument('--distinct', type=int, default=0, help='cycle this many scenarios (0: every request unique, no cache hits)')
+    api_parser.add_argument('--url', help='benchmark a running server instead, e.g. http://127.0.0.1:8080')
+    api_parser.add_argument('--target-p95-ms', type=float, help='also report the best throughput within this p95 latency')
+    api_parser.add_argument('--output', help=f'results file (default: {RESULTS_DIR}/api-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        compare(args.results)
+        return 0
+    if args.command == 'api':
+        result = run_api_benchmark(args.concurrency, args.duration, args.procedures, args.workers, args.distinct, args.url)
+        print_api_report(result, args.target_p95_ms)
+        output = args.output or os.path.join(RESULTS_DIR, f"api-{result['commit'] or 'nogit'}.json")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as fh:
+            json.dump(result, fh, indent=2)
+        print(f"Saved {output}")
+        return 1 if result['errors'] else 0
+
+    # Saved scenarios go to a scratch directory, not the shared scenario store
+    os.environ.setdefault('PLANNING_SCENARIO_DIR', tempfile.mkdtemp(prefix='loadtest-scenarios-'))
+    result = run_load_test(args.app, args.sessions, args.iterations, args.procedures, args.timeout)
+    print_report(result)
+    output = args.output or os.path.join(RESULTS_DIR, f"{os.path.splitext(result['app'])[0]}-{result['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as fh:
+        json.dump(result, fh, indent=2)
+    print(f"Saved {output}")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import io
+import json
+import zipfile
+
+import numpy as np
+import matplotlib.colors as mcolors
+
+# Palette export formats: label -> (file suffix, mime type)
+EXPORT_FORMATS = {
+    'JSON': ('.json', 'application/json'),
+    'CSS Variables': ('.css', 'text/css'),
+    'Matplotlib Style': ('.mplstyle', 'text/plain'),
+    'Plotly Template': ('.plotly.json', 'application/json'),
+    'NumPy LUT': ('.npy', 'application/octet-stream'),
+    'Python List': ('.py', 'text/x-python'),
+}
+
+
+def palette_to_json(colors):
+    return json.dumps([{'hex': color} for color in colors], indent=2).encode()
+
+
+def palette_to_css(colors, prefix='palette'):
+    lines = [f"  --{prefix}-{i}: {color};" for i, color in enumerate(colors)]
+    return (":root {\n" + '\n'.join(lines) + "\n}\n").encode()
+
+
+def palette_to_mplstyle(colors):
+    # mplstyle files take hex colors without the leading '#'
+    cycle = ', '.join(f"'{color.lstrip('#')}'" for color in colors)
+    return f"axes.prop_cycle: cycler('color', [{cycle}])\n".encode()
+
+
+def palette_to_plotly_template(colors):
+    if len(colors) == 1:
+        colorscale = [[0.0, colors[0]], [1.0, colors[0]]]
+    else:
+        colorscale = [[i / (len(colors) - 1), color] for i, color in enumerate(colors)]
+    template = {
+        'layout': {
+            'colorway': list(colors),
+            'colorscale': {'sequential': colorscale, 'diverging': colorscale},
+        }
+    }
+    return json.dumps(template, indent=2).encode()
+
+
+def palette_to_npy(colors):
+    # Accepts hex colors or an (N, 3) / (N, 4) float array such as a full-resolution LUT
+    if isinstance(colors, np.ndarray):
+        rgb = colors[:, :3].astype(np.float32)
+    else:
+        rgb = mcolors.to_rgba_array(list(colors))[:, :3].astype(np.float32)
+    buffer = io.BytesIO()
+    np.save(buffer, rgb)
+    return buffer.getvalue()
+
+
+def palette_to_python(colors):
+    return ("# Python color palette:\n# Use this in your script:\ncolors = [\n"
+            + ',\n'.join([f"    '{color}'" for color in colors]) + "\n]").encode()
+
+
+EXPORTERS = {
+    'JSON': palette_to_json,
+    'CSS Variables': palette_to_css,
+    'Matplotlib Style': palette_to_mplstyle,
+    'Plotly Template': palette_to_plotly_template,
+    'NumPy LUT': palette_to_npy,
+    'Python List': palette_to_python,
+}
+
+
+def build_exports(colors, formats=None):
+    # Build every requested format for one palette in a single pass
+    formats = formats or list(EXPORTERS)
+    return {fmt: EXPORTERS[fmt](colors) for fmt in formats}
+
+
+def write_zip(fileobj, palettes, formats, lut_source=None):
+    # Stream palettes into a zip archive one member at a time. `palettes` may be a
+    # generator of (name, colors) pairs so only one palette is held in memory at once;
+    # `lut_source(name)` optionally supplies a full-resolution array for the NumPy LUT.
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, colors in palettes:
+            for fmt in formats:
+                suffix, _ = EXPORT_FORMATS[fmt]
+                if fmt == 'NumPy LUT' and lut_source is not None:
+                    payload = palette_to_npy(lut_source(name))
+                else:
+                    payload = EXPORTERS[fmt](colors)
+                with archive.open(f"{name}/{name}{suffix}", 'w') as member:
+                    member.write(payload)
+    return fileobj
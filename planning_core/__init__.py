@@ -0,0 +1,18 @@
+import importlib
+
+# The demand, capacity and waiting-list model shared by the Streamlit apps and headless jobs.
+# Submodules are imported on first attribute access, so `import planning_core` is nearly free
+# and a job only pays for the parts of the model it uses. pandas and plotly are never imported
+# here; see planning_core.lazy.
+
+__all__ = ['api', 'batch', 'capacity', 'compact', 'executors', 'forecast', 'groups', 'matching', 'packing', 'priority', 'projection', 'readers', 'replication', 'simulation', 'validation']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
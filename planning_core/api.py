@@ -0,0 +1,417 @@
+import argparse
+import asyncio
+import collections
+import hashlib
+import json
+import math
+import signal
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from planning_core import batch, replication, validation
+from planning_core.lazy import pd
+
+# HTTP/JSON service for the numbers appV3 computes (required sessions per week, expected cases
+# treated, end-of-year waiting list), so other tools can use the model without the Streamlit page.
+#
+#   python -m planning_core.api --procedures procedures.csv --port 8080 --workers 4
+#
+#   POST /v1/scenario    {"Sessions per Week": 12, "Utilisation": 0.85, "Site": "A"}
+#   POST /v1/scenarios   {"scenarios": [{...}, {...}]}
+#   GET  /v1/health
+#   GET  /v1/stats
+#
+# A scenario is any of batch.SCENARIO_DEFAULTS plus optional "Scenario", "Site" and "Specialty",
+# and an optional "procedures" list of records to run on instead of the server's file. The reply
+# is batch.run_scenario's result.
+#
+# The event loop only parses small requests and looks up results; a body over INLINE_BODY_BYTES is
+# parsed, and its inline procedures validated, in the worker process pool instead. Scenarios not
+# already in the result cache (keyed by a hash of the parameters and the procedure data) are
+# collected for up to --batch-window-ms and run as one batch.run_chunk call in the same pool, so the
+# model never runs on the loop and a burst of requests costs one round trip per batch rather than
+# one per request. Identical scenarios already in flight share one run.
+
+MAX_BODY_BYTES = 16 * 2 ** 20
+INLINE_BODY_BYTES = 64 * 2 ** 10
+KEEP_ALIVE_SECONDS = 30
+RESULT_LABELS = ['Scenario', 'Site', 'Specialty']
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 422: 'Unprocessable Entity', 503: 'Service Unavailable'}
+
+
+class RequestError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ResultCache:
+    # Least-recently-used map from scenario hash to result
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class ProcedureSet:
+    # Validated procedures with their per-(site, specialty) arrays built once on first use
+    def __init__(self, procedures):
+        self.procedures = procedures
+        self.digest = hashlib.sha256(pd.util.hash_pandas_object(procedures, index=False).to_numpy().tobytes()).hexdigest()
+        self.arrays = {}
+
+    @classmethod
+    def from_records(cls, records):
+        if not isinstance(records, list) or not records:
+            raise RequestError('"procedures" must be a non-empty list of records.')
+        clean, issues, _ = validation.validate_procedures(pd.DataFrame.from_records(records))
+        if len(issues):
+            first = issues.iloc[0]
+            raise RequestError(f"{len(issues)} problem(s) in procedures, e.g. record {first['Row'] - 1}: "
+                               f"{first['Problem']} in {first['Column']}.", status=422)
+        return cls(clean)
+
+    def select(self, site, specialty):
+        if (site, specialty) not in self.arrays:
+            if len(self.arrays) > 4096:
+                self.arrays.clear()  # requests naming endless made-up groups
+            selected = np.ones(len(self.procedures), dtype=bool)
+            for column, value in zip(validation.GROUP_COLUMNS, (site, specialty)):
+                if value is not None:
+                    if column not in self.procedures:
+                        raise RequestError(f"The procedures have no {column} column.", status=422)
+                    selected &= (self.procedures[column] == value).to_numpy()
+            self.arrays[(site, specialty)] = (
+                self.procedures['Annual Demand (Cases)'].to_numpy(dtype=float)[selected],
+                self.procedures['Average Duration (Hours)'].to_numpy(dtype=float)[selected],
+            )
+        return self.arrays[(site, specialty)]
+
+
+class PreparedProcedures:
+    # Inline procedures already validated in the worker pool: the ProcedureSet, or the error message
+    # and status to reply with
+    __slots__ = ('key', 'procedure_set', 'error')
+
+    def __init__(self, key, procedure_set=None, error=None):
+        self.key = key
+        self.procedure_set = procedure_set
+        self.error = error
+
+
+def _records_key(records):
+    return hashlib.sha256(json.dumps(records, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def prepare_request(path, body):
+    # Runs in the worker pool for large bodies: parses the JSON and validates each distinct inline
+    # procedure list, so neither ties up the event loop
+    payload = json.loads(body)
+    scenarios = payload.get('scenarios') if path == '/v1/scenarios' and isinstance(payload, dict) else [payload]
+    prepared = {}
+    for scenario in scenarios if isinstance(scenarios, list) else []:
+        if isinstance(scenario, dict) and scenario.get('procedures') is not None:
+            key = _records_key(scenario['procedures'])
+            if key not in prepared:
+                try:
+                    prepared[key] = PreparedProcedures(key, ProcedureSet.from_records(scenario['procedures']))
+                except RequestError as error:
+                    prepared[key] = PreparedProcedures(key, error=(str(error), error.status))
+            scenario['procedures'] = prepared[key]
+    return payload
+
+
+def _json_safe(result):
+    # inf (zero capacity) and NaN aren't valid JSON; NumPy scalars aren't serialisable
+    safe = {}
+    for key, value in result.items():
+        if isinstance(value, (float, np.floating)):
+            value = float(value) if math.isfinite(value) else None
+        elif isinstance(value, np.integer):
+            value = int(value)
+        safe[key] = value
+    return safe
+
+
+class ModelService:
+    def __init__(self, procedures=None, workers=None, max_batch=64, batch_window_ms=2.0, cache_entries=10000):
+        self.procedures = ProcedureSet(procedures) if procedures is not None else None
+        self.workers = workers
+        self.pool = replication.default_executor(workers)
+        self.max_batch = max_batch
+        self.batch_window = batch_window_ms / 1000
+        self.cache = ResultCache(cache_entries)
+        self.inline_procedures = ResultCache(64)
+        self.inflight = {}
+        self.pending = []
+        self.flush_handle = None
+        self.running = 0
+        self.stats = collections.Counter()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def _procedure_set(self, records):
+        if records is None:
+            if self.procedures is None:
+                raise RequestError('This server has no procedure file; send "procedures" with the scenario.')
+            return self.procedures
+        if isinstance(records, PreparedProcedures):
+            if records.error is not None:
+                raise RequestError(*records.error)
+            procedure_set = self.inline_procedures.get(records.key)
+            if procedure_set is None:
+                procedure_set = records.procedure_set
+                self.inline_procedures.put(records.key, procedure_set)
+            return procedure_set
+        key = _records_key(records)
+        procedure_set = self.inline_procedures.get(key)
+        if procedure_set is None:
+            procedure_set = ProcedureSet.from_records(records)
+            self.inline_procedures.put(key, procedure_set)
+        return procedure_set
+
+    def task(self, scenario):
+        # (cache key, batch task) for one scenario object, or RequestError if it is malformed
+        if not isinstance(scenario, dict):
+            raise RequestError('A scenario must be a JSON object.')
+        unknown = set(scenario) - set(batch.SCENARIO_DEFAULTS) - set(RESULT_LABELS) - {'procedures'}
+        if unknown:
+            raise RequestError(f"Unknown field(s): {', '.join(sorted(unknown))}. Expected any of: {', '.join(batch.SCENARIO_DEFAULTS)}.")
+        params = dict(batch.SCENARIO_DEFAULTS)
+        for column in batch.SCENARIO_DEFAULTS.keys() & scenario.keys():
+            value = scenario[column]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise RequestError(f"{column} must be a finite number, got {value!r}.")
+            params[column] = float(value)
+        site, specialty = (scenario.get(column) for column in validation.GROUP_COLUMNS)
+        if not all(value is None or isinstance(value, str) for value in (site, specialty)):
+            raise RequestError('Site and Specialty must be strings.')
+        procedure_set = self._procedure_set(scenario.get('procedures'))
+        cases, duration_hours = procedure_set.select(site, specialty)
+        key = hashlib.sha256(json.dumps([params, site, specialty, procedure_set.digest], sort_keys=True).encode()).hexdigest()
+        task = {'Scenario': scenario.get('Scenario'), 'Site': site or 'All', 'Specialty': specialty or 'All',
+                'params': params, 'cases': cases, 'duration_hours': duration_hours}
+        return key, task
+
+    async def evaluate(self, key, task):
+        # Returns (result, cached)
+        self.stats['scenarios'] += 1
+        labels = {'Scenario': task['Scenario'], 'Site': task['Site'], 'Specialty': task['Specialty']}
+        result = self.cache.get(key)
+        if result is not None:
+            return {**result, **labels}, True
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.inflight[key] = future
+            self.pending.append((key, task, future))
+            if len(self.pending) >= self.max_batch:
+                self._flush()
+            elif self.flush_handle is None:
+                self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        else:
+            self.stats['shared_runs'] += 1
+        result = await asyncio.shield(future)
+        return {**result, **labels}, False
+
+    def _flush(self):
+        # At most one batch per worker is in the pool at a time; while they are all busy, new
+        # scenarios keep collecting, so batches grow with load instead of queueing up behind each other
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        while self.pending and self.running < self.pool._max_workers:
+            pending, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            self.running += 1
+            asyncio.get_running_loop().create_task(self._run_batch(pending))
+
+    async def _run_batch(self, pending):
+        # One process-pool call per batch. Tasks for the same procedures share their arrays, and
+        # pickle sends a shared object once per call, so the procedure data crosses once per batch.
+        self.stats['batches'] += 1
+        self.stats['batched_scenarios'] += len(pending)
+        try:
+            rows = await asyncio.get_running_loop().run_in_executor(self.pool, batch.run_chunk, [task for _, task, _ in pending])
+        except BrokenProcessPool as error:
+            # A worker died (e.g. out of memory); start a fresh pool for the next batch
+            self.pool.shutdown(wait=False)
+            self.pool = replication.default_executor(self.workers)
+            rows = error
+        except Exception as error:
+            rows = error
+        finally:
+            self.running -= 1
+        if self.pending:
+            self._flush()
+        for index, (key, _, future) in enumerate(pending):
+            self.inflight.pop(key, None)
+            if future.done():
+                continue
+            if isinstance(rows, Exception):
+                future.set_exception(RequestError(f"Model run failed: {rows!r}", status=503))
+                continue
+            result = _json_safe({column: value for column, value in rows[index].items() if column not in RESULT_LABELS})
+            if result['Error'] is None:
+                self.cache.put(key, result)
+            future.set_result(result)
+
+    async def handle(self, method, path, body):
+        # (status, JSON-serialisable payload) for one request
+        self.stats['requests'] += 1
+        routes = {'/v1/scenario': 'POST', '/v1/scenarios': 'POST', '/v1/health': 'GET', '/v1/stats': 'GET'}
+        if path not in routes:
+            return 404, {'error': f"No route {path}. Try: {', '.join(routes)}."}
+        if method != routes[path]:
+            return 405, {'error': f"{path} expects {routes[path]}."}
+        if path == '/v1/health':
+            return 200, {'status': 'ok'}
+        if path == '/v1/stats':
+            return 200, self.stats_payload()
+        try:
+            if len(body) > INLINE_BODY_BYTES:
+                payload = await asyncio.get_running_loop().run_in_executor(self.pool, prepare_request, path, body)
+            else:
+                payload = json.loads(body or b'null')
+        except (ValueError, RecursionError) as error:  # RecursionError: arrays nested thousands deep
+            return 400, {'error': f"Invalid JSON: {error}"}
+        except BrokenProcessPool:
+            self.pool.shutdown(wait=False)
+            self.pool = replication.default_executor(self.workers)
+            return 503, {'error': 'The worker pool restarted; try again.'}
+        try:
+            if path == '/v1/scenario':
+                result, cached = await self.evaluate(*self.task(payload))
+                return (422 if result['Error'] else 200), {**result, 'Cached': cached}
+            if not isinstance(payload, dict) or not isinstance(payload.get('scenarios'), list):
+                raise RequestError('Expected {"scenarios": [...]}.')
+            # Every scenario is checked before any runs, so a bad one fails the whole request
+            tasks = [self.task(scenario) for scenario in payload['scenarios']]
+            outcomes = await asyncio.gather(*(self.evaluate(key, task) for key, task in tasks))
+            return 200, {'results': [{**result, 'Cached': cached} for result, cached in outcomes]}
+        except RequestError as error:
+            return error.status, {'error': str(error)}
+
+    def stats_payload(self):
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            **self.stats,
+            'cache_entries': len(self.cache.entries),
+            'cache_hit_rate': self.cache.hits / lookups if lookups else None,
+            'mean_batch_size': self.stats['batched_scenarios'] / self.stats['batches'] if self.stats['batches'] else None,
+            'in_flight': len(self.inflight),
+        }
+
+    async def serve_connection(self, reader, writer):
+        # Minimal HTTP/1.1: Content-Length bodies and keep-alive, which is all JSON clients need
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                    headers = {}
+                    while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed HTTP request.'}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': f"Body over {MAX_BODY_BYTES} bytes."}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, payload = await self.handle(method, path.split('?', 1)[0], body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = json.dumps(payload, allow_nan=False).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+
+async def serve(service, host='127.0.0.1', port=8080, ready=None):
+    # Runs until SIGINT or SIGTERM, so the caller can shut the worker pool down rather than orphan it
+    stop = asyncio.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+        except NotImplementedError:  # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    if ready:
+        ready(server.sockets[0].getsockname())
+    async with server:
+        await stop.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the planning model over HTTP/JSON.')
+    parser.add_argument('--procedures', help='procedure CSV used when a request has no "procedures"')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, help='model worker processes (default: CPU count)')
+    parser.add_argument('--max-batch', type=int, default=64, help='scenarios per process-pool call')
+    parser.add_argument('--batch-window-ms', type=float, default=2.0, help='how long to collect a batch')
+    parser.add_argument('--cache-entries', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    procedures = None
+    if args.procedures:
+        with open(args.procedures, 'rb') as fh:
+            procedures, issues, _ = validation.read_and_validate_procedures(fh.read())
+        if len(issues):
+            print(f"{len(issues)} problems in {args.procedures}; those rows were left out.", file=sys.stderr)
+    service = ModelService(procedures, args.workers, args.max_batch, args.batch_window_ms, args.cache_entries)
+    started = time.perf_counter()
+
+    def ready(address):
+        print(f"Serving on http://{address[0]}:{address[1]} ({time.perf_counter() - started:.1f} s)", file=sys.stderr, flush=True)
+
+    try:
+        asyncio.run(serve(service, args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
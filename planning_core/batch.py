@@ -0,0 +1,193 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from planning_core import capacity, executors, projection, simulation, validation
+from planning_core.lazy import pd
+
+# Headless batch runs of the planning model: every scenario in a table, optionally for every site
+# and specialty in the procedure data, spread over a pluggable executor in chunks.
+#
+#   python -m planning_core.batch procedures.csv scenarios.csv -o results.csv --executor local --workers 8
+#   python -m planning_core.batch procedures.csv scenarios.csv -o results.csv --executor distributed --listen 0.0.0.0:6000
+#   python -m planning_core.batch procedures.csv scenarios.csv -o results.csv --executor distributed --local-workers 4
+#
+# Each scenario row names a `Scenario` and overrides any of SCENARIO_DEFAULTS; optional `Site` and
+# `Specialty` columns restrict a row to that group. With --per-group every scenario is also run for
+# each site × specialty, with its sessions and starting waiting list split by the group's share of
+# demand (as in appV3's site and specialty section).
+
+SCENARIO_DEFAULTS = {
+    'Demand Multiplier': 1.0,
+    'Weeks per Year': 48,
+    'Sessions per Week': 10.0,
+    'Session Duration (Hours)': 4.0,
+    'Utilisation': 0.8,
+    'Waiting List Start': 500,
+    '% Breaching Target': 0.2,
+    '% of Cases Used to Treat Breaches': 0.3,
+    'Simulation Random Seed': 0,
+    'Projection Years': 1,
+    'Demand Growth (%)': 0.0,
+    'Capacity Change (%)': 0.0,
+}
+EXECUTORS = ['inline', 'local', 'distributed']
+
+
+def run_scenario(params, cases, duration_hours):
+    # The headline numbers appV3 reports for next year, plus the end of the projection horizon
+    if not len(cases):
+        raise ValueError('No procedures match this scenario\'s site and specialty.')
+    demand_cases = cases * params['Demand Multiplier']
+    case_minutes = duration_hours * 60
+    demand_minutes = (demand_cases * case_minutes).sum()
+    weeks, sessions = params['Weeks per Year'], params['Sessions per Week']
+    session_hours, utilisation = params['Session Duration (Hours)'], params['Utilisation']
+    capacity_minutes = capacity.session_minutes(weeks, sessions, session_hours, utilisation)
+
+    case_rows, _, minutes_treated = simulation.simulate_cases(
+        demand_cases, duration_hours, capacity_minutes, int(params['Simulation Random Seed'])
+    )
+    waiting_list = capacity.waiting_list_year(
+        params['Waiting List Start'], params['% Breaching Target'], demand_cases.sum(),
+        capacity_minutes, params['% of Cases Used to Treat Breaches'], case_minutes.mean()
+    )
+
+    years = max(int(params['Projection Years']), 1)
+    demand_factors = np.cumprod(np.r_[1.0, np.full(years - 1, 1 + params['Demand Growth (%)'] / 100)])
+    capacity_by_year = capacity_minutes * np.cumprod(np.r_[1.0, np.full(years - 1, 1 + params['Capacity Change (%)'] / 100)])
+    start_cases = params['Waiting List Start'] * cases / max(cases.sum(), 1)
+    projected = projection.project_years(demand_cases, case_minutes, start_cases, demand_factors, capacity_by_year)
+
+    return {
+        'Procedures': len(cases),
+        'Next Year Demand (Cases)': demand_cases.sum(),
+        'Next Year Demand (Minutes)': demand_minutes,
+        'Capacity (Minutes)': capacity_minutes,
+        'Required Sessions per Week': capacity.required_sessions_per_week(demand_minutes, weeks, session_hours, utilisation),
+        'Expected Cases Treated': len(case_rows),
+        'Expected Minutes Treated': minutes_treated,
+        'Waiting List at End of Year': waiting_list['Waiting List End'],
+        'Breaches at End of Year': waiting_list['Breaches End'],
+        'Waiting List at End of Projection': projected[-1]['Waiting List End'].sum(),
+    }
+
+
+def run_chunk(tasks):
+    # Scenario errors (e.g. an empty site filter) are deterministic, so they are reported per row
+    # rather than raised, which would make the executor retry the whole chunk. Zero capacity gives
+    # inf required sessions, as in the apps.
+    rows = []
+    for task in tasks:
+        labels = {key: task[key] for key in ('Scenario', 'Site', 'Specialty')}
+        try:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rows.append({**labels, **run_scenario(task['params'], task['cases'], task['duration_hours']), 'Error': None})
+        except (ArithmeticError, ValueError) as error:
+            rows.append({**labels, 'Error': repr(error)})
+    return rows
+
+
+def build_tasks(procedures, scenarios, per_group=False):
+    # One task per scenario (and group): its parameters and the procedure arrays it runs on
+    scenarios = scenarios.copy()
+    for column, default in SCENARIO_DEFAULTS.items():
+        scenarios[column] = pd.to_numeric(scenarios[column], errors='raise') if column in scenarios else default
+        scenarios[column] = scenarios[column].fillna(default)
+    if 'Scenario' not in scenarios:
+        scenarios['Scenario'] = [f"Scenario {i + 1}" for i in range(len(scenarios))]
+    for column in validation.GROUP_COLUMNS:
+        if column not in procedures:
+            procedures = procedures.assign(**{column: 'All'})
+
+    minutes = procedures['Annual Demand (Cases)'] * procedures['Average Duration (Hours)'] * 60
+    group_index = procedures.groupby(validation.GROUP_COLUMNS, sort=True).indices
+    group_minutes = minutes.groupby([procedures[column] for column in validation.GROUP_COLUMNS]).sum()
+    group_cases = procedures.groupby(validation.GROUP_COLUMNS)['Annual Demand (Cases)'].sum()
+    cases = procedures['Annual Demand (Cases)'].to_numpy(dtype=float)
+    duration_hours = procedures['Average Duration (Hours)'].to_numpy(dtype=float)
+
+    tasks = []
+    for scenario in scenarios.to_dict('records'):
+        params = {column: float(scenario[column]) for column in SCENARIO_DEFAULTS}
+        site, specialty = (str(scenario[column]) if pd.notna(scenario.get(column)) and scenario.get(column) != '' else None
+                           for column in validation.GROUP_COLUMNS)
+        if site or specialty:
+            selected = np.flatnonzero(((procedures['Site'] == site) if site else True) & ((procedures['Specialty'] == specialty) if specialty else True))
+            groups = [(site or 'All', specialty or 'All', selected, params)]
+        elif per_group:
+            groups = []
+            for (group_site, group_specialty), rows in group_index.items():
+                minutes_share = group_minutes[(group_site, group_specialty)] / max(group_minutes.sum(), 1)
+                cases_share = group_cases[(group_site, group_specialty)] / max(group_cases.sum(), 1)
+                group_params = {**params,
+                                'Sessions per Week': params['Sessions per Week'] * minutes_share,
+                                'Waiting List Start': params['Waiting List Start'] * cases_share}
+                groups.append((group_site, group_specialty, rows, group_params))
+        else:
+            groups = [('All', 'All', np.arange(len(procedures)), params)]
+        for group_site, group_specialty, rows, group_params in groups:
+            tasks.append({
+                'Scenario': scenario['Scenario'], 'Site': group_site, 'Specialty': group_specialty,
+                'params': group_params, 'cases': cases[rows], 'duration_hours': duration_hours[rows],
+            })
+    return tasks
+
+
+def run_batch(procedures, scenarios, executor, per_group=False, chunk_size=50):
+    tasks = build_tasks(procedures, scenarios, per_group)
+    chunks = [tasks[start:start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+    results = executor.map_chunks(run_chunk, chunks)
+    return pd.DataFrame([row for chunk_rows in results for row in chunk_rows])
+
+
+def make_executor(kind, workers=None, listen=None, local_workers=0, max_retries=2, task_timeout=600):
+    if kind == 'inline':
+        return executors.InlineExecutor()
+    if kind == 'local':
+        return executors.LocalExecutor(workers, max_retries)
+    # Loopback unless an address is given, so a run with only local workers isn't reachable from
+    # other machines; remote workers need an explicit listen address such as 0.0.0.0:6000
+    address = executors.parse_address(listen or f"127.0.0.1:{executors.DEFAULT_PORT}")
+    return executors.DistributedExecutor(address, max_retries=max_retries, task_timeout=task_timeout, local_workers=local_workers)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the planning model for every scenario in a table.')
+    parser.add_argument('procedures', help='procedure CSV (Procedure, Annual Demand (Cases), Average Duration (Hours), optional Site/Specialty)')
+    parser.add_argument('scenarios', help='scenario CSV: a Scenario column plus any parameters to override')
+    parser.add_argument('-o', '--output', default='batch-results.csv')
+    parser.add_argument('--per-group', action='store_true', help='also run every scenario for each site × specialty')
+    parser.add_argument('--executor', choices=EXECUTORS, default='local')
+    parser.add_argument('--workers', type=int, help='local pool size (default: CPU count)')
+    parser.add_argument('--listen', help=f'coordinator address for distributed runs (default 127.0.0.1:{executors.DEFAULT_PORT}, '
+                                         'which only workers on this machine can reach; set it for remote workers)')
+    parser.add_argument('--local-workers', type=int, default=0, help='distributed: also start this many workers on this machine')
+    parser.add_argument('--chunk-size', type=int, default=50, help='scenarios per chunk sent to a worker')
+    parser.add_argument('--max-retries', type=int, default=2)
+    parser.add_argument('--task-timeout', type=float, default=600, help='distributed: seconds before a chunk is reassigned')
+    args = parser.parse_args(argv)
+
+    with open(args.procedures, 'rb') as fh:
+        procedures, issues, _ = validation.read_and_validate_procedures(fh.read())
+    if len(issues):
+        print(f"{len(issues)} problems in {args.procedures}; those rows were left out.", file=sys.stderr)
+    scenarios = pd.read_csv(args.scenarios)
+
+    start = time.perf_counter()
+    with make_executor(args.executor, args.workers, args.listen, args.local_workers, args.max_retries, args.task_timeout) as executor:
+        if args.executor == 'distributed':
+            print(f"Coordinator listening on {executor.address[0]}:{executor.address[1]}", file=sys.stderr)
+            if args.listen is None and not args.local_workers:
+                print("Only workers on this machine can connect; pass --listen HOST:PORT for remote workers.", file=sys.stderr)
+        results = run_batch(procedures, scenarios, executor, args.per_group, args.chunk_size)
+    results.to_csv(args.output, index=False)
+    failed = int(results['Error'].notna().sum()) if 'Error' in results else 0
+    print(f"{len(results)} scenario runs in {time.perf_counter() - start:.1f} s ({failed} with errors) -> {args.output}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
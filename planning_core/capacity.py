@@ -0,0 +1,34 @@
+# Session capacity and the one-year waiting list model. Plain arithmetic on scalars or NumPy
+# arrays, so the same functions serve the apps, batch jobs and vectorised what-if grids.
+
+
+def session_minutes(weeks, sessions_per_week, session_duration_hours, utilisation):
+    # Usable theatre minutes for a year after utilisation
+    return weeks * sessions_per_week * session_duration_hours * 60 * utilisation
+
+
+def required_sessions_per_week(demand_minutes, weeks, session_duration_hours, utilisation):
+    # Sessions per week needed to provide `demand_minutes` over the year
+    return demand_minutes / (weeks * session_duration_hours * 60 * utilisation)
+
+
+def waiting_list_year(waiting_list_start, breaching_share, additions, capacity_minutes, breach_capacity_share, minutes_per_case):
+    # Breaching cases are treated from their share of capacity, everyone else (including the year's
+    # additions) from the rest; neither group can be treated below zero
+    breaches_start = waiting_list_start * breaching_share
+    non_breaches_start = waiting_list_start - breaches_start + additions
+    breach_capacity_cases = capacity_minutes * breach_capacity_share / minutes_per_case
+    other_capacity_cases = capacity_minutes * (1 - breach_capacity_share) / minutes_per_case
+    breaches_treated = min(breaches_start, breach_capacity_cases)
+    non_breaches_treated = min(non_breaches_start, other_capacity_cases)
+    return {
+        'Breaches Start': breaches_start,
+        'Non-Breaches Start': non_breaches_start,
+        'Breach Capacity (Cases)': breach_capacity_cases,
+        'Other Capacity (Cases)': other_capacity_cases,
+        'Breaches Treated': breaches_treated,
+        'Non-Breaches Treated': non_breaches_treated,
+        'Breaches End': breaches_start - breaches_treated,
+        'Non-Breaches End': non_breaches_start - non_breaches_treated,
+        'Waiting List End': breaches_start - breaches_treated + non_breaches_start - non_breaches_treated,
+    }
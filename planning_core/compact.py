@@ -0,0 +1,166 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from planning_core import validation
+from planning_core.lazy import pd
+
+# Opt-in compact demand table for very large uploads. Names and groups are categoricals, case counts
+# int32 (when whole and in range) and durations float32. The derived demand columns (minutes, next
+# year's cases and minutes) are not stored: derived_column computes one from the base columns when
+# it is used, so a materialised float64 table's four extra columns never exist.
+#
+# float32 keeps about 7 significant digits per row. Totals are always accumulated in float64, so
+# the error stays at the per-row rounding of durations (about 1e-7 relative) rather than growing
+# with the number of rows; precision_report measures it against the float64 table.
+#
+#   python -m planning_core.compact procedures.csv --multiplier 1.1
+
+CATEGORY_COLUMNS = ['Procedure'] + validation.GROUP_COLUMNS
+DERIVED_COLUMNS = ['Annual Demand (Minutes)', 'Next Year Demand (Cases)', 'Next Year Demand (Minutes)']
+_INT32_MAX = np.iinfo(np.int32).max
+
+
+def is_compact(df):
+    return df['Average Duration (Hours)'].dtype == np.float32
+
+
+def compact_procedures(df):
+    # The compact copy of a procedure table; any materialised derived columns are dropped
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in DERIVED_COLUMNS:
+            continue
+        if column in CATEGORY_COLUMNS:
+            values = values.astype('category')
+        elif column == 'Annual Demand (Cases)':
+            numbers = values.to_numpy(dtype=np.float64)
+            whole = np.all(numbers == np.round(numbers)) and (not len(numbers) or (numbers.min() >= 0 and numbers.max() <= _INT32_MAX))
+            values = values.astype(np.int32 if whole else np.float32)
+        elif np.issubdtype(values.dtype, np.floating):
+            values = values.astype(np.float32)
+        columns[column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def derived_column(df, name, multipliers=1.0):
+    # A derived demand column: the stored one if the table has it, otherwise computed now in the
+    # table's precision. `multipliers` is next year's multiplier, one value or one per row.
+    if name in df:
+        return df[name]
+    if name not in DERIVED_COLUMNS:
+        raise KeyError(name)
+    dtype = np.float32 if is_compact(df) else np.float64
+    cases = df['Annual Demand (Cases)'].to_numpy(dtype=dtype)
+    hours = df['Average Duration (Hours)'].to_numpy(dtype=dtype)
+    if name == 'Annual Demand (Minutes)':
+        values = cases * hours * dtype(60)
+    else:
+        values = cases * np.asarray(multipliers, dtype=dtype)
+        if name == 'Next Year Demand (Minutes)':
+            values = values * hours * dtype(60)
+    return pd.Series(values, index=df.index, name=name)
+
+
+def with_derived(df, columns, multipliers=1.0):
+    # A frame of just `columns`, computing any derived ones that aren't stored
+    return pd.DataFrame({column: derived_column(df, column, multipliers) if column in DERIVED_COLUMNS else df[column] for column in columns})
+
+
+def column_total(values):
+    return float(np.sum(np.asarray(values), dtype=np.float64))
+
+
+def group_totals(df, columns, multipliers=1.0):
+    # Sums of `columns` per site × specialty (float64 accumulation), from the categorical codes
+    # when the table is compact rather than hashing the labels
+    by = [column for column in validation.GROUP_COLUMNS if column in df]
+    values = with_derived(df, columns, multipliers)
+    if not all(isinstance(df[column].dtype, pd.CategoricalDtype) for column in by):
+        return values.astype(np.float64).groupby([df[column] for column in by], sort=True).sum()
+    codes = [df[column].cat.codes.to_numpy() for column in by]
+    shape = [len(df[column].cat.categories) for column in by]
+    key = np.ravel_multi_index(codes, shape)
+    present = np.unique(key)
+    index = pd.MultiIndex.from_arrays(
+        [df[column].cat.categories.take(level) for column, level in zip(by, np.unravel_index(present, shape))], names=by
+    )
+    return pd.DataFrame({
+        column: np.bincount(key, weights=values[column].to_numpy(dtype=np.float64), minlength=int(np.prod(shape)))[present]
+        for column in columns
+    }, index=index)
+
+
+def demand_totals(df, multipliers=1.0):
+    # Derived demand totals per site × specialty when the table has groups, else overall
+    if any(column in df for column in validation.GROUP_COLUMNS):
+        return group_totals(df, DERIVED_COLUMNS, multipliers)
+    return {column: column_total(derived_column(df, column, multipliers)) for column in DERIVED_COLUMNS}
+
+
+def memory_bytes(df):
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def precision_report(df, multipliers=1.0):
+    # Totals and per-row values of the derived columns in float64 and in compact mode, and the
+    # memory of each table (the float64 one with its derived columns materialised)
+    full = df[[column for column in df.columns if column not in DERIVED_COLUMNS]].copy()
+    for column in ['Annual Demand (Cases)', 'Average Duration (Hours)']:
+        full[column] = full[column].astype(np.float64)
+    multipliers = np.asarray(multipliers, dtype=np.float64)
+    for column in DERIVED_COLUMNS:
+        full[column] = derived_column(full, column, multipliers)
+    small = compact_procedures(df)
+
+    rows = []
+    for column in DERIVED_COLUMNS:
+        exact = full[column].to_numpy()
+        approximate = derived_column(small, column, multipliers).to_numpy(dtype=np.float64)
+        exact_total, approximate_total = column_total(exact), column_total(approximate)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            row_errors = np.abs(approximate - exact) / np.abs(exact)
+        rows.append({
+            'Column': column,
+            'Total (float64)': exact_total,
+            'Total (Compact)': approximate_total,
+            'Total Difference': approximate_total - exact_total,
+            'Total Relative Difference': abs(approximate_total - exact_total) / abs(exact_total) if exact_total else 0.0,
+            'Largest Row Relative Difference': float(np.nanmax(row_errors[exact != 0])) if np.any(exact != 0) else 0.0,
+        })
+    memory = {'float64 (MB)': memory_bytes(full) / 2 ** 20, 'Compact (MB)': memory_bytes(small) / 2 ** 20}
+    memory['Saving (%)'] = 100 * (1 - memory['Compact (MB)'] / memory['float64 (MB)']) if memory['float64 (MB)'] else 0.0
+    return pd.DataFrame(rows), memory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the compact demand table with float64 on a procedure file.')
+    parser.add_argument('procedures', help='procedure CSV (Procedure, Annual Demand (Cases), Average Duration (Hours), optional Site/Specialty)')
+    parser.add_argument('--multiplier', type=float, default=1.0, help="next year's demand multiplier")
+    parser.add_argument('--repeat', type=int, default=5, help='timed repeats of the group aggregation; the best is reported')
+    args = parser.parse_args(argv)
+
+    with open(args.procedures, 'rb') as fh:
+        df, issues, _ = validation.read_and_validate_procedures(fh.read())
+    if len(issues):
+        print(f"{len(issues)} problems in {args.procedures}; those rows were left out.", file=sys.stderr)
+    accuracy, memory = precision_report(df, args.multiplier)
+    print(f"{len(df)} procedure rows; memory {memory['float64 (MB)']:.1f} MB float64 -> {memory['Compact (MB)']:.1f} MB compact ({memory['Saving (%)']:.0f}% less)")
+    print(accuracy.to_string(index=False))
+
+    small = compact_procedures(df)
+    for label, table in (('float64', df), ('compact', small)):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            demand_totals(table, args.multiplier)
+            timings.append(time.perf_counter() - start)
+        print(f"aggregation ({label}): {min(timings) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
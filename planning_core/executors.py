@@ -0,0 +1,295 @@
+import argparse
+import concurrent.futures
+import importlib
+import os
+import queue
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Client, Listener
+
+from planning_core import replication
+
+# Pluggable executors for batch runs. Each one maps a module-level function over a list of chunks
+# and returns the results in chunk order, retrying chunks that fail for infrastructure reasons:
+#
+#   InlineExecutor       in this process, for debugging and tiny runs
+#   LocalExecutor        a process pool on this machine
+#   DistributedExecutor  a coordinator that hands chunks to workers on any number of hosts
+#
+# Distributed workers connect to the coordinator with multiprocessing.connection, authenticated by
+# a shared key (HMAC challenge), and receive one pickled chunk at a time. Only run workers against
+# coordinators you trust: chunks and results are pickles.
+#
+#   python -m planning_core.executors --connect coordinator-host:6000 --processes 8
+#
+# with the key in PLANNING_BATCH_AUTHKEY. A worker that disconnects, times out or crashes has its
+# chunk put back on the queue for another worker, up to max_retries times.
+
+AUTHKEY_ENV_VAR = 'PLANNING_BATCH_AUTHKEY'
+DEFAULT_PORT = 6000
+
+
+def function_name(func):
+    # Importable name of a module-level function; under `python -m` its module is __main__ here but
+    # the real module name on the workers
+    module = func.__module__
+    if module == '__main__' and getattr(sys.modules['__main__'], '__spec__', None):
+        module = sys.modules['__main__'].__spec__.name
+    return f"{module}:{func.__qualname__}"
+
+
+def resolve_function(name):
+    module, _, qualname = name.partition(':')
+    target = importlib.import_module(module)
+    for attr in qualname.split('.'):
+        target = getattr(target, attr)
+    return target
+
+
+class ChunkFailed(RuntimeError):
+    pass
+
+
+class InlineExecutor:
+    def __init__(self, max_retries=0):
+        self.max_retries = max_retries
+
+    def map_chunks(self, func, chunks):
+        return [func(chunk) for chunk in chunks]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+class LocalExecutor(InlineExecutor):
+    def __init__(self, workers=None, max_retries=2):
+        super().__init__(max_retries)
+        self.workers = workers or os.cpu_count()
+        self.pool = replication.default_executor(self.workers)
+
+    def map_chunks(self, func, chunks):
+        results = [None] * len(chunks)
+        attempts = [0] * len(chunks)
+        pending = {self.pool.submit(func, chunk): index for index, chunk in enumerate(chunks)}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future not in pending:
+                    continue  # already resubmitted after the pool broke
+                index = pending.pop(future)
+                try:
+                    results[index] = future.result()
+                except Exception as error:
+                    attempts[index] += 1
+                    if attempts[index] > self.max_retries:
+                        raise ChunkFailed(f"Chunk {index} failed after {attempts[index]} attempts: {error!r}") from error
+                    if isinstance(error, BrokenProcessPool):
+                        # A worker died and took the pool with it; every chunk still in flight is lost too
+                        self.pool.shutdown(wait=False)
+                        self.pool = replication.default_executor(self.workers)
+                        lost = list(pending.values())
+                        pending = {self.pool.submit(func, chunks[lost_index]): lost_index for lost_index in lost}
+                    pending[self.pool.submit(func, chunks[index])] = index
+        return results
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class DistributedExecutor(InlineExecutor):
+    def __init__(self, address=('127.0.0.1', DEFAULT_PORT), authkey=None, max_retries=2, task_timeout=600,
+                 idle_timeout=60, local_workers=0):
+        super().__init__(max_retries)
+        authkey = authkey or os.environ.get(AUTHKEY_ENV_VAR)
+        if not authkey:
+            authkey = secrets.token_hex(16) if local_workers else None
+        if not authkey:
+            raise ValueError(f"Distributed runs need a shared key: pass authkey or set {AUTHKEY_ENV_VAR}.")
+        self.authkey = authkey.encode() if isinstance(authkey, str) else authkey
+        self.task_timeout = task_timeout
+        self.idle_timeout = idle_timeout
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.tasks = queue.Queue()
+        self.workers = {}
+        self.lock = threading.Condition()
+        self.closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+        self.local_processes = spawn_local_workers(local_workers, self.address, self.authkey) if local_workers else []
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except Exception:  # failed handshake, or the listener was closed
+                if self.closed:
+                    return
+                continue
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            with self.lock:
+                self.workers[thread] = conn
+                self.lock.notify_all()
+            thread.start()
+
+    def _serve(self, conn):
+        # Feed one worker until it fails or the executor closes
+        try:
+            while not self.closed:
+                try:
+                    job, index, attempt = self.tasks.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                try:
+                    conn.send(('task', index, job['func'], job['chunks'][index]))
+                    if not conn.poll(self.task_timeout):
+                        raise TimeoutError(f"no result within {self.task_timeout} s")
+                    kind, _, payload = conn.recv()
+                except (OSError, EOFError, TimeoutError) as error:
+                    self._failed(job, index, attempt, f"worker lost: {error!r}")
+                    return
+                if kind == 'result':
+                    self._done(job, index, payload)
+                else:
+                    self._failed(job, index, attempt, payload)
+            conn.send(('stop',))
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+            with self.lock:
+                self.workers.pop(threading.current_thread(), None)
+                self.lock.notify_all()
+
+    def _done(self, job, index, result):
+        with self.lock:
+            job['results'][index] = result
+            job['remaining'] -= 1
+            self.lock.notify_all()
+
+    def _failed(self, job, index, attempt, error):
+        with self.lock:
+            if attempt < self.max_retries:
+                self.tasks.put((job, index, attempt + 1))
+            else:
+                job['failures'][index] = error
+                job['remaining'] -= 1
+            self.lock.notify_all()
+
+    def map_chunks(self, func, chunks):
+        job = {'func': function_name(func), 'chunks': list(chunks), 'results': [None] * len(chunks),
+               'failures': {}, 'remaining': len(chunks)}
+        for index in range(len(chunks)):
+            self.tasks.put((job, index, 0))
+        idle_since = None
+        with self.lock:
+            while job['remaining']:
+                self.lock.wait(timeout=1.0)
+                if self.workers:
+                    idle_since = None
+                elif idle_since is None:
+                    idle_since = time.monotonic()
+                elif time.monotonic() - idle_since > self.idle_timeout:
+                    raise ChunkFailed(f"No workers connected to {self.address} for {self.idle_timeout} s.")
+        if job['failures']:
+            index, error = next(iter(job['failures'].items()))
+            raise ChunkFailed(f"{len(job['failures'])} chunk(s) failed after {self.max_retries + 1} attempts; chunk {index}: {error}")
+        return job['results']
+
+    def close(self):
+        self.closed = True
+        with self.lock:
+            threads = list(self.workers)
+        for thread in threads:
+            thread.join(timeout=2.0)
+        self.listener.close()
+        for process in self.local_processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def spawn_local_workers(n, address, authkey):
+    # Worker processes on this machine, as a stand-in for remote hosts. The key goes through the
+    # environment rather than the command line so it doesn't show up in process listings.
+    host, port = address
+    env = {**os.environ, AUTHKEY_ENV_VAR: authkey.decode() if isinstance(authkey, bytes) else authkey}
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+    connect_host = '127.0.0.1' if host in ('0.0.0.0', '') else host
+    return [
+        subprocess.Popen([sys.executable, '-m', 'planning_core.executors', '--connect', f"{connect_host}:{port}"], env=env)
+        for _ in range(n)
+    ]
+
+
+def run_worker(address, authkey, connect_timeout=60):
+    # Connect (retrying while the coordinator starts), then run chunks until told to stop
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+    functions = {}
+    with conn:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message[0] == 'stop':
+                return
+            _, index, name, chunk = message
+            try:
+                if name not in functions:
+                    functions[name] = resolve_function(name)
+                reply = ('result', index, functions[name](chunk))
+            except Exception:
+                reply = ('error', index, traceback.format_exc())
+            try:
+                conn.send(reply)
+            except OSError:
+                return  # the coordinator gave up on this chunk and dropped the connection
+
+
+def parse_address(text, default_host='127.0.0.1'):
+    host, _, port = text.rpartition(':')
+    return host or default_host, int(port or DEFAULT_PORT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run batch workers for a distributed planning run.')
+    parser.add_argument('--connect', required=True, help='coordinator address, host:port')
+    parser.add_argument('--processes', type=int, default=1, help='worker processes to start on this host')
+    parser.add_argument('--connect-timeout', type=float, default=60, help='seconds to keep retrying the connection')
+    args = parser.parse_args(argv)
+
+    authkey = os.environ.get(AUTHKEY_ENV_VAR)
+    if not authkey:
+        parser.error(f"set {AUTHKEY_ENV_VAR} to the coordinator's key")
+    address = parse_address(args.connect)
+    if args.processes > 1:
+        processes = spawn_local_workers(args.processes, address, authkey)
+        return max(process.wait() for process in processes)
+    run_worker(address, authkey.encode(), args.connect_timeout)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
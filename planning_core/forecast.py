@@ -0,0 +1,90 @@
+import io
+
+import numpy as np
+
+from planning_core.lazy import pd
+
+HISTORY_COLUMNS = ['Procedure', 'Month', 'Cases']
+
+
+# Forecast the next 12 months for every series at once from a (series, months) array, oldest month first.
+# Linear trend fitted by least squares for all series in one solve, scaled by a month-of-year seasonal
+# index once there are at least two full years of history. With the index, the trend is fitted alongside
+# sum-to-zero month-of-year terms, so a seasonal swing doesn't tilt the slope.
+def forecast_linear_seasonal(history, periods=12, season_length=12):
+    months = history.shape[1]
+    t = np.arange(months)
+    design = np.column_stack([np.ones(months), t])
+    seasonal_fit = months >= 2 * season_length
+    if seasonal_fit:
+        month_of_year = np.eye(season_length)[t % season_length]
+        design = np.column_stack([design, month_of_year[:, 1:] - month_of_year[:, :1]])
+    coefficients = np.linalg.lstsq(design, history.T, rcond=None)[0][:2]
+    future_t = np.arange(months, months + periods)
+    future = np.column_stack([np.ones(periods), future_t]) @ coefficients
+
+    if seasonal_fit:
+        trend = design[:, :2] @ coefficients
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = np.where(trend > 0, history.T / trend, 0.0)
+            fitted = (trend > 0).astype(float)
+            seasonal = (month_of_year.T @ ratios) / (month_of_year.T @ fitted)
+            seasonal = seasonal / (np.nansum(seasonal, axis=0) / np.isfinite(seasonal).sum(axis=0))
+        seasonal = np.nan_to_num(seasonal, nan=1.0, posinf=1.0, neginf=1.0)
+        future = future * seasonal[future_t % season_length]
+    return np.clip(future, 0, None).T
+
+
+# Holt's linear exponential smoothing, vectorized across series
+def forecast_holt(history, periods=12, alpha=0.3, beta=0.1):
+    level = history[:, 0].astype(float)
+    trend = history[:, 1] - history[:, 0] if history.shape[1] > 1 else np.zeros(len(history))
+    for month in range(1, history.shape[1]):
+        previous_level = level
+        level = alpha * history[:, month] + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+    return np.clip(level[:, None] + trend[:, None] * np.arange(1, periods + 1), 0, None)
+
+
+FORECAST_METHODS = {
+    'Linear Trend + Seasonal Index': forecast_linear_seasonal,
+    'Exponential Smoothing (Holt)': forecast_holt,
+}
+
+
+# Per-procedure multiplier = forecast for the next 12 months / activity over the last 12 months.
+# Each series is fitted from its own first month, so a procedure added part way through the file
+# isn't fitted to months of zeros. With less than a year of history the last months are annualised,
+# so both sides of the ratio cover 12 months; series shorter than MIN_HISTORY_MONTHS get no
+# multiplier (NaN), and the app falls back to the manual one.
+MIN_HISTORY_MONTHS = 6
+
+
+def forecast_multipliers(file_bytes, method):
+    history_df = pd.read_csv(io.BytesIO(file_bytes), usecols=HISTORY_COLUMNS)
+    history_df['Month'] = pd.to_datetime(history_df['Month']).dt.to_period('M')
+    all_months = pd.period_range(history_df['Month'].min(), history_df['Month'].max(), freq='M')
+    history = history_df.pivot_table(index='Procedure', columns='Month', values='Cases', aggfunc='sum', fill_value=0)
+    history = history.reindex(columns=all_months, fill_value=0)
+    first_month = all_months.get_indexer(history_df.groupby('Procedure')['Month'].min().reindex(history.index))
+    months_of_history = len(all_months) - first_month
+
+    values = history.to_numpy(dtype=float)
+    next_12_months = np.full(len(history), np.nan)
+    # Series starting in the same month are fitted together, still one vectorized call per start
+    for start in np.unique(first_month[months_of_history >= MIN_HISTORY_MONTHS]):
+        rows = first_month == start
+        next_12_months[rows] = FORECAST_METHODS[method](values[rows, start:]).sum(axis=1)
+
+    window = np.minimum(months_of_history, 12)
+    recent = np.where(np.arange(len(all_months))[None, :] >= len(all_months) - window[:, None], values, 0.0)
+    last_12_months = recent.sum(axis=1) * 12 / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        multipliers = np.where(last_12_months > 0, next_12_months / last_12_months, np.nan)
+    return pd.DataFrame({
+        'Procedure': history.index,
+        'Months of History': months_of_history,
+        'Last 12 Months (Cases)': last_12_months,
+        'Forecast Next 12 Months (Cases)': next_12_months,
+        'Multiplier': multipliers,
+    })
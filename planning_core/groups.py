@@ -0,0 +1,45 @@
+import numpy as np
+
+# Site × specialty breakdown of demand, capacity and the waiting list
+
+GROUP_COLUMNS = ['Site', 'Specialty']
+GROUP_SUM_COLUMNS = [
+    'Procedures',
+    'Annual Demand (Cases)',
+    'Next Year Demand (Cases)',
+    'Next Year Demand (Minutes)',
+    'Sessions per Week',
+    'Capacity (Minutes)',
+    'Required Sessions per Week',
+    'Waiting List Start',
+    'Expected Cases Treated',
+    'Waiting List End',
+]
+
+
+# One groupby pass over all procedures, then vectorized capacity and waiting-list calculations per group
+def compute_group_aggregates(demand_df, group_params, session_duration_hours):
+    groups = demand_df.groupby(GROUP_COLUMNS, sort=True).agg(**{
+        'Procedures': ('Procedure', 'size'),
+        'Annual Demand (Cases)': ('Annual Demand (Cases)', 'sum'),
+        'Next Year Demand (Cases)': ('Next Year Demand (Cases)', 'sum'),
+        'Next Year Demand (Minutes)': ('Next Year Demand (Minutes)', 'sum'),
+    }).reset_index()
+    groups = groups.merge(group_params, on=GROUP_COLUMNS, how='left')
+
+    session_minutes = groups['Weeks per Year'] * session_duration_hours * 60 * groups['Utilisation']
+    groups['Capacity (Minutes)'] = groups['Sessions per Week'] * session_minutes
+    groups['Required Sessions per Week'] = (groups['Next Year Demand (Minutes)'] / session_minutes).replace(np.inf, np.nan)
+
+    average_case_minutes = groups['Next Year Demand (Minutes)'] / groups['Next Year Demand (Cases)']
+    waiting = groups['Waiting List Start'] + groups['Next Year Demand (Cases)']
+    groups['Expected Cases Treated'] = np.minimum(waiting, (groups['Capacity (Minutes)'] / average_case_minutes).fillna(0))
+    groups['Waiting List End'] = waiting - groups['Expected Cases Treated']
+    return groups
+
+
+# Roll group results up to a coarser level by summing the additive measures
+def roll_up_groups(groups, by):
+    if by:
+        return groups.groupby(by, sort=True)[GROUP_SUM_COLUMNS].sum().reset_index()
+    return groups[GROUP_SUM_COLUMNS].sum().to_frame().T
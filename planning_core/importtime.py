@@ -0,0 +1,94 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Import-time budget check for the core package. Each module is imported in a fresh interpreter
+# with `python -X importtime`, so the figure is a true cold import; modules the interpreter loads at
+# startup are excluded. The check also fails if importing the core pulls in a deferred backend.
+#
+#   python -m planning_core.importtime            # check every budget, exit 1 on failure
+#   python -m planning_core.importtime --scale 2  # allow twice the budget on a slow machine
+
+# Cold import budgets in milliseconds. NumPy alone is ~60 ms, so the numeric modules get headroom over it.
+IMPORT_BUDGETS_MS = {
+    'planning_core': 25,
+    'planning_core.lazy': 25,
+    'planning_core.capacity': 25,
+    'planning_core.simulation': 200,
+    'planning_core.projection': 200,
+    'planning_core.forecast': 200,
+    'planning_core.priority': 200,
+    'planning_core.groups': 200,
+    'planning_core.readers': 200,
+    'planning_core.replication': 200,
+    'planning_core.validation': 200,
+    'planning_core.executors': 200,
+    'planning_core.batch': 200,
+    'planning_core.api': 200,
+    'planning_core.matching': 200,
+    'planning_core.packing': 200,
+    'planning_core.compact': 200,
+}
+
+# Plotting and I/O backends that must only load when first used
+DEFERRED_MODULES = ['pandas', 'plotly', 'matplotlib', 'streamlit']
+
+
+def _import_report(statement):
+    # Top-level entries of the -X importtime report as {module: cumulative microseconds}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else statement)
+    report = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if name.startswith(' ') and not name.startswith('  ') and cumulative.strip().isdigit():
+            report[name.strip()] = int(cumulative)
+    return report, result.stdout
+
+
+def measure_import(module, repeat=3):
+    # Median cold import time in ms and the deferred backends the import loaded
+    startup = set(_import_report('pass')[0])
+    check = f"import sys, {module}; print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    timings = []
+    for _ in range(repeat):
+        report, stdout = _import_report(check)
+        timings.append(sum(cumulative for name, cumulative in report.items() if name not in startup) / 1000)
+    return statistics.median(timings), stdout.split()
+
+
+def check_budgets(budgets=None, repeat=3, scale=1.0):
+    rows = []
+    for module, budget_ms in (budgets or IMPORT_BUDGETS_MS).items():
+        elapsed_ms, deferred_loaded = measure_import(module, repeat)
+        rows.append({
+            'module': module,
+            'import_ms': elapsed_ms,
+            'budget_ms': budget_ms * scale,
+            'deferred_loaded': deferred_loaded,
+            'ok': elapsed_ms <= budget_ms * scale and not deferred_loaded,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check cold import times of the planning core against their budgets.')
+    parser.add_argument('modules', nargs='*', help='modules to check (default: every module with a budget)')
+    parser.add_argument('--repeat', type=int, default=3, help='imports per module; the median is reported')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget, e.g. for slow CI machines')
+    args = parser.parse_args(argv)
+
+    budgets = {module: IMPORT_BUDGETS_MS.get(module, IMPORT_BUDGETS_MS['planning_core.simulation']) for module in args.modules} or None
+    rows = check_budgets(budgets, args.repeat, args.scale)
+    for row in rows:
+        status = 'ok' if row['ok'] else 'OVER BUDGET' if not row['deferred_loaded'] else 'LOADS ' + ', '.join(row['deferred_loaded'])
+        print(f"{row['module']:<28} {row['import_ms']:8.1f} ms  (budget {row['budget_ms']:.0f} ms)  {status}")
+    return 0 if all(row['ok'] for row in rows) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
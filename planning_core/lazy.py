@@ -0,0 +1,29 @@
+import importlib
+import sys
+import types
+
+# Stand-ins for heavy plotting and I/O backends. `from planning_core.lazy import pd, px, go` binds
+# names that only import the real module on first attribute access, so a rerun (or batch job) that
+# never builds a DataFrame or chart never pays for pandas or plotly.
+
+
+class LazyModule(types.ModuleType):
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name__), attr)
+
+    def __repr__(self):
+        state = 'loaded' if is_loaded(self.__name__) else 'not loaded'
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_module(name):
+    return LazyModule(name)
+
+
+def is_loaded(name):
+    return name in sys.modules
+
+
+pd = lazy_module('pandas')
+px = lazy_module('plotly.express')
+go = lazy_module('plotly.graph_objects')
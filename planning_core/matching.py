@@ -0,0 +1,356 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+from planning_core import validation
+from planning_core.lazy import pd
+
+# Matching procedure names from different sites and years ("Hip Replacement", "THR - hip",
+# "W37.1 Total prim hip") onto one canonical procedure list. Each name is resolved, in order, by
+#
+#   Code    an OPCS-4 code in the name (W37.1, W371) found in the canonical list's codes, or its
+#           category (W37) when the list only codes to category level
+#   Exact   the normalised name equals a normalised canonical name or alias
+#   Cached  a fuzzy match made for the same normalised name in an earlier upload
+#   Fuzzy   the best trigram (Dice) similarity over canonical names and aliases, if >= min_score
+#
+# A cached or fuzzy match scoring under confirm_score ("knee op" is 0.73 from "Knee") is only a
+# Suggested match: merge_uploads keeps it as its own procedure unless the name is confirmed, so
+# short, loosely similar names don't silently add their demand to another procedure.
+#
+# Normalised names are lower case, alphanumeric, without stop words and with their words sorted,
+# so word order and punctuation don't matter. Every step works on the unique normalised names of
+# an upload, and fuzzy matching runs on arrays: trigrams are integers over a 37-symbol alphabet,
+# canonical trigrams form an inverted index, and candidates are counted with np.unique and scored
+# with bincount rather than compared pairwise.
+#
+# Fuzzy results are kept per canonical list (by digest) in PLANNING_MATCH_DIR, so a name seen in
+# one upload is not scored again in the next. The file keeps the max_cache_entries most recently
+# used names.
+#
+#   python -m planning_core.matching canonical.csv extract-2023.csv extract-2024.csv -o merged.csv
+
+MATCH_DIR_ENV_VAR = 'PLANNING_MATCH_DIR'
+DEFAULT_MATCH_DIR = '.procedure-matches'
+MATCHER_VERSION = 1
+CANONICAL_COLUMNS = ['Procedure', 'Code', 'Aliases']
+MERGED_METHODS = ['Code', 'Exact', 'Cached', 'Fuzzy', 'Confirmed']
+MATCH_METHODS = MERGED_METHODS + ['Suggested', 'Unmatched']
+CONFIRM_SCORE = 0.8
+MAX_CACHE_ENTRIES = 200_000
+STOP_WORDS = frozenset(['a', 'an', 'and', 'for', 'of', 'on', 'the', 'to', 'with'])
+
+# OPCS-4: a chapter letter, a two-digit category and an optional subcategory digit
+_CODE_PATTERN = re.compile(r'(?<![A-Za-z0-9])([A-Za-z])(\d{2})(?:\.?(\d))?(?![A-Za-z0-9])')
+_SYMBOLS = 37  # space, a-z, 0-9
+_TRIGRAMS = _SYMBOLS ** 3
+_SYMBOL_CODES = np.zeros(256, dtype=np.int64)
+_SYMBOL_CODES[np.frombuffer(b'abcdefghijklmnopqrstuvwxyz', dtype=np.uint8)] = np.arange(1, 27)
+_SYMBOL_CODES[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(27, 37)
+
+
+def match_directory():
+    return os.environ.get(MATCH_DIR_ENV_VAR, DEFAULT_MATCH_DIR)
+
+
+def split_names(names):
+    # (normalised text, OPCS code or '') for each name. Codes are taken out of the text, so
+    # "W37.1 Total hip replacement" and "Total hip replacement" have the same text.
+    raw = pd.Series(np.asarray(names, dtype=object)).fillna('').astype(str)
+    found = raw.str.extract(_CODE_PATTERN)
+    codes = (found[0].str.upper() + found[1] + ('.' + found[2]).where(found[2].notna(), '')).fillna('')
+    text = raw.str.replace(_CODE_PATTERN, ' ', regex=True).str.lower().str.replace('&', ' and ', regex=False)
+    text = text.str.replace(r'[^a-z0-9]+', ' ', regex=True)
+    normalised = [' '.join(sorted(word for word in value.split() if word not in STOP_WORDS)) for value in text]
+    return np.array(normalised, dtype=object), codes.to_numpy(dtype=object)
+
+
+def normalise_names(names):
+    return split_names(names)[0]
+
+
+def _trigrams(texts):
+    # Sorted unique (owner, trigram) pairs for space-padded ASCII texts, plus trigrams per text
+    padded = [f" {text} " for text in texts]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    symbols = _SYMBOL_CODES[np.frombuffer(''.join(padded).encode('ascii'), dtype=np.uint8)]
+    counts = np.maximum(lengths - 2, 0)
+    first = np.cumsum(counts) - counts
+    positions = np.repeat(np.cumsum(lengths) - lengths - first, counts) + np.arange(counts.sum())
+    trigrams = symbols[positions] * _SYMBOLS ** 2 + symbols[positions + 1] * _SYMBOLS + symbols[positions + 2]
+    keys = np.unique(np.repeat(np.arange(len(texts), dtype=np.int64), counts) * _TRIGRAMS + trigrams)
+    owners = keys // _TRIGRAMS
+    return owners, keys % _TRIGRAMS, np.bincount(owners, minlength=len(texts))
+
+
+def _expand(starts, lengths):
+    # Concatenated ranges [start, start + length) as one index array
+    total = int(lengths.sum())
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+
+
+def read_canonical_list(file_bytes):
+    # Procedure (required), optional Code and optional Aliases (separated by ';' or '|')
+    raw = pd.read_csv(io.BytesIO(file_bytes), dtype=str, skipinitialspace=True, keep_default_na=False)
+    expected = {name.lower(): name for name in CANONICAL_COLUMNS}
+    raw.columns = [expected.get(str(column).strip().lower(), str(column).strip()) for column in raw.columns]
+    if 'Procedure' not in raw.columns:
+        raise ValueError(f"The canonical list needs a Procedure column. Found: {', '.join(map(str, raw.columns))}.")
+    canonical = pd.DataFrame({column: raw[column].str.strip() if column in raw else '' for column in CANONICAL_COLUMNS})
+    canonical = canonical[canonical['Procedure'] != ''].drop_duplicates('Procedure', ignore_index=True)
+    if canonical.empty:
+        raise ValueError('The canonical list has no procedure names.')
+    return canonical
+
+
+class ProcedureMatcher:
+    def __init__(self, canonical, min_score=0.6, max_candidates=8, max_postings=None, cache_dir=None, chunk_size=2048,
+                 confirm_score=CONFIRM_SCORE, max_cache_entries=MAX_CACHE_ENTRIES):
+        # canonical: a list of names, or a DataFrame with Procedure and optional Code and Aliases
+        if not isinstance(canonical, pd.DataFrame):
+            canonical = pd.DataFrame({'Procedure': pd.unique(pd.Series(list(canonical), dtype=object).astype(str).str.strip())})
+        self.names = canonical['Procedure'].astype(str).to_numpy(dtype=object)
+        self.min_score = min_score
+        self.confirm_score = max(confirm_score, min_score)
+        self.max_cache_entries = max_cache_entries
+        self.max_candidates = max_candidates
+        self.chunk_size = chunk_size
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()  # one matcher may serve several app sessions
+
+        # Entries: every canonical name and alias, each pointing at its canonical procedure
+        entry_names, entry_owners = list(self.names), list(range(len(self.names)))
+        if 'Aliases' in canonical:
+            for owner, aliases in enumerate(canonical['Aliases'].fillna('').astype(str)):
+                for alias in re.split(r'[;|]', aliases):
+                    if alias.strip():
+                        entry_names.append(alias.strip())
+                        entry_owners.append(owner)
+        entry_text, name_codes = split_names(entry_names)
+        self.entry_canonical = np.array(entry_owners, dtype=np.int64)
+
+        # Codes: the Code column where given, else a code in the name. A code shared by several
+        # procedures is ambiguous and not used.
+        codes = split_names(canonical['Code'].fillna(''))[1] if 'Code' in canonical else np.full(len(self.names), '', dtype=object)
+        codes = np.where(codes != '', codes, name_codes[:len(self.names)])
+        code_table = pd.Series(np.arange(len(self.names)), index=pd.Index(codes, dtype=object))
+        code_table = code_table[code_table.index != '']
+        self.codes = code_table[~code_table.index.duplicated(keep=False)]
+
+        text_table = pd.Series(self.entry_canonical, index=pd.Index(entry_text, dtype=object))
+        text_table = text_table[text_table.index != '']
+        self.exact = text_table[~text_table.index.duplicated()]
+
+        # Trigram index: entry keys (entry × trigram) for membership tests, postings by trigram
+        owners, trigrams, self.entry_lengths = _trigrams(entry_text)
+        self.entry_keys = owners * _TRIGRAMS + trigrams
+        order = np.argsort(trigrams, kind='stable')
+        self.postings = owners[order]
+        self.frequency = np.bincount(trigrams, minlength=_TRIGRAMS)
+        self.posting_starts = np.cumsum(self.frequency) - self.frequency
+        # Trigrams in more entries than this (" th", "ion") don't propose candidates, though they
+        # still count when candidates are scored
+        self.max_postings = max_postings or max(64, len(entry_text) // 50)
+
+        digest = hashlib.sha1(f"{MATCHER_VERSION}|{self.max_postings}|{self.max_candidates}".encode())
+        for name, text, owner in zip(entry_names, entry_text, entry_owners):
+            digest.update(f"\x1f{name}\x1e{text}\x1e{owner}".encode())
+        digest.update(self.codes.index.str.cat(sep='\x1f').encode())
+        self.digest = digest.hexdigest()[:16]
+        self.cache = self._load_cache()
+
+    # Fuzzy matches are stored as {key: [canonical name or None, score]} whatever min_score is, so
+    # the threshold can change without invalidating them
+    def _cache_path(self):
+        return os.path.join(self.cache_dir or match_directory(), f"matches-{self.digest}.json")
+
+    def _load_cache(self):
+        try:
+            with open(self._cache_path()) as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return {}
+
+    def save_cache(self):
+        path = self._cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(part, 'w') as fh:
+            json.dump(self.cache, fh, separators=(',', ':'))
+        os.replace(part, path)
+        return path
+
+    def fuzzy_match(self, texts):
+        # (best canonical index or -1, Dice score) for each normalised text
+        best = np.full(len(texts), -1, dtype=np.int64)
+        scores = np.zeros(len(texts))
+        for start in range(0, len(texts), self.chunk_size):
+            chunk = slice(start, start + self.chunk_size)
+            best[chunk], scores[chunk] = self._fuzzy_chunk(texts[chunk])
+        return best, scores
+
+    def _fuzzy_chunk(self, texts):
+        n = len(texts)
+        query_owners, query_trigrams, query_lengths = _trigrams(texts)
+        query_starts = np.cumsum(query_lengths) - query_lengths
+        n_entries = len(self.entry_lengths)
+
+        # Candidates: entries sharing a selective trigram, the max_candidates with the most. A query
+        # made only of common words still proposes by its two rarest trigrams.
+        frequency = self.frequency[query_trigrams]
+        by_rarity = np.lexsort((frequency, query_owners))
+        rarity_rank = np.empty(len(by_rarity), dtype=np.int64)
+        rarity_rank[by_rarity] = np.arange(len(by_rarity)) - query_starts[query_owners[by_rarity]]
+        proposing = np.where((frequency <= self.max_postings) | (rarity_rank < 2), frequency, 0)
+        pairs = np.repeat(query_owners, proposing) * n_entries + self.postings[_expand(self.posting_starts[query_trigrams], proposing)]
+        pairs, hits = np.unique(pairs, return_counts=True)
+        order = np.lexsort((-hits, pairs // n_entries))
+        candidate_query, candidate_entry = pairs[order] // n_entries, pairs[order] % n_entries
+        rank = np.arange(len(order)) - np.searchsorted(candidate_query, candidate_query)
+        keep = rank < self.max_candidates
+        candidate_query, candidate_entry = candidate_query[keep], candidate_entry[keep]
+
+        # Score: shared trigrams over all of the query's trigrams, as Dice 2|A∩B| / (|A| + |B|)
+        lengths = query_lengths[candidate_query]
+        probes = np.repeat(candidate_entry * _TRIGRAMS, lengths) + query_trigrams[_expand(query_starts[candidate_query], lengths)]
+        found = np.searchsorted(self.entry_keys, probes)
+        found = self.entry_keys[np.minimum(found, len(self.entry_keys) - 1)] == probes
+        shared = np.bincount(np.repeat(np.arange(len(candidate_query)), lengths), weights=found, minlength=len(candidate_query))
+        dice = 2 * shared / np.maximum(lengths + self.entry_lengths[candidate_entry], 1)
+
+        order = np.lexsort((candidate_entry, -dice, candidate_query))
+        first = order[np.r_[True, np.diff(candidate_query[order]) != 0]] if len(order) else order
+        best = np.full(n, -1, dtype=np.int64)
+        scores = np.zeros(n)
+        best[candidate_query[first]] = self.entry_canonical[candidate_entry[first]]
+        scores[candidate_query[first]] = dice[first]
+        return best, scores
+
+    def match(self, names, save=True):
+        # One row per name: Procedure, Canonical Procedure (None when unmatched; the suggestion
+        # when Suggested), Match, Score
+        names = np.asarray(names, dtype=object)
+        texts, codes = split_names(names)
+        keys = pd.Index(codes + '|' + texts)
+        key_codes, unique_keys = pd.factorize(keys)
+        first = np.unique(key_codes, return_index=True)[1]  # unique_keys[i] first appears at first[i]
+        texts, codes = texts[first], codes[first]
+        n = len(first)
+
+        canonical = np.full(n, -1, dtype=np.int64)
+        scores = np.zeros(n)
+        methods = np.full(n, 'Unmatched', dtype=object)
+        for method, found in (
+            ('Code', self.codes.reindex(codes).fillna(-1)),
+            ('Code', self.codes.reindex([code[:3] for code in codes]).fillna(-1)),  # W37.1 under a canonical W37
+            ('Exact', self.exact.reindex(texts).fillna(-1)),
+        ):
+            found = found.to_numpy(dtype=np.int64)
+            hit = (canonical < 0) & (found >= 0)
+            canonical[hit], scores[hit], methods[hit] = found[hit], 1.0, method
+
+        pending = np.flatnonzero((canonical < 0) & (texts != ''))
+        pending_keys = np.asarray(unique_keys, dtype=object)[pending]
+        with self.lock:
+            cached = np.array([key in self.cache for key in pending_keys], dtype=bool)
+        found, found_scores = self.fuzzy_match(texts[pending[~cached]]) if not cached.all() else ((), ())
+        with self.lock:
+            for key, owner, score in zip(pending_keys[~cached], found, found_scores):
+                self.cache[key] = [self.names[owner] if owner >= 0 else None, round(float(score), 4)]
+            # Least recently used first: names seen again move to the end, the oldest are dropped
+            stored = [self.cache.pop(key) for key in pending_keys]
+            self.cache.update(zip(pending_keys, stored))
+            for key in list(self.cache)[:max(len(self.cache) - self.max_cache_entries, 0)]:
+                del self.cache[key]
+            if save and not cached.all():
+                try:
+                    self.save_cache()
+                except OSError:
+                    pass  # a read-only deployment still matches, just without reuse
+        found = pd.Series(np.arange(len(self.names)), index=self.names).reindex([value[0] for value in stored]).fillna(-1).to_numpy(dtype=np.int64)
+        found_scores = np.array([value[1] for value in stored], dtype=float)
+        accepted = (found >= 0) & (found_scores >= self.min_score)
+        canonical[pending[accepted]] = found[accepted]
+        scores[pending] = found_scores
+        methods[pending[accepted]] = np.where(found_scores < self.confirm_score, 'Suggested', np.where(cached, 'Cached', 'Fuzzy'))[accepted]
+
+        matched = np.where(canonical >= 0, self.names[np.maximum(canonical, 0)], None)
+        return pd.DataFrame({
+            'Procedure': names,
+            'Canonical Procedure': matched[key_codes],
+            'Match': methods[key_codes],
+            'Score': scores[key_codes],
+        })
+
+
+def merge_uploads(frames, matcher=None, file_names=None, confirmed=()):
+    # Map the procedures of several validated uploads onto one canonical list and merge them as
+    # one file would be (summed demand, case-weighted duration per procedure, site and specialty).
+    # Without a matcher, the first upload's names are the canonical list. Unmatched names, and
+    # Suggested matches whose name isn't in `confirmed`, are kept as they are. Returns
+    # (merged_df, mapping_df, summary).
+    frames = list(frames)
+    file_names = list(file_names or (f"File {i + 1}" for i in range(len(frames))))
+    matcher = matcher or ProcedureMatcher(frames[0]['Procedure'])
+    confirmed = set(confirmed)
+    mappings, renamed = [], []
+    for file_name, frame in zip(file_names, frames):
+        mapping = matcher.match(frame['Procedure'].to_numpy(dtype=object))
+        mapping.loc[(mapping['Match'] == 'Suggested') & mapping['Procedure'].isin(confirmed), 'Match'] = 'Confirmed'
+        merged = mapping['Match'].isin(MERGED_METHODS)
+        renamed.append(frame.assign(Procedure=mapping['Canonical Procedure'].where(merged, mapping['Procedure']).to_numpy(dtype=object)))
+        mappings.append(mapping.assign(File=file_name))
+    mapping_df = pd.concat(mappings, ignore_index=True)[['File', 'Procedure', 'Canonical Procedure', 'Match', 'Score']]
+    merged_df, _, summary = validation.validate_procedures(pd.concat(renamed, ignore_index=True))
+    summary = {
+        'Files': len(frames),
+        'Names Read': len(mapping_df),
+        **{f"Matched by {method}": int((mapping_df['Match'] == method).sum()) for method in MERGED_METHODS},
+        'Suggested': int((mapping_df['Match'] == 'Suggested').sum()),
+        'Unmatched': int((mapping_df['Match'] == 'Unmatched').sum()),
+        'Procedures': summary['Procedures'],
+    }
+    return merged_df, mapping_df, summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Match procedure names in uploads onto a canonical list and merge them.')
+    parser.add_argument('canonical', help='canonical CSV: Procedure, optional Code and Aliases')
+    parser.add_argument('uploads', nargs='+', help='procedure CSVs to merge')
+    parser.add_argument('-o', '--output', default='merged-procedures.csv')
+    parser.add_argument('--mapping', help='also write every name and what it matched to this CSV')
+    parser.add_argument('--min-score', type=float, default=0.6, help='lowest trigram similarity suggested as a match')
+    parser.add_argument('--confirm-score', type=float, default=CONFIRM_SCORE,
+                        help='lowest similarity merged without confirmation; names scoring less are kept apart and listed as Suggested')
+    parser.add_argument('--confirm', nargs='*', default=(), metavar='NAME', help='uploaded names whose suggested match should be merged')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with open(args.canonical, 'rb') as fh:
+        matcher = ProcedureMatcher(read_canonical_list(fh.read()), min_score=args.min_score, confirm_score=args.confirm_score)
+    frames = []
+    for path in args.uploads:
+        with open(path, 'rb') as fh:
+            frame, issues, _ = validation.read_and_validate_procedures(fh.read())
+        if len(issues):
+            print(f"{len(issues)} problems in {path}; those rows were left out.", file=sys.stderr)
+        frames.append(frame)
+    merged_df, mapping_df, summary = merge_uploads(frames, matcher, args.uploads, args.confirm)
+    merged_df.to_csv(args.output, index=False)
+    if args.mapping:
+        mapping_df.to_csv(args.mapping, index=False)
+    print(', '.join(f"{key}: {value}" for key, value in summary.items()), file=sys.stderr)
+    print(f"Merged in {time.perf_counter() - start:.1f} s -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import numpy as np
+
+from planning_core import simulation
+
+# Session-level packing of the year's cases into fixed-length theatre sessions, for comparing the
+# random-order simulation with what better list scheduling could deliver:
+#
+#   Random Order  the simulation's shuffled case order booked session by session; a session closes
+#                 at the first case that doesn't fit in what is left of it (next fit)
+#   Optimised     best fit: each case goes into the session with the least room that still takes
+#                 it. The Minutes objective places the longest cases first; the Cases objective
+#                 places the shortest first, and also tries longest first (which often books every
+#                 case when mixing long and short cases fills sessions better) and keeps whichever
+#                 treats more. compare_packing reports the random order instead whenever it does
+#                 better on the objective, so the optimised figure is never below the baseline.
+#
+# Every case of a procedure has the same duration, so packing runs a procedure at a time rather
+# than a case at a time. For identical cases best fit keeps choosing the same tightest session until
+# it is full, so placing a procedure is one searchsorted into the sessions sorted by remaining room
+# and a cumulative sum of how many cases each takes. The cost is O(procedures × sessions), not
+# O(cases × log sessions), and does not depend on the number of cases.
+
+PACKING_OBJECTIVES = ['Cases', 'Minutes']
+_TOLERANCE = 1e-9  # minutes; sums of durations are compared with this slack for rounding
+
+
+def _packing_result(procedure_cases, session_cases, session_minutes_used, minutes):
+    return {
+        'Cases Treated': int(procedure_cases.sum()),
+        'Minutes Treated': float(procedure_cases @ minutes),
+        'Sessions Used': int((session_cases > 0).sum()),
+        'Procedure Cases': procedure_cases,
+        'Session Cases': session_cases,
+        'Session Minutes Used': session_minutes_used,
+    }
+
+
+def random_order_fill(cases, duration_hours, sessions, session_minutes, seed=None):
+    # Cases longer than a session can never be booked and are left out of the order
+    minutes = np.asarray(duration_hours, dtype=float) * 60
+    case_rows = simulation.shuffled_case_rows(cases, seed)
+    case_rows = case_rows[minutes[case_rows] <= session_minutes + _TOLERANCE]
+    cumulative = np.concatenate([[0.0], np.cumsum(minutes[case_rows])])
+
+    session_cases = np.zeros(sessions, dtype=np.int64)
+    session_minutes_used = np.zeros(sessions)
+    start = 0
+    for session in range(sessions):
+        if start >= len(case_rows):
+            break
+        end = int(np.searchsorted(cumulative, cumulative[start] + session_minutes + _TOLERANCE, side='right')) - 1
+        session_cases[session] = end - start
+        session_minutes_used[session] = cumulative[end] - cumulative[start]
+        start = end
+    procedure_cases = np.bincount(case_rows[:start], minlength=len(minutes))
+    return _packing_result(procedure_cases, session_cases, session_minutes_used, minutes)
+
+
+def _best_fit(remaining, session_cases, case_minutes, count):
+    # Place up to `count` cases of one duration, best fit; updates the session arrays in place and
+    # returns the number placed
+    if count <= 0:
+        return 0
+    order = np.argsort(remaining, kind='stable')
+    first = int(np.searchsorted(remaining[order], case_minutes - _TOLERANCE))
+    candidates = order[first:]
+    if case_minutes <= 0:
+        fits = np.full(len(candidates), count, dtype=np.int64)
+    else:
+        fits = np.floor((remaining[candidates] + _TOLERANCE) / case_minutes).astype(np.int64)
+    cumulative = np.cumsum(fits)
+    if not len(cumulative) or cumulative[-1] <= count:
+        take = fits
+    else:
+        last = int(np.searchsorted(cumulative, count))
+        candidates, take = candidates[:last + 1], fits[:last + 1].copy()
+        take[-1] -= cumulative[last] - count
+    remaining[candidates] -= take * case_minutes
+    session_cases[candidates] += take
+    return int(take.sum())
+
+
+def pack_sessions(cases, duration_hours, sessions, session_minutes, objective='Cases'):
+    # Cases are whole, as in the simulation. `objective` is 'Cases' (most cases treated) or
+    # 'Minutes' (most theatre minutes used).
+    if objective not in PACKING_OBJECTIVES:
+        raise ValueError(f"Unknown packing objective: {objective}")
+    counts = np.asarray(cases, dtype=float).astype(np.int64).clip(0)
+    minutes = np.asarray(duration_hours, dtype=float) * 60
+    counts = np.where(minutes <= session_minutes + _TOLERANCE, counts, 0)
+    shortest_first = np.argsort(minutes, kind='stable')
+    packed = _best_fit_in_order(counts, minutes, sessions, session_minutes, shortest_first[::-1])
+    if objective == 'Cases':
+        shortest = _best_fit_in_order(counts, minutes, sessions, session_minutes, shortest_first)
+        if shortest['Cases Treated'] > packed['Cases Treated']:
+            packed = shortest
+    return packed
+
+
+def _best_fit_in_order(counts, minutes, sessions, session_minutes, order):
+    # Best fit of every procedure's cases, a procedure at a time in `order`
+    remaining = np.full(sessions, float(session_minutes))
+    session_cases = np.zeros(sessions, dtype=np.int64)
+    procedure_cases = np.zeros(len(counts), dtype=np.int64)
+    for row in order:
+        if counts[row] and minutes[row] <= remaining.max(initial=0.0) + _TOLERANCE:
+            procedure_cases[row] += _best_fit(remaining, session_cases, minutes[row], counts[row])
+    return _packing_result(procedure_cases, session_cases, session_minutes - remaining, minutes)
+
+
+def packing_bounds(cases, duration_hours, sessions, session_minutes):
+    # Upper bounds on any packing: total capacity filled shortest cases first (Cases) and the lesser
+    # of total capacity and the demand that fits in a session (Minutes)
+    counts = np.asarray(cases, dtype=float).astype(np.int64).clip(0)
+    minutes = np.asarray(duration_hours, dtype=float) * 60
+    counts = np.where(minutes <= session_minutes + _TOLERANCE, counts, 0)
+    capacity_minutes = sessions * session_minutes
+    order = np.argsort(minutes, kind='stable')
+    case_minutes = np.repeat(minutes[order], counts[order])
+    return {
+        'Cases': int(np.searchsorted(np.cumsum(case_minutes), capacity_minutes + _TOLERANCE, side='right')),
+        'Minutes': float(min(capacity_minutes, counts @ minutes)),
+    }
+
+
+def compare_packing(cases, duration_hours, sessions, session_minutes, objective='Cases', seed=None):
+    # Random-order and optimised packing of the same demand, the gap between them and the bounds.
+    # Optimised is the better of the two on the objective, as a scheduler could always keep the
+    # random lists.
+    random_order = random_order_fill(cases, duration_hours, sessions, session_minutes, seed)
+    optimised = pack_sessions(cases, duration_hours, sessions, session_minutes, objective)
+    treated = f"{objective} Treated"
+    if random_order[treated] > optimised[treated]:
+        optimised = random_order
+    bounds = packing_bounds(cases, duration_hours, sessions, session_minutes)
+    minutes = np.asarray(duration_hours, dtype=float) * 60
+    return {
+        'Random Order': random_order,
+        'Optimised': optimised,
+        'Cases Gap': optimised['Cases Treated'] - random_order['Cases Treated'],
+        'Minutes Gap': optimised['Minutes Treated'] - random_order['Minutes Treated'],
+        'Cases Bound': bounds['Cases'],
+        'Minutes Bound': bounds['Minutes'],
+        'Cases Too Long for a Session': int(np.asarray(cases, dtype=float).astype(np.int64).clip(0)[minutes > session_minutes + _TOLERANCE].sum()),
+    }
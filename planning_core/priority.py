@@ -0,0 +1,90 @@
+import numpy as np
+
+from planning_core.lazy import pd
+
+# Clinical priority classes: a weekly queue model over classes × procedures × weeks waited
+
+PRIORITY_CLASSES = {
+    'Priority': ['P1', 'P2', 'P3', 'P4'],
+    'Share of Additions': [0.05, 0.20, 0.35, 0.40],
+    'Target (Weeks)': [1, 4, 13, 18],
+    'Capacity Share': [0.10, 0.25, 0.35, 0.30],
+}
+ALLOCATION_RULES = ['Strict Priority', 'Fixed Capacity Shares', 'Proportional to Waiting Minutes']
+
+
+# Simulate the list week by week. `initial` holds cases by (class, weeks waited, procedure), with the last
+# age bin collecting everyone who has waited that long or longer; `arrivals` are weekly (class, procedure)
+# additions. Each class treats its longest waiters first, spread across procedures in proportion to their lists.
+# Working on cumulative counts along the age axis keeps every step a handful of float32 array operations.
+def simulate_priority_queue(initial, arrivals, case_minutes, weekly_capacity_minutes, targets, capacity_shares, rule, weeks):
+    waiting = np.array(initial, dtype=np.float32)
+    arrivals = np.asarray(arrivals, dtype=np.float32)
+    case_minutes = np.asarray(case_minutes, dtype=np.float32)
+    n_classes, n_ages, _ = waiting.shape
+    breaching_ages = np.arange(n_ages)[None, :] >= np.asarray(targets)[:, None]
+    waiting_by_week = np.empty((weeks + 1, n_classes))
+    breaches_by_week = np.empty((weeks + 1, n_classes))
+    treated = np.zeros(n_classes)
+    class_ages = waiting.sum(axis=2)
+    waiting_by_week[0] = class_ages.sum(axis=1)
+    breaches_by_week[0] = (class_ages * breaching_ages).sum(axis=1)
+
+    waiting_at_or_younger = np.empty_like(waiting)
+    for week in range(1, weeks + 1):
+        np.cumsum(waiting, axis=1, out=waiting_at_or_younger)
+        cases = waiting_at_or_younger[:, -1, :]
+        needed_minutes = (cases @ case_minutes).astype(float)
+        if rule == 'Strict Priority':
+            used_by_higher_classes = np.concatenate([[0.0], np.cumsum(needed_minutes)[:-1]])
+            class_minutes = np.clip(weekly_capacity_minutes - used_by_higher_classes, 0, needed_minutes)
+        elif rule == 'Fixed Capacity Shares':
+            class_minutes = np.minimum(needed_minutes, weekly_capacity_minutes * np.asarray(capacity_shares))
+        else:
+            total_needed = needed_minutes.sum()
+            class_minutes = needed_minutes * (min(1.0, weekly_capacity_minutes / total_needed) if total_needed > 0 else 0.0)
+        treated_fraction = np.divide(class_minutes, needed_minutes, out=np.zeros(n_classes), where=needed_minutes > 0)
+        treated += treated_fraction * cases.sum(axis=1)
+
+        # Treating the longest waiters first leaves the youngest `keep` cases, i.e. caps the cumulative counts
+        keep = cases * (1 - treated_fraction[:, None]).astype(np.float32)
+        np.minimum(waiting_at_or_younger, keep[:, None, :], out=waiting_at_or_younger)
+
+        # Difference back to per-age counts shifted on by one week; this week's referrals join at zero weeks
+        waiting[:, -1, :] = waiting_at_or_younger[:, -1, :] - waiting_at_or_younger[:, -3, :]
+        np.subtract(waiting_at_or_younger[:, 1:-2, :], waiting_at_or_younger[:, :-3, :], out=waiting[:, 2:-1, :])
+        waiting[:, 1, :] = waiting_at_or_younger[:, 0, :]
+        waiting[:, 0, :] = arrivals
+
+        class_ages = waiting.sum(axis=2)
+        waiting_by_week[week] = class_ages.sum(axis=1)
+        breaches_by_week[week] = (class_ages * breaching_ages).sum(axis=1)
+    return waiting_by_week, breaches_by_week, treated, waiting
+
+
+# Starting list by (class, weeks waited, procedure): the breaching share sits at each class's target and
+# the rest is spread evenly over the weeks before it. A class with a target of 0 weeks has no weeks before
+# its target, so all of its patients start at zero weeks waited (already breaching) rather than being lost.
+def initial_priority_waiting_list(total_start, breaching_share, class_shares, procedure_shares, targets, n_ages):
+    ages = np.arange(n_ages)
+    targets = np.asarray(targets)
+    age_profile = np.where(ages[None, :] < targets[:, None], (1 - breaching_share) / np.maximum(targets, 1)[:, None], 0.0)
+    age_profile[np.arange(len(targets)), targets] += np.where(targets > 0, breaching_share, 1.0)
+    return total_start * np.asarray(class_shares)[:, None, None] * age_profile[:, :, None] * procedure_shares[None, None, :]
+
+
+# Starting list from a patient-level extract's counts, placed by priority, procedure and weeks waited.
+# Rows repeating a procedure name take the first one's position.
+def waiting_list_tensor(counts, priorities, procedures, n_ages):
+    procedure_positions = pd.Series(np.arange(len(procedures)), index=procedures.to_numpy())
+    procedure_positions = procedure_positions[~procedure_positions.index.duplicated()]
+    class_index = pd.Index(priorities).get_indexer(counts['Priority'])
+    procedure_index = counts['Procedure'].map(procedure_positions).fillna(-1).to_numpy(dtype=int)
+    matched = (class_index >= 0) & (procedure_index >= 0)
+    tensor = np.zeros((len(priorities), n_ages, len(procedures)))
+    np.add.at(
+        tensor,
+        (class_index[matched], np.minimum(counts['Weeks Waited'].to_numpy()[matched], n_ages - 1), procedure_index[matched]),
+        counts['Patients'].to_numpy()[matched]
+    )
+    return tensor
@@ -0,0 +1,23 @@
+import numpy as np
+
+# Multi-year waiting list projection. Capacity is shared across procedures in proportion to their
+# waiting minutes; each year starts with the previous year's end-of-year list.
+
+
+def project_year_step(start, additions, case_minutes, capacity_minutes):
+    waiting = start + additions
+    waiting_minutes = (waiting * case_minutes).sum()
+    treated_fraction = min(1.0, capacity_minutes / waiting_minutes) if waiting_minutes > 0 else 0.0
+    treated = waiting * treated_fraction
+    return {'Waiting List Start': start, 'Additions': additions, 'Treated': treated, 'Waiting List End': waiting - treated}
+
+
+def project_years(base_cases, case_minutes, waiting_list_start_cases, demand_factors, capacity_minutes):
+    # Every year in turn, for callers that don't need the per-year caching the apps use
+    results = []
+    start = np.asarray(waiting_list_start_cases, dtype=float)
+    for demand_factor, year_capacity in zip(demand_factors, capacity_minutes):
+        year_result = project_year_step(start, base_cases * demand_factor, case_minutes, year_capacity)
+        results.append(year_result)
+        start = year_result['Waiting List End']
+    return results
@@ -0,0 +1,48 @@
+import io
+
+import numpy as np
+
+from planning_core.lazy import pd
+
+# Readers for uploaded files. pandas is only imported the first time one of them runs.
+
+WAITING_LIST_COLUMNS = ['Referral Date', 'Procedure', 'Priority']
+REQUIRED_WAITING_LIST_COLUMNS = ['Referral Date', 'Procedure']
+MAX_WEEKS_WAITED = 104
+REFERRAL_DATE_FORMATS = {'YYYY-MM-DD': '%Y-%m-%d', 'DD/MM/YYYY': '%d/%m/%Y', 'MM/DD/YYYY': '%m/%d/%Y'}
+
+
+# Summarise a patient-level waiting list extract (one row per patient) in fixed-size chunks, so memory
+# stays bounded however long the list is. Each chunk is reduced to patient counts by priority, procedure
+# and completed weeks waited (capped at MAX_WEEKS_WAITED) before the next one is read.
+# Raises ValueError if a required column is missing.
+def summarise_waiting_list(file_bytes, census_date, date_format, chunksize=100_000):
+    census_day = np.datetime64(census_date, 'D')
+    header = pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns
+    missing = [column for column in REQUIRED_WAITING_LIST_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}. Found: {', '.join(map(str, header))}.")
+    reader = pd.read_csv(
+        io.BytesIO(file_bytes),
+        usecols=lambda column: column in WAITING_LIST_COLUMNS,
+        dtype={'Procedure': 'category', 'Priority': 'category'},
+        chunksize=chunksize,
+    )
+    partial_counts = []
+    rows_read = rows_skipped = 0
+    for chunk in reader:
+        rows_read += len(chunk)
+        referral_days = pd.to_datetime(chunk['Referral Date'], errors='coerce', format=date_format).to_numpy(dtype='datetime64[D]')
+        valid = ~np.isnat(referral_days)
+        rows_skipped += int((~valid).sum())
+        weeks_waited = np.clip((census_day - referral_days[valid]).astype(np.int64) // 7, 0, MAX_WEEKS_WAITED)
+        chunk_counts = pd.DataFrame({
+            'Priority': chunk['Priority'].astype(str).to_numpy()[valid] if 'Priority' in chunk else 'All',
+            'Procedure': chunk['Procedure'].astype(str).to_numpy()[valid],
+            'Weeks Waited': weeks_waited,
+        }).value_counts()
+        partial_counts.append(chunk_counts)
+    if not rows_read:
+        raise ValueError("The waiting list extract has no rows.")
+    counts = pd.concat(partial_counts).groupby(level=[0, 1, 2]).sum().rename('Patients').reset_index()
+    return counts, rows_skipped
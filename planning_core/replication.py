@@ -0,0 +1,177 @@
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import sys
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from planning_core import simulation
+
+# Replicated case-mix simulations in worker processes. Results never travel back through pickling:
+# the parent allocates shared-memory buffers, each worker attaches to them by name and writes its
+# replications in place, and the caller reads the buffers as NumPy views without copying.
+#
+# Buffers, for R replications over P procedures:
+#   cases_treated    (R,)           int64   treated cases per replication (valid prefix of `codes`)
+#   minutes_treated  (R,)           float64 theatre minutes used per replication
+#   procedure_counts (R, P)         int32   treated cases per procedure per replication
+#   codes            (R, max_cases) int32   procedure row of each treated case, in treatment order
+# Only the two per-replication summaries are kept unless more are asked for: `codes` alone can run
+# to hundreds of MB, and /dev/shm is often small (64 MB by default under Docker). Per-case
+# durations are a lookup of `codes` into the procedure durations, so they aren't stored.
+
+BUFFER_DTYPES = {
+    'cases_treated': np.int64,
+    'minutes_treated': np.float64,
+    'procedure_counts': np.int32,
+    'codes': np.int32,
+}
+SUMMARY_BUFFERS = ('cases_treated', 'minutes_treated')
+
+
+def _attach(name):
+    # Attach to a block the parent owns. Pool workers share the parent's resource tracker, so on
+    # Python < 3.13 the duplicate registration is harmless; 3.13+ can skip tracking altogether.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _release(blocks, owner):
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            pass  # a caller still holds a view; the mapping is freed when the last view goes
+        if owner:
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SharedReplications:
+    # Shared-memory result buffers. The creating process owns the blocks and removes them on
+    # close(), when used as a context manager, or when the object is garbage collected.
+
+    def __init__(self, shapes, names=None):
+        self.shapes = {key: tuple(shape) for key, shape in shapes.items()}
+        owner = names is None
+        for key in BUFFER_DTYPES:
+            setattr(self, key, None)
+        self._blocks = {}
+        for key, shape in self.shapes.items():
+            nbytes = max(int(np.prod(shape)) * np.dtype(BUFFER_DTYPES[key]).itemsize, 1)
+            self._blocks[key] = shared_memory.SharedMemory(create=True, size=nbytes) if owner else _attach(names[key])
+        # frombuffer views hold a buffer export, so the mapping outlives close() while any view is alive
+        for key, block in self._blocks.items():
+            count = int(np.prod(self.shapes[key]))
+            setattr(self, key, np.frombuffer(block.buf, dtype=BUFFER_DTYPES[key], count=count).reshape(self.shapes[key]))
+        self._finalizer = weakref.finalize(self, _release, list(self._blocks.values()), owner)
+
+    @property
+    def names(self):
+        return {key: block.name for key, block in self._blocks.items()}
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, key).nbytes for key in self.shapes)
+
+    def close(self):
+        # Removes the blocks; views a caller still holds stay readable until they are dropped
+        for key in self.shapes:
+            setattr(self, key, None)
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def durations(self, replication, duration_hours):
+        # Minutes of each treated case in one replication, looked up from its procedure codes
+        if self.codes is None:
+            raise ValueError("Per-case codes weren't kept; pass outputs including 'codes'")
+        codes = self.codes[replication, :self.cases_treated[replication]]
+        return np.asarray(duration_hours, dtype=float)[codes] * 60
+
+
+def max_cases_treated(cases, duration_hours, total_capacity_minutes):
+    # Upper bound on cases any replication can treat, used to size the per-case buffer
+    cases = np.asarray(cases, dtype=float).astype(np.int64).clip(0)
+    minutes = np.asarray(duration_hours, dtype=float) * 60
+    total = int(cases.sum())
+    if not total or (minutes[cases > 0] <= 0).any():
+        return total
+    return min(total, int(math.floor(total_capacity_minutes / minutes[cases > 0].min())))
+
+
+def _replication_seed(seed, replication):
+    # Independent, reproducible streams per replication, whichever worker runs it
+    return np.random.SeedSequence(entropy=seed, spawn_key=(replication,))
+
+
+def _run_replications(names, shapes, replications, cases, duration_hours, total_capacity_minutes, seed):
+    buffers = SharedReplications(shapes, names)
+    try:
+        for replication in replications:
+            case_rows, _, total_minutes = simulation.simulate_cases(
+                cases, duration_hours, total_capacity_minutes, _replication_seed(seed, replication)
+            )
+            buffers.cases_treated[replication] = len(case_rows)
+            buffers.minutes_treated[replication] = total_minutes
+            if buffers.procedure_counts is not None:
+                buffers.procedure_counts[replication] = np.bincount(case_rows, minlength=len(cases))
+            if buffers.codes is not None:
+                buffers.codes[replication, :len(case_rows)] = case_rows
+    finally:
+        buffers.close()
+    return len(replications)
+
+
+def default_executor(workers=None):
+    # Spawned rather than forked workers: the Streamlit server is multi-threaded, and a fresh
+    # interpreter only has to import NumPy and the core simulation to start
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(), mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def simulate_replications(cases, duration_hours, total_capacity_minutes, replications, seed=0, executor=None,
+                          chunks_per_worker=4, outputs=SUMMARY_BUFFERS):
+    # Run `replications` independent shuffles of the case mix across a process pool and return the
+    # SharedReplications holding their results. Pass an executor to reuse a pool between calls, and
+    # `outputs` to keep procedure_counts or codes as well as the summaries.
+    unknown = set(outputs) - set(BUFFER_DTYPES)
+    if unknown:
+        raise ValueError(f"Unknown output(s): {', '.join(sorted(unknown))}")
+    cases = np.asarray(cases, dtype=float)
+    duration_hours = np.asarray(duration_hours, dtype=float)
+    shapes = {'cases_treated': (replications,), 'minutes_treated': (replications,)}
+    if 'procedure_counts' in outputs:
+        shapes['procedure_counts'] = (replications, len(cases))
+    if 'codes' in outputs:
+        shapes['codes'] = (replications, max_cases_treated(cases, duration_hours, total_capacity_minutes))
+    buffers = SharedReplications(shapes)
+    own_executor = executor is None
+    executor = executor or default_executor()
+    try:
+        n_chunks = min(replications, getattr(executor, '_max_workers', 1) * chunks_per_worker)
+        futures = [
+            executor.submit(_run_replications, buffers.names, shapes, chunk.tolist(), cases, duration_hours, total_capacity_minutes, seed)
+            for chunk in np.array_split(np.arange(replications), max(n_chunks, 1)) if len(chunk)
+        ]
+        for future in futures:
+            future.result()
+    except BaseException:
+        buffers.close()
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return buffers
@@ -0,0 +1,24 @@
+import numpy as np
+
+# Random-order case mix simulation: every case is listed once, shuffled, and treated in that order
+# until the first case that no longer fits in the remaining capacity.
+
+
+def simulate_cases(cases, duration_hours, total_capacity_minutes, seed=None):
+    # `cases` and `duration_hours` are per-procedure arrays. Returns the procedure row of each treated
+    # case in treatment order, each treated case's minutes and the total minutes used.
+    # A seed of None draws a fresh order every call.
+    case_rows = shuffled_case_rows(cases, seed)
+    durations_minutes = np.asarray(duration_hours, dtype=float)[case_rows] * 60
+    cumulative_minutes = np.cumsum(durations_minutes)
+    cases_treated = int(np.searchsorted(cumulative_minutes, total_capacity_minutes, side='right'))
+    total_minutes = cumulative_minutes[cases_treated - 1] if cases_treated else 0
+    return case_rows[:cases_treated], durations_minutes[:cases_treated], total_minutes
+
+
+def shuffled_case_rows(cases, seed=None):
+    # Every case listed once by its procedure row, in random order; fractional demand is truncated
+    cases_per_procedure = np.asarray(cases, dtype=float).astype(np.int64).clip(0)
+    case_rows = np.repeat(np.arange(len(cases_per_procedure)), cases_per_procedure)
+    np.random.default_rng(seed).shuffle(case_rows)
+    return case_rows
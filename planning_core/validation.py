@@ -0,0 +1,138 @@
+import io
+
+import numpy as np
+
+from planning_core.lazy import pd
+
+# Schema validation and cleaning for uploaded procedure files. Every check is a column operation
+# over the whole file, and names are factorized once so duplicates are merged with integer keys
+# rather than string comparisons. Names match ignoring case and spacing.
+
+REQUIRED_COLUMNS = ['Procedure', 'Annual Demand (Cases)', 'Average Duration (Hours)']
+GROUP_COLUMNS = ['Site', 'Specialty']
+
+
+def _canonical_columns(columns):
+    # Match headers to the expected names ignoring case and surrounding whitespace
+    expected = {name.lower(): name for name in REQUIRED_COLUMNS + GROUP_COLUMNS}
+    return [expected.get(str(column).strip().lower(), str(column).strip()) for column in columns]
+
+
+def _first_positions(codes):
+    # Position of each code's first occurrence, for codes numbered in order of first appearance
+    # (as pd.factorize numbers them); a running maximum finds them without sorting
+    if not len(codes):
+        return np.empty(0, dtype=np.intp)
+    running_max = np.maximum.accumulate(codes)
+    return np.flatnonzero(np.r_[True, running_max[1:] > running_max[:-1]])
+
+
+def _factorize_names(values):
+    # Integer codes for text values compared ignoring case and spacing, so 'Hip', ' hip ' and
+    # 'HIP' are one name, shown as first spelled; -1 marks missing or blank entries. Names usually
+    # repeat, so the distinct values are found first and only those are normalised.
+    codes, uniques = pd.factorize(values)
+    if not len(uniques):
+        return codes, np.empty(0, dtype=object)
+    spelled = pd.Series(pd.Index(uniques).astype(str)).str.strip()
+    # Runs of whitespace inside a name are rare, so only those names go through the regex
+    uneven = spelled.str.contains(r'\s{2,}|[^\S ]', regex=True).to_numpy(dtype=bool)
+    if uneven.any():
+        spelled[uneven] = spelled[uneven].str.replace(r'\s+', ' ', regex=True)
+    # lower() rather than casefold(): it runs in Arrow rather than per name in Python, and they
+    # only differ for a handful of letters such as 'ß'
+    name_codes = pd.factorize(spelled.str.lower())[0]
+    names = spelled.to_numpy(dtype=object)[_first_positions(name_codes)]
+    name_codes = np.where(spelled.to_numpy(dtype=object) == '', -1, name_codes)
+    return np.where(codes >= 0, name_codes[codes], -1), names
+
+
+def _to_numbers(values):
+    # Floats for a column read as text (NaN where a value isn't a number). Each distinct text is
+    # parsed once, as the same few values usually repeat down the file.
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.to_numpy(dtype=float)
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_numeric(pd.Series(uniques, dtype=object), errors='coerce').to_numpy(dtype=float)
+    return np.where(codes >= 0, np.append(parsed, np.nan)[codes], np.nan)
+
+
+def _issues(rows, column, values, problem):
+    return pd.DataFrame({'Row': rows, 'Column': column, 'Value': np.asarray(values, dtype=object).astype(str), 'Problem': problem})
+
+
+def validate_procedures(raw_df):
+    # Returns (clean_df, issues_df, summary). Raises ValueError if a required column is missing.
+    # Rows with a blank name, a non-numeric, missing or negative demand or duration are dropped and
+    # reported by their line in the file; the remaining duplicates of a procedure (within a site and
+    # specialty, when given) are merged by summing demand and taking the case-weighted mean duration.
+    raw_df = raw_df.set_axis(_canonical_columns(raw_df.columns), axis=1)
+    missing = [column for column in REQUIRED_COLUMNS if column not in raw_df.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}. Found: {', '.join(map(str, raw_df.columns))}.")
+    if raw_df.columns.duplicated().any():
+        raise ValueError(f"Duplicate column(s): {', '.join(raw_df.columns[raw_df.columns.duplicated()])}.")
+
+    file_rows = np.arange(len(raw_df)) + 2  # header is line 1
+    issues = []
+    valid = np.ones(len(raw_df), dtype=bool)
+
+    procedure_codes, procedure_names = _factorize_names(raw_df['Procedure'])
+    blank = procedure_codes < 0
+    issues.append(_issues(file_rows[blank], 'Procedure', raw_df['Procedure'][blank].to_numpy(), 'Missing procedure name'))
+    valid &= ~blank
+
+    numeric = {}
+    for column in REQUIRED_COLUMNS[1:]:
+        raw_values = raw_df[column]
+        values = _to_numbers(raw_values)
+        empty = raw_values.isna().to_numpy()
+        not_numeric = np.isnan(values) & ~empty
+        out_of_range = ~np.isnan(values) & ((values < 0) | ~np.isfinite(values))
+        for mask, problem in ((not_numeric, 'Not a number'), (empty, 'Missing value'), (out_of_range, 'Negative or infinite')):
+            issues.append(_issues(file_rows[mask], column, raw_values[mask].to_numpy(), problem))
+            valid &= ~mask
+        numeric[column] = values
+
+    # One integer key per (procedure, site, specialty); absent group columns don't split the key and
+    # blank site or specialty values are grouped as 'Unknown'
+    group_columns = [column for column in GROUP_COLUMNS if column in raw_df.columns]
+    key = procedure_codes.astype(np.int64)
+    group_labels = {}
+    for column in group_columns:
+        codes, names = _factorize_names(raw_df[column])
+        group_labels[column] = np.append(names, 'Unknown')[np.where(codes >= 0, codes, len(names))]
+        key = key * (len(names) + 1) + np.where(codes >= 0, codes, len(names))
+    inverse = pd.factorize(key[valid])[0]
+    first_rows = np.flatnonzero(valid)[_first_positions(inverse)]
+
+    cases = numeric['Annual Demand (Cases)'][valid]
+    hours = numeric['Average Duration (Hours)'][valid]
+    n_groups = len(first_rows)
+    total_cases = np.bincount(inverse, weights=cases, minlength=n_groups)
+    case_hours = np.bincount(inverse, weights=cases * hours, minlength=n_groups)
+    rows_per_group = np.bincount(inverse, minlength=n_groups)
+    mean_hours = np.bincount(inverse, weights=hours, minlength=n_groups) / np.maximum(rows_per_group, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        durations = np.where(total_cases > 0, case_hours / total_cases, mean_hours)
+
+    clean_df = pd.DataFrame({
+        'Procedure': procedure_names[procedure_codes[first_rows]],
+        'Annual Demand (Cases)': total_cases.astype(np.int64) if np.all(total_cases == np.round(total_cases)) else total_cases,
+        'Average Duration (Hours)': durations,
+    })
+    for column in group_columns:
+        clean_df[column] = group_labels[column][first_rows]
+
+    issues_df = pd.concat(issues, ignore_index=True).sort_values('Row', kind='stable', ignore_index=True)
+    summary = {
+        'Rows Read': len(raw_df),
+        'Rows Dropped': int((~valid).sum()),
+        'Duplicate Rows Merged': int(valid.sum()) - n_groups,
+        'Procedures': n_groups,
+    }
+    return clean_df, issues_df, summary
+
+
+def read_and_validate_procedures(file_bytes):
+    return validate_procedures(pd.read_csv(io.BytesIO(file_bytes), skipinitialspace=True))
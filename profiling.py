@@ -0,0 +1,219 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+
+import streamlit as st
+
+# Opt-in rerun profiler for the planning apps.
+#
+# A script calls start_run() once at the top, marks its sections with
+# checkpoint(), wraps hot calls in `with profiler.stage(...)` and calls
+# render_panel() at the end. When profiling is disabled every hook returns
+# immediately, so the instrumented script runs at full speed.
+
+PROFILE_ENV_VAR = 'PLANNING_PROFILE'
+_SESSION_KEY = '_profiler'
+_HISTORY_KEY = '_profiler_history'
+_CACHE_KEY = '_profiler_cache_stats'
+_TRACE_KEY = '_profiler_trace_token'
+
+# tracemalloc is process-wide, so it runs while at least one session asks for memory tracing.
+# Each such session holds a token in its session state; the set is weak so a session that ends
+# without switching tracing off stops counting once its state is dropped.
+_TRACE_LOCK = threading.Lock()
+_TRACING_SESSIONS = weakref.WeakSet()
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start', 'memory')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.memory = self.profiler._memory()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._record(self.name, 'stage', self.start, time.perf_counter(), self.memory)
+        return False
+
+
+class Profiler:
+    def __init__(self, enabled=False, trace_memory=False, cache_stats=None):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.events = []
+        self.cache_stats = cache_stats if cache_stats is not None else {}
+        self.origin = time.perf_counter()
+        self._section = None
+
+    def _memory(self):
+        return tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+
+    def _record(self, name, category, start, end, memory_before):
+        self.events.append({
+            'name': name,
+            'category': category,
+            'start_ms': (start - self.origin) * 1000,
+            'duration_ms': (end - start) * 1000,
+            'memory_delta_kb': (self._memory() - memory_before) / 1024 if self.trace_memory else None,
+            'thread': threading.get_ident(),
+        })
+
+    def checkpoint(self, name):
+        # Close the current section (if any) and start timing the next one
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self._section is not None:
+            section_name, start, memory = self._section
+            self._record(section_name, 'section', start, now, memory)
+        self._section = (name, now, self._memory())
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def cache_call(self, name):
+        if self.enabled:
+            self.cache_stats.setdefault(name, [0, 0])[0] += 1
+
+    def cache_miss(self, name):
+        if self.enabled:
+            self.cache_stats.setdefault(name, [0, 0])[1] += 1
+
+    def finish(self):
+        if not self.enabled:
+            return
+        self.checkpoint(None)
+        self._section = None
+        self._record('Total rerun', 'run', self.origin, time.perf_counter(), 0)
+
+    def cache_summary(self):
+        return [
+            {'function': name, 'calls': calls, 'misses': misses, 'hit rate': (calls - misses) / calls if calls else 0.0}
+            for name, (calls, misses) in sorted(self.cache_stats.items())
+        ]
+
+    def to_json(self):
+        return json.dumps({'events': self.events, 'cache': self.cache_summary()}, indent=2)
+
+    def to_chrome_trace(self):
+        # Chrome trace event format, loadable in chrome://tracing or Perfetto
+        pid = os.getpid()
+        trace_events = [
+            {
+                'name': event['name'],
+                'cat': event['category'],
+                'ph': 'X',
+                'ts': event['start_ms'] * 1000,
+                'dur': event['duration_ms'] * 1000,
+                'pid': pid,
+                'tid': event['thread'],
+                'args': {'memory_delta_kb': event['memory_delta_kb']},
+            }
+            for event in self.events
+        ]
+        return json.dumps({'traceEvents': trace_events, 'displayTimeUnit': 'ms'})
+
+
+_DISABLED = Profiler(enabled=False)
+
+
+class _TraceToken:
+    pass
+
+
+def _update_tracing(wanted):
+    token = st.session_state.get(_TRACE_KEY)
+    if wanted and token is None:
+        token = st.session_state[_TRACE_KEY] = _TraceToken()
+    with _TRACE_LOCK:
+        if wanted:
+            _TRACING_SESSIONS.add(token)
+        elif token is not None:
+            _TRACING_SESSIONS.discard(token)
+        if _TRACING_SESSIONS and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not _TRACING_SESSIONS and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def default_enabled():
+    return os.environ.get(PROFILE_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+
+
+def start_run(enabled, trace_memory=False):
+    # Create this rerun's profiler and make it current for the session. Memory deltas include
+    # other sessions' allocations, since tracemalloc is process-wide.
+    _update_tracing(enabled and trace_memory)
+    if not enabled:
+        st.session_state[_SESSION_KEY] = _DISABLED
+        return _DISABLED
+    cache_stats = st.session_state.setdefault(_CACHE_KEY, {})
+    profiler = Profiler(enabled=True, trace_memory=trace_memory, cache_stats=cache_stats)
+    st.session_state[_SESSION_KEY] = profiler
+    return profiler
+
+
+def current():
+    return st.session_state.get(_SESSION_KEY, _DISABLED)
+
+
+def cached(**cache_kwargs):
+    # st.cache_data that also counts calls and misses for the current session's profiler
+    def decorator(func):
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            current().cache_miss(func.__name__)
+            return func(*args, **kwargs)
+
+        cached_func = st.cache_data(**cache_kwargs)(compute)
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            current().cache_call(func.__name__)
+            return cached_func(*args, **kwargs)
+
+        call.clear = cached_func.clear
+        return call
+    return decorator
+
+
+def render_panel(profiler, history_length=20):
+    # Sidebar panel with this rerun's timings, recent rerun totals and cache hit rates
+    if not profiler.enabled:
+        return
+    profiler.finish()
+    history = st.session_state.setdefault(_HISTORY_KEY, [])
+    history.append(profiler.events[-1]['duration_ms'])
+    del history[:-history_length]
+
+    st.sidebar.subheader('Profiling')
+    st.sidebar.write(f"**Last rerun:** {history[-1]:.1f} ms (median of last {len(history)}: {sorted(history)[len(history) // 2]:.1f} ms)")
+    columns = ['name', 'category', 'duration_ms', 'memory_delta_kb']
+    st.sidebar.dataframe([{column: event[column] for column in columns} for event in profiler.events[:-1]])
+    if profiler.cache_stats:
+        st.sidebar.write('**Cache hit rates (this session):**')
+        st.sidebar.dataframe(profiler.cache_summary())
+    st.sidebar.download_button('Download Profile (JSON)', data=profiler.to_json(), file_name='profile.json', mime='application/json')
+    st.sidebar.download_button('Download Chrome Trace', data=profiler.to_chrome_trace(), file_name='profile-trace.json', mime='application/json')
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from planning_core.lazy import pd
+
+# Named planning scenarios: a full parameter set plus the headline results it produced.
+# Scenarios are small JSON documents, kept in session state and persisted one file per
+# scenario so they survive restarts. Files live in a workspace subdirectory (a planner's or
+# team's name), so only planners using the same workspace see or replace each other's scenarios.
+
+SCENARIO_DIR_ENV_VAR = 'PLANNING_SCENARIO_DIR'
+DEFAULT_SCENARIO_DIR = '.scenarios'
+
+
+def scenario_directory():
+    return os.environ.get(SCENARIO_DIR_ENV_VAR, DEFAULT_SCENARIO_DIR)
+
+
+def workspace_directory(workspace, base=None):
+    return os.path.join(base or scenario_directory(), _slug(workspace))
+
+
+def _to_builtin(value):
+    if isinstance(value, dict):
+        return {str(key): _to_builtin(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_builtin(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _slug(name):
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '-', name).strip('-')[:40] or 'scenario'
+    return f"{slug}-{hashlib.sha1(name.encode()).hexdigest()[:8]}"
+
+
+def _file_name(name):
+    return f"{_slug(name)}.json"
+
+
+def data_fingerprint(df):
+    # Identifies the procedure data a scenario was computed from
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()[:12]
+
+
+def make_scenario(name, parameters, results, fingerprint):
+    return {
+        'name': name,
+        'data': fingerprint,
+        'parameters': _to_builtin(parameters),
+        'results': {normalise_result_key(key): value for key, value in _to_builtin(results).items()},
+    }
+
+
+def save_scenario(scenario, directory=None, overwrite=False):
+    # Raises ValueError if a scenario of the same name is already saved, unless `overwrite`
+    directory = directory or scenario_directory()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, _file_name(scenario['name']))
+    with open(path + '.tmp', 'w') as fh:
+        json.dump(scenario, fh, separators=(',', ':'))
+    if overwrite:
+        os.replace(path + '.tmp', path)
+        return path
+    # Linking fails if the file exists, so two sessions saving the same name can't both succeed
+    try:
+        os.link(path + '.tmp', path)
+    except FileExistsError:
+        raise ValueError(f"A scenario named '{scenario['name']}' is already saved") from None
+    finally:
+        os.remove(path + '.tmp')
+    return path
+
+
+def load_scenarios(directory=None):
+    directory = directory or scenario_directory()
+    scenarios = {}
+    if not os.path.isdir(directory):
+        return scenarios
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, file_name)) as fh:
+                scenario = json.load(fh)
+            scenarios[scenario['name']] = scenario
+        except (OSError, ValueError, KeyError):
+            continue
+    return scenarios
+
+
+def delete_scenario(name, directory=None):
+    path = os.path.join(directory or scenario_directory(), _file_name(name))
+    if os.path.exists(path):
+        os.remove(path)
+
+
+# Results whose names used to carry the horizon they were computed over. Scenarios with different
+# horizons still compare row for row; the horizon itself is one of the parameters.
+_RESULT_KEY_PATTERNS = [
+    (re.compile(r'^Waiting List after \d+ Years$'), 'Waiting List at End of Projection'),
+    (re.compile(r'^(.+) Breaching after \d+ Weeks$'), r'\1 Breaching at End of Priority Model'),
+]
+
+
+def normalise_result_key(key):
+    for pattern, replacement in _RESULT_KEY_PATTERNS:
+        key, count = pattern.subn(replacement, key)
+        if count:
+            break
+    return key
+
+
+def compare_results(scenarios):
+    # Metrics as rows, one column per scenario, plus the change against the first (baseline) scenario
+    table = pd.DataFrame({
+        scenario['name']: pd.Series({normalise_result_key(key): value for key, value in scenario['results'].items()}, dtype=float)
+        for scenario in scenarios
+    })
+    baseline = table.columns[0]
+    for name in table.columns[1:]:
+        table[f"{name} vs {baseline}"] = table[name] - table[baseline]
+    return table
+
+
+def compare_parameters(scenarios):
+    # Only the parameters that differ between the scenarios
+    table = pd.DataFrame({scenario['name']: pd.Series(scenario['parameters'], dtype=object) for scenario in scenarios})
+    differs = table.astype(str).nunique(axis=1) > 1
+    return table[differs]
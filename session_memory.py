@@ -0,0 +1,249 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
+import weakref
+
+import numpy as np
+import streamlit as st
+
+from planning_core import lazy
+from planning_core.lazy import pd
+
+# Per-session memory for the planning apps: a compact columnar table for manually entered
+# procedures, accounting of what each session holds in st.session_state, and a configurable
+# budget that spills the largest DataFrames to local disk when a session goes over it. Frames a
+# session keeps between reruns (uploaded procedures and what was derived from them) are stored
+# with put_frame and read back with get_frame, so they count against the budget and can spill.
+
+MEMORY_BUDGET_ENV_VAR = 'PLANNING_SESSION_MEMORY_MB'
+DEFAULT_MEMORY_BUDGET_MB = 64
+# Disk space for spilled frames across every session in the process
+SPILL_BUDGET_ENV_VAR = 'PLANNING_SPILL_DISK_MB'
+DEFAULT_SPILL_BUDGET_MB = 1024
+
+PROCEDURE_COLUMNS = ['Procedure', 'Annual Demand (Cases)', 'Average Duration (Hours)']
+_TOKENS_KEY = '_frame_tokens'
+
+
+class ProcedureTable:
+    # Procedures as typed arrays rather than one dict per row. Names are interned once as int32
+    # codes into a category list; the arrays grow geometrically so appends stay cheap. Demand is
+    # int64 so no case count a planner can enter overflows.
+    __slots__ = ('categories', 'category_codes', 'codes', 'demand', 'duration', 'size')
+
+    def __init__(self, capacity=16):
+        self.categories = []
+        self.category_codes = {}
+        self.codes = np.empty(capacity, dtype=np.int32)
+        self.demand = np.empty(capacity, dtype=np.int64)
+        self.duration = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls(capacity=max(len(records), 16))
+        for record in records:
+            table.append(*(record[column] for column in PROCEDURE_COLUMNS))
+        return table
+
+    def append(self, name, demand, duration):
+        if self.size == len(self.codes):
+            capacity = 2 * len(self.codes)
+            self.codes = np.resize(self.codes, capacity)
+            self.demand = np.resize(self.demand, capacity)
+            self.duration = np.resize(self.duration, capacity)
+        code = self.category_codes.get(name)
+        if code is None:
+            code = self.category_codes[name] = len(self.categories)
+            self.categories.append(name)
+        self.codes[self.size] = code
+        self.demand[self.size] = demand
+        self.duration[self.size] = duration
+        self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def nbytes(self):
+        return (self.codes.nbytes + self.demand.nbytes + self.duration.nbytes
+                + sum(sys.getsizeof(name) for name in self.categories))
+
+    def to_frame(self):
+        names = np.asarray(self.categories, dtype=object)[self.codes[:self.size]]
+        return pd.DataFrame({
+            'Procedure': names,
+            'Annual Demand (Cases)': self.demand[:self.size],
+            'Average Duration (Hours)': self.duration[:self.size],
+        }, columns=PROCEDURE_COLUMNS)
+
+
+def procedure_table(state_key='procedures', default_records=()):
+    # The session's ProcedureTable, created (or converted from a list of row dicts) on first use
+    value = st.session_state.get(state_key)
+    if not isinstance(value, ProcedureTable):
+        value = ProcedureTable.from_records(list(value) if value is not None else list(default_records))
+        st.session_state[state_key] = value
+    return value
+
+
+class SpilledFrame:
+    # Placeholder left in session state for a DataFrame written out to local disk. The file is
+    # deleted when the placeholder goes: replaced under its key, or dropped with an ended session.
+    __slots__ = ('path', 'nbytes', '_finalizer', '__weakref__')
+
+    def __init__(self, path, nbytes):
+        self.path = path
+        self.nbytes = nbytes
+        self._finalizer = weakref.finalize(self, _remove_spill_file, path, os.path.getsize(path))
+
+    def load(self):
+        return pd.read_pickle(self.path)
+
+    def discard(self):
+        self._finalizer()
+
+
+_spill_directory = None
+_spill_lock = threading.Lock()
+_spill_disk_bytes = 0
+
+
+def spill_directory():
+    global _spill_directory
+    if _spill_directory is None:
+        _spill_directory = tempfile.mkdtemp(prefix='planning-spill-')
+        atexit.register(shutil.rmtree, _spill_directory, True)
+    return _spill_directory
+
+
+def spill_budget_bytes():
+    return float(os.environ.get(SPILL_BUDGET_ENV_VAR, DEFAULT_SPILL_BUDGET_MB)) * 1024 ** 2
+
+
+def spilled_disk_bytes():
+    return _spill_disk_bytes
+
+
+def _spill_frame(frame, nbytes):
+    # Write `frame` out and return its placeholder, or None if it would take the process over its
+    # spill budget (the frame then stays in memory)
+    global _spill_disk_bytes
+    path = os.path.join(spill_directory(), f"{uuid.uuid4().hex}.pkl")
+    frame.to_pickle(path)
+    size = os.path.getsize(path)
+    with _spill_lock:
+        fits = _spill_disk_bytes + size <= spill_budget_bytes()
+        if fits:
+            _spill_disk_bytes += size
+    if not fits:
+        os.remove(path)
+        return None
+    return SpilledFrame(path, nbytes)
+
+
+def _remove_spill_file(path, size):
+    global _spill_disk_bytes
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    with _spill_lock:
+        _spill_disk_bytes -= size
+
+
+def memory_budget_bytes():
+    return float(os.environ.get(MEMORY_BUDGET_ENV_VAR, DEFAULT_MEMORY_BUDGET_MB)) * 1024 ** 2
+
+
+def object_nbytes(value):
+    # Until pandas is imported there can't be any frames, and checking for one would import it
+    if lazy.is_loaded('pandas') and isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if lazy.is_loaded('pandas') and isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (np.ndarray, ProcedureTable)):
+        return int(value.nbytes)
+    if isinstance(value, SpilledFrame):
+        return 0
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(object_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(object_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def session_memory_usage():
+    # Bytes held by each session state entry, largest first
+    usage = {str(key): object_nbytes(value) for key, value in st.session_state.items()}
+    return dict(sorted(usage.items(), key=lambda item: item[1], reverse=True))
+
+
+def put_frame(key, frame, token=None):
+    # Keep a frame in session state under the budget. `token` identifies what it was built from;
+    # get_frame with a different token treats the frame as missing.
+    previous = st.session_state.get(key)
+    if isinstance(previous, SpilledFrame):
+        previous.discard()
+    st.session_state[key] = frame
+    st.session_state.setdefault(_TOKENS_KEY, {})[key] = token
+    enforce_budget()
+    return frame
+
+
+def get_frame(key, token=None):
+    # The frame stored under `key` (loaded back from disk if it was spilled), or None if there is
+    # none or it was built from something else; a stale frame is dropped straight away
+    if st.session_state.get(_TOKENS_KEY, {}).get(key) != token:
+        drop_frame(key)
+        return None
+    value = st.session_state.get(key)
+    return value.load() if isinstance(value, SpilledFrame) else value
+
+
+def drop_frame(key):
+    # Forget a stored frame, deleting its spill file if it has one
+    value = st.session_state.pop(key, None)
+    if isinstance(value, SpilledFrame):
+        value.discard()
+    st.session_state.get(_TOKENS_KEY, {}).pop(key, None)
+
+
+def enforce_budget(budget_bytes=None):
+    # Spill the largest in-memory DataFrames to disk until the session fits its budget, as far as
+    # the process-wide spill budget allows
+    budget_bytes = memory_budget_bytes() if budget_bytes is None else budget_bytes
+    usage = session_memory_usage()
+    total = sum(usage.values())
+    spilled = []
+    for key, nbytes in usage.items():
+        if total <= budget_bytes:
+            break
+        value = st.session_state[key]
+        if lazy.is_loaded('pandas') and isinstance(value, pd.DataFrame):
+            placeholder = _spill_frame(value, nbytes)
+            if placeholder is None:
+                continue
+            st.session_state[key] = placeholder
+            total -= nbytes
+            spilled.append(key)
+    return spilled
+
+
+def render_panel():
+    # Sidebar summary of this session's memory against its budget
+    usage = session_memory_usage()
+    spilled = {key: value.nbytes for key, value in st.session_state.items() if isinstance(value, SpilledFrame)}
+    st.sidebar.subheader('Session Memory')
+    st.sidebar.write(f"**In memory:** {sum(usage.values()) / 1024:.1f} KB of {memory_budget_bytes() / 1024 ** 2:g} MB budget")
+    if spilled:
+        st.sidebar.write(f"**Spilled to disk:** {sum(spilled.values()) / 1024:.1f} KB ({', '.join(map(str, spilled))})")
+    st.sidebar.write(f"**Spill files (all sessions):** {spilled_disk_bytes() / 1024 ** 2:.1f} MB of {spill_budget_bytes() / 1024 ** 2:g} MB")
+    st.sidebar.dataframe(
+        pd.DataFrame({'Key': list(usage), 'KB': np.round(np.array(list(usage.values()), dtype=float) / 1024, 1)}),
+        hide_index=True
+    )
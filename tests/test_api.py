@@ -0,0 +1,108 @@
+import asyncio
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from planning_core import api, batch
+
+RECORDS = [
+    {'Procedure': 'Hip', 'Annual Demand (Cases)': 164, 'Average Duration (Hours)': 1.5, 'Site': 'North'},
+    {'Procedure': 'Knee', 'Annual Demand (Cases)': 196, 'Average Duration (Hours)': 1.1, 'Site': 'North'},
+    {'Procedure': 'Hernia', 'Annual Demand (Cases)': 76, 'Average Duration (Hours)': 3.75, 'Site': 'South'},
+]
+
+
+@pytest.fixture(scope='module')
+def service():
+    service = api.ModelService(pd.DataFrame(RECORDS), workers=1)
+    yield service
+    service.close()
+
+
+def request(service, path, payload=None, method='POST'):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    return asyncio.run(service.handle(method, path, body))
+
+
+def expected_result(records, **params):
+    frame = pd.DataFrame(records)
+    return batch.run_scenario(
+        {**batch.SCENARIO_DEFAULTS, **params},
+        frame['Annual Demand (Cases)'].to_numpy(dtype=float), frame['Average Duration (Hours)'].to_numpy(dtype=float)
+    )
+
+
+def test_routes(service):
+    assert request(service, '/v1/health', method='GET') == (200, {'status': 'ok'})
+    assert request(service, '/v1/nowhere')[0] == 404
+    assert request(service, '/v1/scenario', method='GET')[0] == 405
+
+
+@pytest.mark.parametrize('path, payload', [
+    ('/v1/scenario', b'{"Utilisation": '),
+    ('/v1/scenario', {'Utilisation': 0.8, 'Sessions': 12}),
+    ('/v1/scenario', {'Utilisation': 'high'}),
+    ('/v1/scenario', {'Utilisation': True}),
+    ('/v1/scenario', {'Site': 3}),
+    ('/v1/scenario', [1, 2]),
+    ('/v1/scenario', {'procedures': []}),
+    ('/v1/scenarios', {'scenarios': {'Utilisation': 0.8}}),
+    ('/v1/scenarios', {'scenarios': [{'Utilisation': 0.8}, {'Utilisation': 'high'}]}),
+])
+def test_malformed_requests_are_400(service, path, payload):
+    status, reply = request(service, path, payload)
+    assert status == 400
+    assert reply['error']
+
+
+def test_invalid_procedures_and_failed_runs_are_422(service):
+    status, reply = request(service, '/v1/scenario', {'procedures': RECORDS + [
+        {'Procedure': 'Bad', 'Annual Demand (Cases)': -1, 'Average Duration (Hours)': 1}
+    ]})
+    assert status == 422 and 'procedures' in reply['error']
+    status, reply = request(service, '/v1/scenario', {'Specialty': 'Ortho'})
+    assert status == 422 and 'Specialty' in reply['error']
+    status, reply = request(service, '/v1/scenario', {'Site': 'West'})
+    assert status == 422 and reply['Error']
+
+
+def test_repeat_scenarios_are_served_from_cache(service):
+    scenario = {'Utilisation': 0.83, 'Sessions per Week': 7}
+    status, first = request(service, '/v1/scenario', scenario)
+    assert status == 200 and not first['Cached']
+    status, second = request(service, '/v1/scenario', {**scenario, 'Scenario': 'Again'})
+    assert status == 200 and second['Cached'] and second['Scenario'] == 'Again'
+    for key, value in expected_result(RECORDS, **scenario).items():
+        assert first[key] == pytest.approx(value) and second[key] == pytest.approx(value)
+    # A different site is a different scenario, even with the same parameters
+    status, reply = request(service, '/v1/scenarios', {'scenarios': [scenario, {**scenario, 'Site': 'North'}]})
+    assert status == 200
+    assert [result['Cached'] for result in reply['results']] == [True, False]
+    assert reply['results'][1]['Procedures'] == 2
+
+
+def test_large_bodies_match_small_ones(service):
+    rng = np.random.default_rng(0)
+    records = [{'Procedure': f"Procedure {i}", 'Annual Demand (Cases)': int(rng.integers(1, 50)),
+                'Average Duration (Hours)': round(float(rng.uniform(0.5, 3)), 2)} for i in range(2000)]
+    body = json.dumps({'scenarios': [{'procedures': records, 'Utilisation': u} for u in (0.8, 0.9)]}).encode()
+    assert len(body) > api.INLINE_BODY_BYTES
+    status, reply = request(service, '/v1/scenarios', body)
+    assert status == 200
+    for result, utilisation in zip(reply['results'], (0.8, 0.9)):
+        for key, value in expected_result(records, Utilisation=utilisation).items():
+            assert result[key] == pytest.approx(value)
+    # Parsed in the pool, the inline procedures arrive validated, once per distinct list
+    payload = api.prepare_request('/v1/scenarios', body)
+    first, second = (scenario['procedures'] for scenario in payload['scenarios'])
+    assert isinstance(first, api.PreparedProcedures) and first is second and first.error is None
+
+    bad = json.dumps({'procedures': records + [{'Procedure': 'Bad', 'Annual Demand (Cases)': 'many',
+                                                 'Average Duration (Hours)': 1}]}).encode()
+    status, reply = request(service, '/v1/scenario', bad)
+    assert status == 422 and 'procedures' in reply['error']
+    for body in (b'{"Utilisation": ' + b'x' * api.INLINE_BODY_BYTES, b'[' * (api.INLINE_BODY_BYTES + 1), b'[' * 10000):
+        status, reply = request(service, '/v1/scenario', body)
+        assert status == 400 and reply['error'].startswith('Invalid JSON')
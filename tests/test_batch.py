@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from planning_core import batch, executors
+
+
+def make_procedures():
+    rng = np.random.default_rng(3)
+    n = 24
+    return pd.DataFrame({
+        'Procedure': [f"Procedure {i}" for i in range(n)],
+        'Annual Demand (Cases)': rng.integers(10, 400, n),
+        'Average Duration (Hours)': rng.uniform(0.25, 4, n).round(2),
+        'Site': rng.choice(['North', 'South'], n),
+        'Specialty': rng.choice(['Ortho', 'Gen Surg', 'ENT'], n),
+    })
+
+
+SCENARIOS = pd.DataFrame({
+    'Scenario': ['Base', 'Growth', 'More Sessions', 'North Ortho', 'Missing Site'],
+    'Demand Multiplier': [1.0, 1.1, 1.0, 1.0, 1.0],
+    'Sessions per Week': [10, 10, 14, 3, 10],
+    'Simulation Random Seed': [0, 1, 2, 3, 4],
+    'Projection Years': [1, 3, 2, 1, 1],
+    'Demand Growth (%)': [0, 5, 2, 0, 0],
+    'Site': [None, None, None, 'North', 'West'],
+    'Specialty': [None, None, None, 'Ortho', None],
+})
+
+
+@pytest.mark.parametrize('kind', ['local', 'distributed'])
+def test_executors_match_inline(kind):
+    procedures = make_procedures()
+    expected = batch.run_batch(procedures, SCENARIOS, executors.InlineExecutor(), per_group=True, chunk_size=4)
+    if kind == 'local':
+        executor = executors.LocalExecutor(workers=2)
+    else:
+        executor = executors.DistributedExecutor(('127.0.0.1', 0), authkey='test-key', local_workers=2, idle_timeout=30)
+    with executor:
+        results = batch.run_batch(procedures, SCENARIOS, executor, per_group=True, chunk_size=4)
+    pd.testing.assert_frame_equal(results, expected)
+
+
+def test_inline_results_per_scenario_and_group():
+    procedures = make_procedures()
+    results = batch.run_batch(procedures, SCENARIOS, executors.InlineExecutor(), per_group=True)
+    groups = len(procedures.groupby(['Site', 'Specialty']))
+    # Unfiltered scenarios run once per site and specialty; filtered ones once
+    assert len(results) == 3 * groups + 2
+    assert results['Error'].notna().sum() == 1
+    assert results.loc[results['Error'].notna(), 'Scenario'].item() == 'Missing Site'
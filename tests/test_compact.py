@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from planning_core import compact
+
+
+def make_procedures(n=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Procedure': [f"Procedure {i}" for i in range(n)],
+        'Annual Demand (Cases)': rng.integers(0, 5000, n),
+        'Average Duration (Hours)': rng.uniform(0.1, 8, n).round(3),
+        'Site': rng.choice(['North', 'South', 'East'], n),
+        'Specialty': rng.choice(['Ortho', 'Gen Surg', 'ENT', 'Urology'], n),
+    })
+
+
+def test_compact_table_types():
+    df = make_procedures(100)
+    small = compact.compact_procedures(df.assign(**{'Annual Demand (Minutes)': 1.0}))
+    assert compact.is_compact(small) and not compact.is_compact(df)
+    assert small['Annual Demand (Cases)'].dtype == np.int32
+    assert all(isinstance(small[column].dtype, pd.CategoricalDtype) for column in compact.CATEGORY_COLUMNS)
+    assert 'Annual Demand (Minutes)' not in small
+    fractional = compact.compact_procedures(df.assign(**{'Annual Demand (Cases)': df['Annual Demand (Cases)'] + 0.5}))
+    assert fractional['Annual Demand (Cases)'].dtype == np.float32
+    with pytest.raises(KeyError):
+        compact.derived_column(small, 'Weeks Waited')
+
+
+@pytest.mark.parametrize('per_row', [False, True])
+def test_compact_totals_match_float64(per_row):
+    df = make_procedures()
+    multipliers = np.random.default_rng(1).uniform(0.8, 1.3, len(df)) if per_row else 1.1
+    small = compact.compact_procedures(df)
+
+    standard, compacted = compact.demand_totals(df, multipliers), compact.demand_totals(small, multipliers)
+    assert list(compacted.index) == list(standard.index)
+    np.testing.assert_allclose(compacted.to_numpy(), standard.to_numpy(), rtol=1e-6)
+
+    ungrouped = [column for column in df if column not in ('Site', 'Specialty')]
+    standard, compacted = compact.demand_totals(df[ungrouped], multipliers), compact.demand_totals(small[ungrouped], multipliers)
+    assert compacted.keys() == standard.keys()
+    for column in compact.DERIVED_COLUMNS:
+        assert compacted[column] == pytest.approx(standard[column], rel=1e-6)
+
+
+def test_precision_report():
+    df = make_procedures()
+    accuracy, memory = compact.precision_report(df, 1.1)
+    assert accuracy['Column'].tolist() == compact.DERIVED_COLUMNS
+    assert (accuracy['Total Relative Difference'] < 1e-6).all()
+    assert (accuracy['Largest Row Relative Difference'] < 1e-6).all()
+    assert memory['Compact (MB)'] < memory['float64 (MB)'] and memory['Saving (%)'] > 50
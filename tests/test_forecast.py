@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from planning_core import forecast
+
+
+def _history_csv(series, end='2026-09'):
+    # {procedure: monthly cases, oldest first}, every series ending in the same month
+    frames = []
+    for procedure, cases in series.items():
+        months = pd.period_range(end=end, periods=len(cases), freq='M').to_timestamp()
+        frames.append(pd.DataFrame({'Procedure': procedure, 'Month': months, 'Cases': cases}))
+    return pd.concat(frames).to_csv(index=False).encode()
+
+
+def _multipliers(series, method):
+    return forecast.forecast_multipliers(_history_csv(series), method).set_index('Procedure')['Multiplier']
+
+
+@pytest.mark.parametrize('method', forecast.FORECAST_METHODS)
+@pytest.mark.parametrize('months', [6, 9, 12, 36])
+def test_flat_history_gives_multiplier_one(method, months):
+    assert np.isclose(_multipliers({'Flat': np.full(months, 100.0)}, method)['Flat'], 1.0)
+
+
+@pytest.mark.parametrize('method', forecast.FORECAST_METHODS)
+def test_late_starting_procedure_is_fitted_from_its_first_month(method):
+    multipliers = _multipliers({'Old': np.full(36, 80.0), 'New': np.full(8, 100.0)}, method)
+    assert np.allclose(multipliers, 1.0)
+
+
+def test_linear_trend_multiplier():
+    # 100 cases in the first month, rising 5 a month: the next 12 months against the last 12
+    cases = 100 + 5 * np.arange(24.0)
+    expected = (100 + 5 * np.arange(24, 36.0)).sum() / cases[-12:].sum()
+    multiplier = _multipliers({'Trend': cases}, 'Linear Trend + Seasonal Index')['Trend']
+    assert np.isclose(multiplier, expected)
+    assert multiplier > 1.0
+    assert _multipliers({'Trend': cases}, 'Exponential Smoothing (Holt)')['Trend'] > 1.0
+
+
+def test_short_trend_is_not_inflated_by_the_window():
+    # Six months rising 5 a month: the annualised last six months against the next twelve
+    cases = 100 + 5 * np.arange(6.0)
+    expected = (100 + 5 * np.arange(6, 18.0)).sum() / (cases.sum() * 2)
+    assert np.isclose(_multipliers({'Trend': cases}, 'Linear Trend + Seasonal Index')['Trend'], expected)
+
+
+def test_seasonal_history_without_trend_gives_multiplier_one():
+    season = 100 * (1 + 0.3 * np.sin(2 * np.pi * np.arange(12) / 12))
+    history = np.tile(season, 3)
+    result = forecast.forecast_multipliers(_history_csv({'Seasonal': history}), 'Linear Trend + Seasonal Index')
+    assert np.isclose(result['Multiplier'].iloc[0], 1.0)
+    # The seasonal index carries the shape into the forecast, not just the level
+    assert np.allclose(forecast.forecast_linear_seasonal(history[None, :])[0], season)
+
+
+def test_too_short_history_gets_no_multiplier():
+    result = forecast.forecast_multipliers(
+        _history_csv({'Short': np.full(forecast.MIN_HISTORY_MONTHS - 1, 100.0), 'Long': np.full(24, 50.0)}),
+        'Linear Trend + Seasonal Index',
+    ).set_index('Procedure')
+    assert np.isnan(result.loc['Short', 'Multiplier'])
+    assert np.isclose(result.loc['Long', 'Multiplier'], 1.0)
+
+
+def test_trend_with_seasonality():
+    season = 1 + 0.3 * np.sin(2 * np.pi * np.arange(12) / 12)
+    history = (100 + 2 * np.arange(36.0)) * np.tile(season, 3)
+    expected = (100 + 2 * np.arange(36, 48.0)) * season
+    assert np.allclose(forecast.forecast_linear_seasonal(history[None, :])[0], expected, rtol=0.02)
+    multiplier = _multipliers({'Seasonal Trend': history}, 'Linear Trend + Seasonal Index')['Seasonal Trend']
+    assert np.isclose(multiplier, expected.sum() / history[-12:].sum(), rtol=0.02)
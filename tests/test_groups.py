@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from planning_core import capacity, groups
+
+
+def _demand():
+    rng = np.random.default_rng(0)
+    n = 60
+    cases = rng.integers(1, 200, n).astype(float)
+    hours = rng.uniform(0.5, 4, n)
+    return pd.DataFrame({
+        'Procedure': [f'P{i}' for i in range(n)],
+        'Site': rng.choice(['North', 'South', 'West'], n),
+        'Specialty': rng.choice(['Ortho', 'Gen Surg'], n),
+        'Annual Demand (Cases)': cases,
+        'Next Year Demand (Cases)': cases * 1.1,
+        'Next Year Demand (Minutes)': cases * 1.1 * hours * 60,
+    })
+
+
+def _params(demand, sessions_per_week, waiting_list_start):
+    keys = demand[groups.GROUP_COLUMNS].drop_duplicates().sort_values(groups.GROUP_COLUMNS).reset_index(drop=True)
+    share = demand.groupby(groups.GROUP_COLUMNS)['Next Year Demand (Minutes)'].sum().to_numpy() / demand['Next Year Demand (Minutes)'].sum()
+    return keys.assign(**{
+        'Sessions per Week': sessions_per_week * share,
+        'Weeks per Year': 46.0,
+        'Utilisation': 0.85,
+        'Waiting List Start': waiting_list_start * share,
+    })
+
+
+def test_group_totals_reconcile_to_ungrouped_model():
+    demand = _demand()
+    results = groups.compute_group_aggregates(demand, _params(demand, 20.0, 900.0), 4.0)
+    total = groups.roll_up_groups(results, []).iloc[0]
+
+    assert total['Procedures'] == len(demand)
+    for column in ['Annual Demand (Cases)', 'Next Year Demand (Cases)', 'Next Year Demand (Minutes)']:
+        assert np.isclose(total[column], demand[column].sum())
+    assert np.isclose(total['Capacity (Minutes)'], capacity.session_minutes(46.0, 20.0, 4.0, 0.85))
+    assert np.isclose(total['Required Sessions per Week'],
+                      capacity.required_sessions_per_week(demand['Next Year Demand (Minutes)'].sum(), 46.0, 4.0, 0.85))
+    assert np.isclose(total['Waiting List Start'], 900.0)
+
+    # Capacity is short in every group and each group's sessions follow its demand minutes, so each
+    # group treats its share of what the single-service model treats
+    assert (results['Capacity (Minutes)'] < results['Next Year Demand (Minutes)']).all()
+    minutes_per_case = demand['Next Year Demand (Minutes)'].sum() / demand['Next Year Demand (Cases)'].sum()
+    waiting = 900.0 + demand['Next Year Demand (Cases)'].sum()
+    expected_treated = min(waiting, capacity.session_minutes(46.0, 20.0, 4.0, 0.85) / minutes_per_case)
+    assert np.isclose(total['Expected Cases Treated'], expected_treated)
+    assert np.isclose(total['Waiting List End'], waiting - expected_treated)
+
+
+def test_roll_ups_match_their_groups():
+    demand = _demand()
+    results = groups.compute_group_aggregates(demand, _params(demand, 12.0, 400.0), 4.0)
+    assert np.allclose(results['Waiting List End'], results['Waiting List Start'] + results['Next Year Demand (Cases)'] - results['Expected Cases Treated'])
+    for level in ['Site', 'Specialty']:
+        rolled = groups.roll_up_groups(results, [level]).set_index(level)
+        assert np.allclose(rolled[groups.GROUP_SUM_COLUMNS], results.groupby(level)[groups.GROUP_SUM_COLUMNS].sum())
+        assert np.allclose(rolled[groups.GROUP_SUM_COLUMNS].sum(), groups.roll_up_groups(results, []).iloc[0])
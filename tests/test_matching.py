@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+from planning_core import matching
+
+CANONICAL = pd.DataFrame({
+    'Procedure': ['Total Hip Replacement', 'Knee', 'Inguinal Hernia Repair', 'Cataract Extraction'],
+    'Code': ['W37.1', '', 'T20', ''],
+    'Aliases': ['THR', 'Knee Replacement;TKR', '', ''],
+})
+
+
+def match_one(matcher, name):
+    row = matcher.match([name], save=False).iloc[0]
+    return row['Canonical Procedure'] if pd.notna(row['Canonical Procedure']) else None, row['Match'], row['Score']
+
+
+@pytest.mark.parametrize('name, canonical, method', [
+    ('W37.1 Something else', 'Total Hip Replacement', 'Code'),
+    ('W371', 'Total Hip Replacement', 'Code'),
+    ('T20.2 groin', 'Inguinal Hernia Repair', 'Code'),  # a subcategory under a canonical category
+    ('Hip, total replacement of the', 'Total Hip Replacement', 'Exact'),
+    ('TKR', 'Knee', 'Exact'),
+    ('Inguinal hernia repar', 'Inguinal Hernia Repair', 'Fuzzy'),
+    ('knee op', 'Knee', 'Suggested'),
+    ('Appendicectomy', None, 'Unmatched'),
+    ('', None, 'Unmatched'),
+])
+def test_match_methods(tmp_path, name, canonical, method):
+    matcher = matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path)
+    assert match_one(matcher, name)[:2] == (canonical, method)
+
+
+def test_score_thresholds(tmp_path):
+    _, _, score = match_one(matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path), 'knee op')
+    assert 0.6 <= score < matching.CONFIRM_SCORE
+    assert match_one(matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path, confirm_score=score), 'knee op')[:2] == ('Knee', 'Fuzzy')
+    # Below min_score there is no match, but the score is still reported
+    assert match_one(matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path, min_score=score + 0.01), 'knee op') == (None, 'Unmatched', score)
+    # confirm_score never sits under min_score
+    assert matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path, min_score=0.9, confirm_score=0.5).confirm_score == 0.9
+
+
+def test_fuzzy_matches_are_reused_across_matchers(tmp_path):
+    names = ['Inguinal hernia repar', 'knee op', 'Appendicectomy']
+    first = matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path).match(names)
+    second = matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path).match(names)
+    assert first['Match'].tolist() == ['Fuzzy', 'Suggested', 'Unmatched']
+    assert second['Match'].tolist() == ['Cached', 'Suggested', 'Unmatched']
+    assert second['Score'].tolist() == first['Score'].tolist()
+
+
+def test_suggested_matches_merge_only_when_confirmed(tmp_path):
+    matcher = matching.ProcedureMatcher(CANONICAL, cache_dir=tmp_path)
+    uploads = [
+        pd.DataFrame({'Procedure': ['THR', 'Knee'], 'Annual Demand (Cases)': [100, 50], 'Average Duration (Hours)': [2.0, 1.0]}),
+        pd.DataFrame({'Procedure': ['W37.1 Hip', 'knee op'], 'Annual Demand (Cases)': [20, 150], 'Average Duration (Hours)': [3.2, 2.0]}),
+    ]
+
+    merged, mapping, summary = matching.merge_uploads(uploads, matcher, ['2023.csv', '2024.csv'])
+    demand = merged.set_index('Procedure')['Annual Demand (Cases)']
+    assert demand.to_dict() == {'Total Hip Replacement': 120, 'Knee': 50, 'knee op': 150}
+    assert merged.set_index('Procedure').loc['Total Hip Replacement', 'Average Duration (Hours)'] == pytest.approx((100 * 2.0 + 20 * 3.2) / 120)
+    assert mapping['File'].tolist() == ['2023.csv', '2023.csv', '2024.csv', '2024.csv']
+    assert (summary['Suggested'], summary['Matched by Confirmed'], summary['Procedures']) == (1, 0, 3)
+
+    merged, mapping, summary = matching.merge_uploads(uploads, matcher, confirmed=['knee op'])
+    demand = merged.set_index('Procedure')['Annual Demand (Cases)']
+    assert demand.to_dict() == {'Total Hip Replacement': 120, 'Knee': 200}
+    assert merged.set_index('Procedure').loc['Knee', 'Average Duration (Hours)'] == pytest.approx((50 * 1.0 + 150 * 2.0) / 200)
+    assert mapping.loc[mapping['Procedure'] == 'knee op', 'Match'].item() == 'Confirmed'
+    assert (summary['Suggested'], summary['Matched by Confirmed'], summary['Procedures']) == (0, 1, 2)
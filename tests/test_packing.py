@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from planning_core import packing
+
+
+def test_cases_objective_packs_short_cases():
+    result = packing.compare_packing([164, 196, 76, 28], np.array([18.9, 65.5, 225.2, 283.0]) / 60, 188, 78.3, 'Cases', seed=1)
+    assert result['Optimised']['Cases Treated'] == 311
+    assert result['Cases Gap'] > 0
+
+
+@pytest.mark.parametrize('objective', packing.PACKING_OBJECTIVES)
+def test_optimised_between_random_order_and_bounds(objective):
+    rng = np.random.default_rng(0)
+    for seed in range(200):
+        n = rng.integers(1, 8)
+        cases, hours = rng.integers(0, 300, n), rng.uniform(0.1, 5, n)
+        sessions, session_minutes = int(rng.integers(1, 300)), float(rng.uniform(30, 300))
+        result = packing.compare_packing(cases, hours, sessions, session_minutes, objective, seed)
+        optimised = result['Optimised']
+        assert optimised['Cases Treated'] <= result['Cases Bound']
+        assert optimised['Minutes Treated'] <= result['Minutes Bound'] + 1e-6
+        assert (optimised['Session Minutes Used'] <= session_minutes + 1e-6).all()
+        if objective == 'Cases':
+            assert result['Cases Gap'] >= 0
+        else:
+            assert result['Minutes Gap'] >= -1e-6
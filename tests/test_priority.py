@@ -0,0 +1,19 @@
+import numpy as np
+
+from planning_core import priority
+
+
+def test_initial_waiting_list_keeps_every_patient():
+    procedure_shares = np.array([0.25, 0.75])
+    initial = priority.initial_priority_waiting_list(1000, 0.2, [0.1, 0.2, 0.3, 0.4], procedure_shares, [1, 4, 13, 18], 30)
+    assert np.isclose(initial.sum(), 1000)
+    assert np.allclose(initial.sum(axis=(1, 2)), [100, 200, 300, 400])
+
+
+def test_zero_week_target_starts_whole_class_breaching():
+    procedure_shares = np.array([0.5, 0.5])
+    initial = priority.initial_priority_waiting_list(1000, 0.2, [0.25, 0.75], procedure_shares, [0, 4], 10)
+    assert np.isclose(initial.sum(), 1000)
+    assert np.isclose(initial[0].sum(), 250)
+    assert np.isclose(initial[0, 0].sum(), 250)
+    assert np.isclose(initial[1].sum(), 750)
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from planning_core import capacity, projection
+
+
+@pytest.mark.parametrize('capacity_minutes', [5_000.0, 60_000.0, 500_000.0])
+def test_one_year_projection_matches_single_year_model(capacity_minutes):
+    # All procedures share one case length, and no capacity is held back for breaches
+    cases, start = np.array([120.0, 40.0, 300.0]), np.array([50.0, 10.0, 90.0])
+    case_minutes = np.full(3, 90.0)
+    year = projection.project_years(cases, case_minutes, start, [1.0], [capacity_minutes])[0]
+    single_year = capacity.waiting_list_year(start.sum(), 0.0, cases.sum(), capacity_minutes, 0.0, 90.0)
+    assert np.isclose(year['Treated'].sum(), single_year['Non-Breaches Treated'])
+    assert np.isclose(year['Waiting List End'].sum(), single_year['Waiting List End'])
+
+
+def test_each_year_starts_from_the_previous_end():
+    cases, start = np.array([100.0, 250.0]), np.array([30.0, 80.0])
+    case_minutes = np.array([60.0, 150.0])
+    factors = np.cumprod([1.0, 1.05, 1.05, 1.05])
+    capacities = [30_000.0, 31_000.0, 32_000.0, 33_000.0]
+    years = projection.project_years(cases, case_minutes, start, factors, capacities)
+    assert np.allclose(years[0]['Waiting List Start'], start)
+    for previous, year in zip(years, years[1:]):
+        assert np.allclose(year['Waiting List Start'], previous['Waiting List End'])
+    for year, factor, year_capacity in zip(years, factors, capacities):
+        assert np.allclose(year['Additions'], cases * factor)
+        assert np.allclose(year['Waiting List End'], year['Waiting List Start'] + year['Additions'] - year['Treated'])
+        assert (year['Treated'] * case_minutes).sum() <= year_capacity + 1e-6
@@ -0,0 +1,47 @@
+import datetime
+
+import pytest
+
+from planning_core import readers
+
+
+def _csv(rows):
+    return '\n'.join(rows).encode()
+
+
+@pytest.mark.parametrize('header, missing', [
+    ('Procedure,Priority', 'Referral Date'),
+    ('Referral Date,Priority', 'Procedure'),
+    ('Referral,Proc', 'Referral Date, Procedure'),
+])
+def test_missing_columns_raise_value_error(header, missing):
+    with pytest.raises(ValueError, match=f"Missing required column\\(s\\): {missing}\\."):
+        readers.summarise_waiting_list(_csv([header, 'a,b']), datetime.date(2026, 10, 1), '%Y-%m-%d')
+
+
+def test_empty_extract_raises_value_error():
+    with pytest.raises(ValueError, match='no rows'):
+        readers.summarise_waiting_list(_csv(['Referral Date,Procedure']), datetime.date(2026, 10, 1), '%Y-%m-%d')
+
+
+def test_counts_by_priority_procedure_and_weeks_waited():
+    extract = _csv([
+        'Referral Date,Procedure,Priority,NHS Number',
+        '2026-09-30,Hip,P2,1',
+        '2026-09-24,Hip,P2,2',
+        '2026-09-17,Knee,P3,3',
+        'not a date,Knee,P3,4',
+        '2020-01-01,Knee,P4,5',
+    ])
+    # A chunk size of two splits the extract across chunks, which must add up the same
+    counts, skipped = readers.summarise_waiting_list(extract, datetime.date(2026, 10, 1), '%Y-%m-%d', chunksize=2)
+    assert skipped == 1
+    rows = {tuple(row[:3]): row[3] for row in counts.itertuples(index=False)}
+    assert rows == {('P2', 'Hip', 0): 1, ('P2', 'Hip', 1): 1, ('P3', 'Knee', 2): 1, ('P4', 'Knee', readers.MAX_WEEKS_WAITED): 1}
+
+
+def test_priority_column_is_optional():
+    counts, _ = readers.summarise_waiting_list(
+        _csv(['Referral Date,Procedure', '2026-09-01,Hip', '2026-09-01,Hip']), datetime.date(2026, 10, 1), '%Y-%m-%d'
+    )
+    assert counts.to_dict('records') == [{'Priority': 'All', 'Procedure': 'Hip', 'Weeks Waited': 4, 'Patients': 2}]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from planning_core import replication, simulation
+
+CASES = np.array([164, 196, 76, 28], dtype=float)
+HOURS = np.array([18.9, 65.5, 225.2, 283.0]) / 60
+CAPACITY_MINUTES = 188 * 78.3
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with replication.default_executor(workers=2) as pool:
+        yield pool
+
+
+def test_seeded_replications_match_simulate_cases(executor):
+    with replication.simulate_replications(CASES, HOURS, CAPACITY_MINUTES, 12, seed=7, executor=executor,
+                                           outputs=('cases_treated', 'minutes_treated', 'procedure_counts', 'codes')) as result:
+        for r in range(12):
+            case_rows, durations, total_minutes = simulation.simulate_cases(
+                CASES, HOURS, CAPACITY_MINUTES, replication._replication_seed(7, r)
+            )
+            assert result.cases_treated[r] == len(case_rows)
+            assert result.minutes_treated[r] == pytest.approx(total_minutes)
+            np.testing.assert_array_equal(result.procedure_counts[r], np.bincount(case_rows, minlength=len(CASES)))
+            np.testing.assert_array_equal(result.codes[r, :len(case_rows)], case_rows)
+            np.testing.assert_allclose(result.durations(r, HOURS), durations)
+
+
+def test_summaries_only_by_default(executor):
+    with replication.simulate_replications(CASES, HOURS, CAPACITY_MINUTES, 5, executor=executor) as result:
+        assert set(result.shapes) == set(replication.SUMMARY_BUFFERS)
+        assert result.codes is None and result.procedure_counts is None
+        assert result.nbytes == 5 * (8 + 8)
+        with pytest.raises(ValueError):
+            result.durations(0, HOURS)
+    with pytest.raises(ValueError):
+        replication.simulate_replications(CASES, HOURS, CAPACITY_MINUTES, 5, executor=executor, outputs=('weeks',))
+
+
+def test_results_are_views_of_shared_memory(executor):
+    with replication.simulate_replications(CASES, HOURS, CAPACITY_MINUTES, 5, executor=executor) as result:
+        assert not result.cases_treated.flags.owndata
+        # Another attachment to the same blocks sees writes through this one: nothing was copied
+        attached = replication.SharedReplications(result.shapes, result.names)
+        try:
+            np.testing.assert_array_equal(attached.cases_treated, result.cases_treated)
+            attached.minutes_treated[0] = -1
+            assert result.minutes_treated[0] == -1
+        finally:
+            attached.close()
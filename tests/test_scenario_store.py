@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import scenario_store
+
+
+def _scenario(name, results, parameters=None):
+    return scenario_store.make_scenario(name, parameters or {}, results, 'abc')
+
+
+def test_workspaces_keep_scenarios_apart(tmp_path):
+    north = scenario_store.workspace_directory('North Team', str(tmp_path))
+    south = scenario_store.workspace_directory('South Team', str(tmp_path))
+    scenario_store.save_scenario(_scenario('Plan A', {'Treated': 1.0}), north)
+    scenario_store.save_scenario(_scenario('Plan A', {'Treated': 2.0}), south)
+    assert scenario_store.load_scenarios(north)['Plan A']['results'] == {'Treated': 1.0}
+    assert scenario_store.load_scenarios(south)['Plan A']['results'] == {'Treated': 2.0}
+
+
+def test_saving_an_existing_name_needs_overwrite(tmp_path):
+    directory = str(tmp_path)
+    scenario_store.save_scenario(_scenario('Plan A', {'Treated': 1.0}), directory)
+    with pytest.raises(ValueError, match='already saved'):
+        scenario_store.save_scenario(_scenario('Plan A', {'Treated': 2.0}), directory)
+    assert scenario_store.load_scenarios(directory)['Plan A']['results'] == {'Treated': 1.0}
+    scenario_store.save_scenario(_scenario('Plan A', {'Treated': 2.0}), directory, overwrite=True)
+    assert scenario_store.load_scenarios(directory)['Plan A']['results'] == {'Treated': 2.0}
+    assert sorted(p.name for p in tmp_path.iterdir()) == [scenario_store._file_name('Plan A')]
+
+
+def test_scenarios_with_different_horizons_compare_row_for_row():
+    # One saved before the result names were normalised, one after
+    old = {'name': 'Old', 'data': 'abc', 'parameters': {}, 'results': {'Waiting List after 5 Years': 900.0, 'P1 Breaching after 52 Weeks': 3.0}}
+    new = _scenario('New', {'Waiting List after 10 Years': 700.0, 'P1 Breaching after 26 Weeks': 1.0})
+    table = scenario_store.compare_results([old, new])
+    assert list(table.index) == ['Waiting List at End of Projection', 'P1 Breaching at End of Priority Model']
+    assert np.allclose(table['New vs Old'], [-200.0, -2.0])
@@ -0,0 +1,59 @@
+import gc
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+
+import session_memory
+
+
+@pytest.fixture(autouse=True)
+def clean_session_state():
+    st.session_state.clear()
+    yield
+    st.session_state.clear()
+    gc.collect()
+
+
+def _frame(rows=50_000):
+    return pd.DataFrame({'Procedure': [f'P{i}' for i in range(rows)], 'Cases': np.arange(rows, dtype=float)})
+
+
+def test_over_budget_frames_spill_and_load_back(monkeypatch):
+    monkeypatch.setenv(session_memory.MEMORY_BUDGET_ENV_VAR, '0')
+    frame = _frame()
+    session_memory.put_frame('upload', frame, token='a')
+    assert isinstance(st.session_state['upload'], session_memory.SpilledFrame)
+    pd.testing.assert_frame_equal(session_memory.get_frame('upload', token='a'), frame)
+
+
+def test_spill_files_are_deleted_when_replaced_or_dropped(monkeypatch):
+    monkeypatch.setenv(session_memory.MEMORY_BUDGET_ENV_VAR, '0')
+    session_memory.put_frame('upload', _frame(), token='a')
+    first = st.session_state['upload'].path
+    session_memory.put_frame('upload', _frame(), token='b')
+    assert not os.path.exists(first)
+
+    # A different token drops the stale frame straight away
+    second = st.session_state['upload'].path
+    assert session_memory.get_frame('upload', token='c') is None
+    assert 'upload' not in st.session_state and not os.path.exists(second)
+
+    # An ended session's state is dropped with it
+    session_memory.put_frame('upload', _frame(), token='d')
+    third = st.session_state['upload'].path
+    st.session_state.clear()
+    gc.collect()
+    assert not os.path.exists(third)
+    assert session_memory.spilled_disk_bytes() == 0
+
+
+def test_spill_budget_keeps_frames_in_memory_when_full(monkeypatch):
+    monkeypatch.setenv(session_memory.MEMORY_BUDGET_ENV_VAR, '0')
+    monkeypatch.setenv(session_memory.SPILL_BUDGET_ENV_VAR, '0')
+    frame = _frame()
+    session_memory.put_frame('upload', frame, token='a')
+    assert st.session_state['upload'] is frame
+    assert session_memory.spilled_disk_bytes() == 0
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from planning_core import validation
+
+
+def _validate(csv):
+    return validation.read_and_validate_procedures(csv.encode())
+
+
+def test_missing_required_column_raises_value_error():
+    with pytest.raises(ValueError, match=r"Missing required column\(s\): Average Duration \(Hours\)\. Found: Procedure, Annual Demand \(Cases\)\."):
+        _validate("Procedure,Annual Demand (Cases)\nHip,10\n")
+
+
+def test_duplicate_columns_raise_value_error():
+    with pytest.raises(ValueError, match='Duplicate column'):
+        _validate("Procedure,Annual Demand (Cases),Average Duration (Hours),procedure\nHip,10,1,Knee\n")
+
+
+def test_headers_match_ignoring_case_and_spacing():
+    clean, issues, _ = _validate(" procedure ,ANNUAL DEMAND (CASES),average duration (hours)\nHip,10,1.5\n")
+    assert clean.to_dict('records') == [{'Procedure': 'Hip', 'Annual Demand (Cases)': 10, 'Average Duration (Hours)': 1.5}]
+    assert issues.empty
+
+
+def test_bad_rows_are_reported_by_file_line_and_dropped():
+    clean, issues, summary = _validate(
+        "Procedure,Annual Demand (Cases),Average Duration (Hours)\n"
+        "Hip,10,1.5\n"
+        ",5,1\n"
+        "Knee,lots,1\n"
+        "Knee,20,\n"
+        "Cataract,-3,0.5\n"
+        "Cataract,4,inf\n"
+    )
+    assert issues[['Row', 'Column', 'Problem']].to_records(index=False).tolist() == [
+        (3, 'Procedure', 'Missing procedure name'),
+        (4, 'Annual Demand (Cases)', 'Not a number'),
+        (5, 'Average Duration (Hours)', 'Missing value'),
+        (6, 'Annual Demand (Cases)', 'Negative or infinite'),
+        (7, 'Average Duration (Hours)', 'Negative or infinite'),
+    ]
+    assert issues.loc[1, 'Value'] == 'lots'
+    assert clean['Procedure'].tolist() == ['Hip']
+    assert summary == {'Rows Read': 6, 'Rows Dropped': 5, 'Duplicate Rows Merged': 0, 'Procedures': 1}
+
+
+def test_duplicates_merge_ignoring_case_and_spacing():
+    clean, _, summary = _validate(
+        "Procedure,Annual Demand (Cases),Average Duration (Hours)\n"
+        "Hip,10,1\n"
+        " Hip,20,2\n"
+        "hip ,30,3\n"
+        "HIP  Replacement,5,2\n"
+        "hip replacement,0,4\n"
+        "Knee,0,1\n"
+        "knee,0,3\n"
+    )
+    assert clean['Procedure'].tolist() == ['Hip', 'HIP Replacement', 'Knee']
+    assert clean['Annual Demand (Cases)'].tolist() == [60, 5, 0]
+    # Durations are case-weighted; with no cases at all, the plain mean
+    assert np.allclose(clean['Average Duration (Hours)'], [(10 * 1 + 20 * 2 + 30 * 3) / 60, 2.0, 2.0])
+    assert summary['Duplicate Rows Merged'] == 4
+
+
+def test_duplicates_merge_within_site_and_specialty():
+    clean, _, _ = _validate(
+        "Procedure,Annual Demand (Cases),Average Duration (Hours),Site,Specialty\n"
+        "Hip,10,1,North,Ortho\n"
+        "hip,5,1,north ,ortho\n"
+        "Hip,7,1,South,Ortho\n"
+        "Hip,3,1,,Ortho\n"
+    )
+    assert clean[['Site', 'Specialty', 'Annual Demand (Cases)']].to_records(index=False).tolist() == [
+        ('North', 'Ortho', 15), ('South', 'Ortho', 7), ('Unknown', 'Ortho', 3),
+    ]
+
+
+def test_text_typed_numbers_match_numeric_columns():
+    rng = np.random.default_rng(0)
+    raw = pd.DataFrame({
+        'Procedure': rng.choice(['Hip', 'Knee', 'Cataract'], 1000),
+        'Annual Demand (Cases)': rng.integers(0, 50, 1000),
+        'Average Duration (Hours)': rng.uniform(0.5, 3, 1000).round(2),
+    })
+    as_text = raw.astype({'Annual Demand (Cases)': str, 'Average Duration (Hours)': str})
+    as_text.loc[0, 'Annual Demand (Cases)'] = 'n/k'
+    clean, issues, _ = validation.validate_procedures(as_text)
+    expected, _, _ = validation.validate_procedures(raw.drop(index=0))
+    assert issues[['Row', 'Problem']].to_records(index=False).tolist() == [(2, 'Not a number')]
+    pd.testing.assert_frame_equal(clean, expected)